@@ -1,22 +1,242 @@
+from pathlib import Path
+
 from manifest_loader import ManifestLoader
 from dispatcher import Dispatcher
 from reasoner import Reasoner
 from state_manager import StateManager
+from control.mode_engine import ModeEngine
+from utils.logging_utils import log
+from utils.metrics import traced
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
 
 
 class OynaAIAgent:
     """Øyna AI Agent – sentral orkestrator."""
 
     def __init__(self, manifest_path="../models/v2/ai_master_manifest_v2.json"):
+        self.manifest_path = manifest_path
         self.manifest = ManifestLoader(manifest_path).load()
-        self.dispatcher = Dispatcher(self.manifest)
+        self.modes = self._build_mode_engine(self._load_model("master_system_model"))
+        self.dispatcher = Dispatcher(self.manifest, guard=self.modes)
         self.reasoner = Reasoner(self.manifest)
         self.state = StateManager()
+        self._cycles = None
+        self._leak = None
+        self._cycle_history = None
+        self._entities = None
+        self._knowledge = None
+        self._alerts = None
+        self._prompts = None
+        self._shared = None
+        self.models = None
 
-    def ask(self, query: str):
-        plan = self.reasoner.plan(query)
+    def _load_model(self, key):
+        entry = self.manifest.get("models", {}).get(key)
+        if not entry:
+            return {}
+        return ManifestLoader(PROJECT_ROOT / entry["path"]).load()
+
+    @staticmethod
+    def _build_mode_engine(master):
+        # Uten driftsmoduser finnes ingen vakt; dispatcheren blokkerer da all styring.
+        if not master.get("operational_modes"):
+            return None
+        return ModeEngine.from_master_model(master)
+
+    # Analysemotorene drar inn NumPy; de bygges først når de brukes.
+    @property
+    def cycles(self):
+        """Inkrementell syklusdeteksjon; ferdige sykluser lagres i cycle_history."""
+        if self._cycles is None:
+            from analytics.cycles import CycleDetector
+            self._cycles = CycleDetector(on_cycle=self._store_cycle)
+        return self._cycles
+
+    def _store_cycle(self, record):
+        # Lagringsfeil skal ikke stoppe deteksjonen; syklusen kan fylles inn med backfill.
+        try:
+            self.cycle_history.append_records([record])
+        except OSError as e:
+            log("Could not store pump cycle", pump=record.pump_id, start_ts=record.start_ts, error=str(e))
+
+    @property
+    def leak(self):
+        if self._leak is None:
+            from analytics.leak import LeakEngine
+            self._leak = LeakEngine()
+        return self._leak
+
+    @property
+    def cycle_history(self):
+        """Kolonnebasert syklushistorikk i .cache/cycles (se analytics/cycle_store.py)."""
+        if self._cycle_history is None:
+            from analytics.cycle_store import CycleStore
+            self._cycle_history = CycleStore()
+        return self._cycle_history
+
+    @property
+    def entities(self):
+        """Entitetsindeks på tvers av modellene (bygges fra .cache ved første bruk)."""
+        if self.models is not None:
+            return self.models.snapshot.index("entity_index")
+        if self._entities is None:
+            from knowledge.entity_index import EntityIndex
+            self._entities = EntityIndex.load(self.manifest)
+        return self._entities
+
+    @property
+    def alerts(self):
+        """Korrelert alarmsett bak events.get_alerts."""
+        if self._alerts is None:
+            from events.alerts import AlertPipeline
+            self._alerts = AlertPipeline.from_master_model(self._load_model("master_system_model"))
+        return self._alerts
+
+    @property
+    def knowledge(self):
+        """SQLite-indeks over knowledge/*.json (bygges på nytt hvis kildene er endret)."""
+        if self._knowledge is None:
+            from knowledge.store import KnowledgeStore
+            self._knowledge = KnowledgeStore.open()
+        return self._knowledge
+
+    @property
+    def prompts(self):
+        """Promptbygger med stabile prefikser per målgruppe (følger hot reload)."""
+        if self._prompts is None:
+            from prompt_builder import PromptBuilder
+
+            def load_model(key):
+                if self.models is not None:
+                    return self.models.snapshot.models.get(key, {})
+                return self._load_model(key)
+
+            self._prompts = PromptBuilder(
+                self.manifest,
+                load_model=load_model,
+                model_version=lambda: self.models.snapshot.version if self.models is not None else 0,
+            )
+        return self._prompts
+
+    def attach_shared_image(self, path=None):
+        """Mapper inn et delt modellbilde (se shared_image.py og worker_pool.py)."""
+        from shared_image import open_image
+        self._shared = open_image(path)
+        return self._shared
+
+    @property
+    def shared(self):
+        """Delt modellbilde; bygges i .cache ved første bruk hvis det mangler eller er utdatert."""
+        if self._shared is None:
+            from shared_image import ensure_image
+            self.attach_shared_image(ensure_image(self.manifest_path))
+        return self._shared
+
+    def _refresh_shared(self, snapshot):
+        # Etter hot reload: bygg bildet fra det nye øyeblikksbildet (med mindre en annen
+        # prosess allerede har gjort det) og map det inn på nytt.
+        from shared_image import build_image, is_stale
+        path = self._shared.path
+        if is_stale(path, self.manifest_path):
+            build_image(snapshot.models, snapshot.derived["retrieval_chunks"], path)
+        self.attach_shared_image(path)
+
+    def retrieve(self, text: str, k: int = 5):
+        """Nærmeste modellutdrag for en tekst (vektorsøk i det delte bildet)."""
+        return self.shared.search(text, k)
+
+    def update_health(self, health):
+        """Mater moduslogikken med et events.get_system_health-svar (pluss bryterstillinger).
+
+        Den som eier integrasjonen mot HA/Node-RED (helse-webhook eller en
+        poller mot /ai/events/system_health) må kalle denne ved hver endring;
+        uten helsedata står agenten i legacy-modus og all styring blokkeres.
+        """
+        if self.modes is None:
+            return None
+        return self.modes.update_health(health)
+
+    def enable_hot_reload(self, interval: float = 1.0):
+        """Overvåker manifest og modeller og bytter inn nye versjoner uten restart."""
+        if self.models is None:
+            from model_store import ModelStore
+            self.models = ModelStore(self.manifest_path)
+            self.models.subscribe(self._on_models_reloaded)
+            self._on_models_reloaded(self.models.snapshot, None)
+        self.models.start_watcher(interval)
+        return self.models
+
+    def _on_models_reloaded(self, snapshot, result):
+        if snapshot.manifest is not self.manifest:
+            self.manifest = snapshot.manifest
+            self.dispatcher.set_manifest(snapshot.manifest)
+            self.reasoner.manifest = snapshot.manifest
+        if result is not None and "master_system_model" in result.changed:
+            modes = self._build_mode_engine(snapshot.models.get("master_system_model", {}))
+            if modes is not None and self.modes is not None:
+                modes.update(**self.modes.signals)
+            self.modes = modes
+            self.dispatcher.guard = modes
+        if result is not None and self._shared is not None and "retrieval_chunks" in result.rebuilt:
+            self._refresh_shared(snapshot)
+
+    @staticmethod
+    def _request(query, validate: bool = True):
+        """Forespørsel etter contracts/api_contract.json; et rent spørsmål pakkes inn."""
+        if isinstance(query, dict):
+            request = query
+        else:
+            request = {"intent": "user_query", "user_query": query, "context_modules": []}
+        if validate:
+            from utils.schema_utils import get_registry
+            get_registry().validate_request(request)
+        return request
+
+    @traced("agent.ask")
+    def ask(self, query, validate: bool = True):
+        """Svar på et spørsmål (tekst eller kontraktsforespørsel)."""
+        request = self._request(query, validate)
+        plan = self.reasoner.plan(request.get("user_query") or request["intent"])
         return self.dispatcher.execute_plan(plan)
 
+    def ask_stream(self, query, audience=None, responder=None, validate: bool = True):
+        """Som ask(), men gir strukturerte hendelser etter hvert som de er klare (se streaming.py)."""
+        from streaming import TEXT_FIELDS, event, response_status, summarize_results
+
+        request = self._request(query, validate)
+        query = request.get("user_query") or request["intent"]
+        if audience is None:
+            audience = request.get("settings", {}).get("audience", "admin")
+        plan = self.reasoner.plan(query)
+        yield event("plan", {"steps": plan})
+
+        results = []
+        for index, (step, result) in enumerate(self.dispatcher.iter_plan(plan)):
+            results.append(result)
+            yield event("tool_result", {"index": index, "tool": step["tool"], "action": step["action"], "result": result})
+
+        # LLM-baserte respondere får ferdig prompt; standard-responderen trenger den ikke.
+        prompt = None
+        if responder is not None:
+            prompt = self.prompts.build(audience, query, tool_results=results)
+        texts = {field: [] for field in TEXT_FIELDS}
+        for field, chunk in (responder or summarize_results)(query, audience, plan, results, prompt):
+            if field not in texts:
+                raise ValueError(f"Responder yielded unknown field: {field}")
+            texts[field].append(chunk)
+            yield event(field, {"delta": chunk})
+
+        response = {"status": response_status(results), "summary": "".join(texts["summary"])}
+        for field in TEXT_FIELDS[1:]:
+            if texts[field]:
+                response[field] = "".join(texts[field])
+        if validate:
+            from utils.schema_utils import get_registry
+            get_registry().validate_response(response)
+        yield event("response", response)
+        yield event("done")
+
 
 if __name__ == "__main__":
     agent = OynaAIAgent()
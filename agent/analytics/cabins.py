@@ -0,0 +1,270 @@
+"""Forbruk per hytte med helligdags- og helgebevisste baselines.
+
+Kolonnebasert lagring: én matrise per metrikk, hytter × tidsbøtter
+(standard én bøtte per time). Alle beregninger går over alle hytter samtidig:
+
+    liters[cabin, bucket]             – forbruk per bøtte (float32)
+    day_type[day]                     – 0 hverdag, 1 helg, 2 helligdag/ferie
+
+Baseline er EWMA av middel og varians per (hytte, dagtype, time på døgnet).
+close_day() tar inn et helt døgn i én vektorisert oppdatering; scores()
+sammenligner forbruket så langt i et døgn med forventet forbruk for samme
+dagtype og tidspunkt – for alle hytter i én operasjon. Det betyr at "din
+hytte bruker mer enn vanlig for en helg" er én radoperasjon, og et
+varsel til alle eiere koster ett vektorisert pass.
+"""
+
+import datetime as _dt
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+WEEKDAY, WEEKEND, HOLIDAY = 0, 1, 2
+DAY_TYPES = ("weekday", "weekend", "holiday")
+
+# Nedre grense for standardavvik (liter per bøtte), så hytter med nesten
+# null forbruk ikke gir enorme z-verdier for en enkelt dusj.
+STD_FLOOR_LITERS = 5.0
+
+
+def _easter(year: int) -> _dt.date:
+    """Påskedag (gregoriansk, anonym algoritme)."""
+
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return _dt.date(year, month, day + 1)
+
+
+def norwegian_holidays(years: Iterable[int]) -> Set[int]:
+    """Offentlige fridager i Norge som dag-indekser (dager siden 1970-01-01)."""
+
+    epoch = _dt.date(1970, 1, 1).toordinal()
+    days = set()
+    for year in years:
+        easter = _easter(year)
+        fixed = [(1, 1), (5, 1), (5, 17), (12, 25), (12, 26)]
+        for month, day in fixed:
+            days.add(_dt.date(year, month, day).toordinal() - epoch)
+        # Skjærtorsdag, langfredag, påskedag, 2. påskedag, Kristi himmelfart, pinse.
+        for offset in (-3, -2, 0, 1, 39, 49, 50):
+            days.add((easter + _dt.timedelta(days=offset)).toordinal() - epoch)
+    return days
+
+
+def day_types(days: np.ndarray, holidays: Set[int]) -> np.ndarray:
+    """Dagtype for dag-indekser (1970-01-01 var en torsdag)."""
+
+    days = np.asarray(days, dtype=np.int64)
+    weekday = (days + 3) % 7  # 0 = mandag
+    types = np.where(weekday >= 5, WEEKEND, WEEKDAY).astype(np.int8)
+    if holidays:
+        types[np.isin(days, np.fromiter(holidays, dtype=np.int64))] = HOLIDAY
+    return types
+
+
+class CabinUsage:
+    """Forbruksmatrise og baselines for mange hytter."""
+
+    def __init__(
+        self,
+        cabin_ids: Sequence[str],
+        start_day: int,
+        bucket_s: int = 3600,
+        utc_offset_s: int = 0,
+        holidays: Optional[Set[int]] = None,
+        alpha: float = 0.1,
+        initial_days: int = 64,
+    ):
+        if SECONDS_PER_DAY % bucket_s:
+            raise ValueError("bucket_s must divide a day")
+        self.cabin_ids = list(cabin_ids)
+        self.index: Dict[str, int] = {cabin: i for i, cabin in enumerate(self.cabin_ids)}
+        self.start_day = int(start_day)
+        self.bucket_s = bucket_s
+        self.per_day = SECONDS_PER_DAY // bucket_s
+        self.utc_offset_s = utc_offset_s
+        self.alpha = alpha
+        if holidays is None:
+            year = _dt.date.fromordinal(_dt.date(1970, 1, 1).toordinal() + self.start_day).year
+            holidays = norwegian_holidays(range(year - 1, year + 3))
+        self.holidays = set(holidays)
+
+        n = len(self.cabin_ids)
+        self.liters = np.zeros((n, initial_days * self.per_day), dtype=np.float32)
+        self.days_stored = 0  # antall dager med data (høyeste dag + 1)
+
+        shape = (n, len(DAY_TYPES), self.per_day)
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.var = np.zeros(shape, dtype=np.float64)
+        self.samples = np.zeros((len(DAY_TYPES),), dtype=np.int64)  # antall lukkede dager per type
+        self.closed_until = self.start_day  # første dag som ikke er tatt inn i baseline
+
+    # -- inntak -----------------------------------------------------------
+
+    def _ensure_days(self, days: int) -> None:
+        capacity = self.liters.shape[1] // self.per_day
+        if days <= capacity:
+            return
+        new_capacity = max(days, capacity * 2)
+        grown = np.zeros((self.liters.shape[0], new_capacity * self.per_day), dtype=np.float32)
+        grown[:, :self.liters.shape[1]] = self.liters
+        self.liters = grown
+
+    def add_readings(self, cabins, ts, liters) -> int:
+        """Legger inn målinger (hytte-indeks eller -id, tidsstempel, liter) vektorisert.
+
+        Målinger før start_day forkastes. Returnerer antall som ble lagt inn.
+        """
+
+        cabins = np.asarray(cabins)
+        if cabins.dtype.kind in "US O":
+            cabins = np.fromiter((self.index[c] for c in cabins), dtype=np.int64, count=cabins.size)
+        cabins = cabins.astype(np.int64, copy=False)
+        local = np.asarray(ts, dtype=np.float64) + self.utc_offset_s
+        column = np.floor_divide(local - self.start_day * SECONDS_PER_DAY, self.bucket_s).astype(np.int64)
+        keep = column >= 0
+        column = column[keep]
+        if not column.size:
+            return 0
+        days = int(column.max()) // self.per_day + 1
+        self._ensure_days(days)
+        self.days_stored = max(self.days_stored, days)
+        np.add.at(self.liters, (cabins[keep], column), np.asarray(liters, dtype=np.float32)[keep])
+        return int(column.size)
+
+    def day_matrix(self, day: int) -> np.ndarray:
+        """hytter × bøtter for én dag (view; nuller for dager etter lagret data)."""
+
+        if day < self.start_day:
+            raise ValueError(f"day {day} is before start_day {self.start_day}")
+        col = (day - self.start_day) * self.per_day
+        if col + self.per_day > self.liters.shape[1]:
+            return np.zeros((self.liters.shape[0], self.per_day), dtype=np.float32)
+        return self.liters[:, col:col + self.per_day]
+
+    def day_type(self, day: int) -> int:
+        return int(day_types(np.array([day]), self.holidays)[0])
+
+    # -- baseline ---------------------------------------------------------
+
+    def close_day(self, day: int) -> None:
+        """Tar et ferdig døgn inn i baseline for sin dagtype (alle hytter samtidig).
+
+        Døgn mellom forrige lukkede døgn og `day` lukkes først, i rekkefølge.
+        Døgn etter lagret data avvises (de ville blitt tatt inn som nullforbruk).
+        """
+
+        if day < self.closed_until:
+            return
+        end = self.start_day + self.days_stored
+        if day >= end:
+            raise ValueError(f"day {day} has no stored data (stored until day {end - 1})")
+        while self.closed_until < day:
+            self._close(self.closed_until)
+        self._close(day)
+
+    def _close(self, day: int) -> None:
+        kind = self.day_type(day)
+        values = self.day_matrix(day).astype(np.float64)
+        mean = self.mean[:, kind, :]
+        var = self.var[:, kind, :]
+        if self.samples[kind] == 0:
+            mean[...] = values
+            var[...] = 0.0
+        else:
+            a = self.alpha
+            delta = values - mean
+            mean += a * delta
+            var[...] = (1.0 - a) * (var + a * delta * delta)
+        self.samples[kind] += 1
+        self.closed_until = day + 1
+
+    def close_days_until(self, day: int) -> int:
+        """Lukker alle hele døgn før `day`. Returnerer antall lukket."""
+
+        closed = 0
+        while self.closed_until < day and self.closed_until < self.start_day + self.days_stored:
+            self._close(self.closed_until)
+            closed += 1
+        return closed
+
+    def rebuild_baselines(self, until_day: Optional[int] = None) -> None:
+        """Regner baselines fra bunnen over lagret historikk."""
+
+        self.mean[...] = 0.0
+        self.var[...] = 0.0
+        self.samples[...] = 0
+        self.closed_until = self.start_day
+        end = self.start_day + self.days_stored if until_day is None else until_day
+        self.close_days_until(end)
+
+    # -- scoring ----------------------------------------------------------
+
+    def scores(self, day: int, upto_bucket: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Avvik for alle hytter for et døgn (så langt, til og med upto_bucket).
+
+        z_score sammenligner kumulativt forbruk med forventet kumulativt
+        forbruk for samme dagtype; ratio er forbruk / forventet.
+        """
+
+        kind = self.day_type(day)
+        end = self.per_day if upto_bucket is None else upto_bucket + 1
+        used = self.day_matrix(day)[:, :end].sum(axis=1, dtype=np.float64)
+        expected = self.mean[:, kind, :end].sum(axis=1)
+        # Bøttene antas uavhengige: variansen av summen er summen av variansene.
+        std = np.sqrt(self.var[:, kind, :end].sum(axis=1) + (STD_FLOOR_LITERS ** 2) * end)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(expected > 0, used / expected, np.nan)
+        z = (used - expected) / std
+        if self.samples[kind] == 0:
+            z[:] = 0.0
+        return {
+            "day_type": np.full(len(self.cabin_ids), kind, dtype=np.int8),
+            "used_liters": used,
+            "expected_liters": expected,
+            "ratio": ratio,
+            "z_score": z,
+        }
+
+    def anomalies(self, day: int, threshold: float = 3.0, upto_bucket: Optional[int] = None) -> List[Dict[str, object]]:
+        """Hytter over terskel, sortert etter z_score (ett pass over alle hytter)."""
+
+        result = self.scores(day, upto_bucket)
+        z = result["z_score"]
+        hits = np.flatnonzero(z > threshold)
+        hits = hits[np.argsort(-z[hits])]
+        kind = DAY_TYPES[int(result["day_type"][0])] if len(z) else DAY_TYPES[0]
+        return [
+            {
+                "cabin_id": self.cabin_ids[i],
+                "day_type": kind,
+                "used_liters": float(result["used_liters"][i]),
+                "expected_liters": float(result["expected_liters"][i]),
+                "z_score": float(z[i]),
+            }
+            for i in hits
+        ]
+
+    def cabin_summary(self, cabin_id: str, day: int) -> Dict[str, object]:
+        """"Din hytte" sammenlignet med egne tidligere dager av samme type."""
+
+        i = self.index[cabin_id]
+        kind = self.day_type(day)
+        used = float(self.day_matrix(day)[i].sum(dtype=np.float64))
+        expected = float(self.mean[i, kind].sum())
+        return {
+            "cabin_id": cabin_id,
+            "day_type": DAY_TYPES[kind],
+            "used_liters": used,
+            "typical_liters": expected,
+            "days_in_baseline": int(self.samples[kind]),
+        }
@@ -0,0 +1,295 @@
+"""Kolonnebasert syklushistorikk partisjonert per døgn.
+
+Pumpesykluser (fra CycleDetector eller detect_cycles) lagres som én
+.npy-fil per kolonne per døgn (UTC, etter start_ts):
+
+    .cache/cycles/<pump_id>/<YYYY-MM-DD>/start_ts.npy
+                                          end_ts.npy
+                                          runtime_s.npy
+                                          liters.npy
+                                          energy_wh.npy
+
+Filene åpnes med mmap. Hele historikken holdes som sammenhengende
+float64-kolonner per prosess og bygges på nytt bare når generasjonsfilen
+er endret (hver skriving teller den opp); uendrede partisjoner gjenbrukes.
+Tidsrom velges med binærsøk på start_ts, og spørringene er ett vektorisert
+pass over et slice:
+
+    window_aggregates – count/sum/mean/min/max per tidsbøtte
+    percentiles       – persentiler for en kolonne i et tidsrom
+    trend             – lineær regresjon mot tid (endring per døgn, r²)
+    energy_per_liter  – Wh per liter totalt eller per bøtte
+    compare_to_last   – siste syklus mot de n foregående
+
+Kolonner kan også være avledede: wh_per_liter og liters_per_minute.
+"""
+
+import datetime as _dt
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from analytics.cycles import DEFAULT_PUMP_ID, SECONDS_PER_DAY, CycleRecord, compare_to_recent
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_ROOT = PROJECT_ROOT / ".cache" / "cycles"
+
+COLUMNS = ("start_ts", "end_ts", "runtime_s", "liters", "energy_wh")
+DERIVED = ("wh_per_liter", "liters_per_minute")
+# Telles opp ved hver skriving, så lesere (også i andre prosesser) ser endringer med ett oppslag.
+GENERATION_FILE = "_generation"
+
+
+def _day_name(day: int) -> str:
+    return (_dt.date(1970, 1, 1) + _dt.timedelta(days=int(day))).isoformat()
+
+
+def _derive(columns: Dict[str, np.ndarray], name: str) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if name == "wh_per_liter":
+            return np.where(columns["liters"] > 0, columns["energy_wh"] / columns["liters"], np.nan)
+        if name == "liters_per_minute":
+            return np.where(columns["runtime_s"] > 0, columns["liters"] * 60.0 / columns["runtime_s"], np.nan)
+    raise KeyError(f"Unknown cycle column: {name}")
+
+
+class CycleStore:
+    """Syklushistorikk for én pumpe."""
+
+    def __init__(self, root=DEFAULT_ROOT, pump_id: str = DEFAULT_PUMP_ID):
+        self.pump_id = pump_id
+        self.path = Path(root) / pump_id
+        self._partitions: Dict[str, Tuple[int, Dict[str, np.ndarray]]] = {}
+        self._history: Optional[Tuple[int, Dict[str, np.ndarray]]] = None
+
+    # -- skriving -----------------------------------------------------------
+
+    def append(self, cycles: Dict[str, Sequence[float]]) -> int:
+        """Legger til sykluser (kolonner som fra detect_cycles).
+
+        Sykluser med samme start_ts som en lagret syklus erstatter den, så
+        en backfill kan kjøres flere ganger. Returnerer antall nye rader.
+        """
+
+        new = {name: np.asarray(cycles[name], dtype=np.float64) for name in COLUMNS}
+        if not new["start_ts"].size:
+            return 0
+        days = np.floor_divide(new["start_ts"], SECONDS_PER_DAY).astype(np.int64)
+        added = 0
+        for day in np.unique(days):
+            mask = days == day
+            added += self._merge_partition(_day_name(day), {name: col[mask] for name, col in new.items()})
+        self._bump_generation()
+        return added
+
+    def append_records(self, records: Iterable[CycleRecord]) -> int:
+        records = [r for r in records if r.pump_id == self.pump_id]
+        return self.append({name: [getattr(r, name) for r in records] for name in COLUMNS})
+
+    def _merge_partition(self, name: str, new: Dict[str, np.ndarray]) -> int:
+        old = self._load(name)
+        before = len(old["start_ts"]) if old else 0
+        if old:
+            merged = {col: np.concatenate((new[col], old[col])) for col in COLUMNS}
+        else:
+            merged = new
+        # np.unique beholder første forekomst: nye rader vinner over lagrede.
+        _, keep = np.unique(merged["start_ts"], return_index=True)
+        merged = {col: values[keep] for col, values in merged.items()}
+
+        target = self.path / name
+        tmp = self.path / f".{name}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for col in COLUMNS:
+            np.save(tmp / f"{col}.npy", np.ascontiguousarray(merged[col]))
+        # Katalogbytte: lesere ser enten gammel eller ny partisjon (eller ingen et øyeblikk).
+        if target.exists():
+            retired = self.path / f".{name}.old"
+            shutil.rmtree(retired, ignore_errors=True)
+            target.rename(retired)
+            tmp.rename(target)
+            shutil.rmtree(retired, ignore_errors=True)
+        else:
+            tmp.rename(target)
+        self._partitions.pop(name, None)
+        return len(merged["start_ts"]) - before
+
+    # -- lesing -------------------------------------------------------------
+
+    def days(self) -> List[str]:
+        if not self.path.exists():
+            return []
+        return sorted(entry.name for entry in os.scandir(self.path) if entry.is_dir() and not entry.name.startswith("."))
+
+    def _generation(self) -> int:
+        try:
+            return int((self.path / GENERATION_FILE).read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _bump_generation(self) -> None:
+        tmp = self.path / f".{GENERATION_FILE}.tmp"
+        tmp.write_text(str(self._generation() + 1))
+        tmp.replace(self.path / GENERATION_FILE)
+
+    def _load(self, name: str) -> Optional[Dict[str, np.ndarray]]:
+        directory = self.path / name
+        try:
+            mtime = directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._partitions.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        columns = {col: np.load(directory / f"{col}.npy", mmap_mode="r") for col in COLUMNS}
+        self._partitions[name] = (mtime, columns)
+        return columns
+
+    def _all(self) -> Dict[str, np.ndarray]:
+        """Hele historikken som sammenhengende kolonner (bygges på nytt når generasjonen endres)."""
+
+        generation = self._generation()
+        if self._history is not None and self._history[0] == generation:
+            return self._history[1]
+        parts = [p for p in (self._load(name) for name in self.days()) if p]
+        history = {
+            col: np.concatenate([p[col] for p in parts]) if parts else np.empty(0)
+            for col in COLUMNS
+        }
+        self._history = (generation, history)
+        return history
+
+    def scan(
+        self,
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+        columns: Sequence[str] = COLUMNS,
+    ) -> Dict[str, np.ndarray]:
+        """Kolonner for sykluser med start_ts i [start_ts, end_ts), sortert på tid.
+
+        Lagrede kolonner returneres som views (ingen kopi).
+        """
+
+        history = self._all()
+        t = history["start_ts"]
+        lo = 0 if start_ts is None else int(np.searchsorted(t, start_ts, side="left"))
+        hi = len(t) if end_ts is None else int(np.searchsorted(t, end_ts, side="left"))
+        return self._select(history, slice(lo, max(lo, hi)), columns)
+
+    def last(self, n: int, columns: Sequence[str] = COLUMNS) -> Dict[str, np.ndarray]:
+        """De n siste syklusene."""
+
+        history = self._all()
+        return self._select(history, slice(max(len(history["start_ts"]) - n, 0), None), columns)
+
+    @staticmethod
+    def _select(history: Dict[str, np.ndarray], rows: slice, columns: Sequence[str]) -> Dict[str, np.ndarray]:
+        base = {col: values[rows] for col, values in history.items()}
+        return {col: base[col] if col in base else _derive(base, col) for col in columns}
+
+    # -- spørringer ---------------------------------------------------------
+
+    def window_aggregates(
+        self,
+        columns: Sequence[str] = ("runtime_s", "liters", "energy_wh"),
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+        bucket_s: float = SECONDS_PER_DAY,
+    ) -> Dict[str, np.ndarray]:
+        """count/sum/mean/min/max per bøtte (bøtter uten sykluser tas ikke med).
+
+        Returnerer bucket_start og count, og <kolonne>_<stat> for hver kolonne.
+        """
+
+        data = self.scan(start_ts, end_ts, ("start_ts",) + tuple(columns))
+        buckets = np.floor_divide(data["start_ts"], bucket_s).astype(np.int64)
+        keys, first, inverse, counts = np.unique(buckets, return_index=True, return_inverse=True, return_counts=True)
+        result: Dict[str, np.ndarray] = {"bucket_start": keys * bucket_s, "count": counts}
+        for col in columns:
+            values = np.asarray(data[col], dtype=np.float64)
+            valid = ~np.isnan(values)
+            sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=len(keys))
+            n = np.bincount(inverse, weights=valid, minlength=len(keys))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                result[f"{col}_sum"] = sums
+                result[f"{col}_mean"] = np.where(n > 0, sums / n, np.nan)
+            if len(keys):
+                # Dataene er sortert på tid, så bøttene er sammenhengende segmenter.
+                result[f"{col}_min"] = np.fmin.reduceat(values, first)
+                result[f"{col}_max"] = np.fmax.reduceat(values, first)
+            else:
+                result[f"{col}_min"] = result[f"{col}_max"] = np.empty(0)
+        return result
+
+    def percentiles(
+        self,
+        column: str,
+        q: Sequence[float] = (10, 50, 90),
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+    ) -> Dict[str, float]:
+        values = self.scan(start_ts, end_ts, (column,))[column]
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return {}
+        return {f"p{p:g}": float(v) for p, v in zip(q, np.percentile(values, q))}
+
+    def trend(
+        self,
+        column: str = "runtime_s",
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+    ) -> Dict[str, float]:
+        """Minste kvadraters linje for kolonnen mot tid.
+
+        slope_per_day er endring i kolonnens enhet per døgn.
+        """
+
+        data = self.scan(start_ts, end_ts, ("start_ts", column))
+        y = np.asarray(data[column], dtype=np.float64)
+        valid = ~np.isnan(y)
+        x = data["start_ts"][valid] / SECONDS_PER_DAY
+        y = y[valid]
+        if y.size < 2:
+            return {"n": int(y.size)}
+        x_mean, y_mean = x.mean(), y.mean()
+        dx, dy = x - x_mean, y - y_mean
+        sxx, syy = float(dx @ dx), float(dy @ dy)
+        if sxx == 0:
+            return {"n": int(y.size)}
+        slope = float(dx @ dy) / sxx
+        r2 = (slope * slope * sxx / syy) if syy > 0 else 1.0
+        return {
+            "n": int(y.size),
+            "slope_per_day": slope,
+            "intercept": float(y_mean - slope * x_mean),
+            "r2": float(r2),
+            "start_value": float(y_mean + slope * (x[0] - x_mean)),
+            "end_value": float(y_mean + slope * (x[-1] - x_mean)),
+        }
+
+    def energy_per_liter(
+        self,
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+        bucket_s: Optional[float] = None,
+    ):
+        """Wh per liter (sum energi / sum liter), totalt eller per bøtte."""
+
+        if bucket_s is None:
+            data = self.scan(start_ts, end_ts, ("liters", "energy_wh"))
+            liters = float(data["liters"].sum())
+            return float(data["energy_wh"].sum()) / liters if liters > 0 else None
+        agg = self.window_aggregates(("liters", "energy_wh"), start_ts, end_ts, bucket_s)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(agg["liters_sum"] > 0, agg["energy_wh_sum"] / agg["liters_sum"], np.nan)
+        return {"bucket_start": agg["bucket_start"], "wh_per_liter": ratio}
+
+    def compare_to_last(self, n: int = 50) -> Dict[str, Dict[str, float]]:
+        """Siste syklus mot de n foregående (som cycles.compare_to_recent)."""
+
+        return compare_to_recent(self.last(n + 1), n)
@@ -0,0 +1,235 @@
+"""Pumpesyklus-deteksjon (Python-utgave av Node-RED flow_pump_cycle_detection).
+
+Inndata (master system model):
+    binary_sensor.pressure_pump_running
+    sensor.pressure_pump_active_power
+    sensor.waterflow_total_liters   (for liter per syklus)
+
+To moduser med identisk semantikk:
+  * CycleDetector   – inkrementell strøm, O(1) tilstand per pumpe.
+  * detect_cycles() – vektorisert batch over NumPy-arrays (backfill av historikk).
+
+Ferdige sykluser fra CycleDetector gis til `on_cycle` (agenten lagrer dem i
+CycleStore); historikk fylles inn med tools/backfill_cycles.py.
+
+En syklus starter på første sample der pumpen går og slutter på første
+sample der den har stoppet. runtime = t_slutt - t_start, liter = differansen
+i telleverk mellom de to samplene, energi = trapesintegral av effekten.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_PUMP_ID = "pump_p2"
+DEFAULT_POWER_THRESHOLD_W = 50.0
+SECONDS_PER_DAY = 86400
+
+
+@dataclass(frozen=True)
+class CycleRecord:
+    pump_id: str
+    start_ts: float
+    end_ts: float
+    runtime_s: float
+    liters: float
+    energy_wh: float
+
+
+class _PumpState:
+    __slots__ = (
+        "running", "start_ts", "start_liters", "energy_ws",
+        "last_ts", "last_power", "last_liters",
+        "day", "cycles_today", "recent",
+    )
+
+    def __init__(self, history: int):
+        self.running = False
+        self.start_ts = 0.0
+        self.start_liters = 0.0
+        self.energy_ws = 0.0
+        self.last_ts: Optional[float] = None
+        self.last_power = 0.0
+        self.last_liters: Optional[float] = None
+        self.day: Optional[int] = None
+        self.cycles_today = 0
+        self.recent: Deque[CycleRecord] = deque(maxlen=history)
+
+
+class CycleDetector:
+    """Inkrementell syklusdeteksjon for én eller flere pumper."""
+
+    def __init__(
+        self,
+        power_threshold_w: float = DEFAULT_POWER_THRESHOLD_W,
+        history: int = 50,
+        utc_offset_s: int = 0,
+        on_cycle: Optional[Callable[[CycleRecord], None]] = None,
+    ):
+        self.power_threshold_w = power_threshold_w
+        self.history = history
+        self.utc_offset_s = utc_offset_s
+        self.on_cycle = on_cycle
+        self._pumps: Dict[str, _PumpState] = {}
+
+    def _state(self, pump_id: str) -> _PumpState:
+        state = self._pumps.get(pump_id)
+        if state is None:
+            state = self._pumps[pump_id] = _PumpState(self.history)
+        return state
+
+    def update(
+        self,
+        ts: float,
+        running: Optional[bool] = None,
+        active_power: Optional[float] = None,
+        total_liters: Optional[float] = None,
+        pump_id: str = DEFAULT_PUMP_ID,
+    ) -> Optional[CycleRecord]:
+        """Mater inn ett sample. Returnerer CycleRecord når en syklus avsluttes."""
+
+        ts = float(ts)
+        state = self._state(pump_id)
+        power = state.last_power if active_power is None else float(active_power)
+        if running is None:
+            running = power >= self.power_threshold_w
+        liters = state.last_liters if total_liters is None else float(total_liters)
+
+        # Energi integreres kun innenfor en pågående syklus.
+        if state.running and state.last_ts is not None:
+            state.energy_ws += 0.5 * (state.last_power + power) * (ts - state.last_ts)
+
+        record = None
+        if running and not state.running:
+            state.running = True
+            state.start_ts = ts
+            state.start_liters = liters if liters is not None else 0.0
+            state.energy_ws = 0.0
+        elif not running and state.running:
+            state.running = False
+            record = CycleRecord(
+                pump_id=pump_id,
+                start_ts=state.start_ts,
+                end_ts=ts,
+                runtime_s=ts - state.start_ts,
+                liters=(liters - state.start_liters) if liters is not None else 0.0,
+                energy_wh=state.energy_ws / 3600.0,
+            )
+            self._register(state, record)
+
+        state.last_ts = ts
+        state.last_power = power
+        state.last_liters = liters
+        return record
+
+    def _register(self, state: _PumpState, record: CycleRecord) -> None:
+        day = int((record.end_ts + self.utc_offset_s) // SECONDS_PER_DAY)
+        if day != state.day:
+            state.day = day
+            state.cycles_today = 0
+        state.cycles_today += 1
+        state.recent.append(record)
+        if self.on_cycle is not None:
+            self.on_cycle(record)
+
+    def is_running(self, pump_id: str = DEFAULT_PUMP_ID) -> bool:
+        return self._state(pump_id).running
+
+    def recent_cycles(self, pump_id: str = DEFAULT_PUMP_ID) -> List[CycleRecord]:
+        return list(self._state(pump_id).recent)
+
+    def status_block(self, pump_id: str = DEFAULT_PUMP_ID, now: Optional[float] = None) -> Dict[str, Any]:
+        """`cycle`-blokken i system.get_status (API contract)."""
+
+        state = self._state(pump_id)
+        last = state.recent[-1] if state.recent else None
+        count = state.cycles_today
+        if now is not None and state.day != int((now + self.utc_offset_s) // SECONDS_PER_DAY):
+            count = 0
+        return {
+            "last_cycle_liters": last.liters if last else 0.0,
+            "last_cycle_runtime_s": last.runtime_s if last else 0.0,
+            "cycle_count_today": count,
+        }
+
+
+# -----------------------
+# Vektorisert batch-modus
+# -----------------------
+
+def detect_cycles(
+    ts,
+    running=None,
+    active_power=None,
+    total_liters=None,
+    power_threshold_w: float = DEFAULT_POWER_THRESHOLD_W,
+) -> Dict[str, np.ndarray]:
+    """Finner alle avsluttede sykluser i en tidsserie.
+
+    Returnerer kolonner: start_ts, end_ts, runtime_s, liters, energy_wh.
+    Samme semantikk som CycleDetector; en syklus som pågår ved slutten av
+    serien tas ikke med.
+    """
+
+    ts = np.asarray(ts, dtype=np.float64)
+    if running is None:
+        if active_power is None:
+            raise ValueError("detect_cycles needs either running or active_power")
+        on = np.asarray(active_power, dtype=np.float64) >= power_threshold_w
+    else:
+        on = np.asarray(running, dtype=bool)
+
+    edges = np.diff(on.astype(np.int8), prepend=np.int8(0))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    starts = starts[: len(ends)]
+
+    if total_liters is not None:
+        liters_col = np.asarray(total_liters, dtype=np.float64)
+        liters = liters_col[ends] - liters_col[starts]
+    else:
+        liters = np.zeros(len(ends))
+
+    if active_power is not None and len(ts) > 1:
+        power = np.asarray(active_power, dtype=np.float64)
+        steps = 0.5 * (power[1:] + power[:-1]) * np.diff(ts)
+        cumulative = np.concatenate(([0.0], np.cumsum(steps)))
+        energy_wh = (cumulative[ends] - cumulative[starts]) / 3600.0
+    else:
+        energy_wh = np.zeros(len(ends))
+
+    return {
+        "start_ts": ts[starts],
+        "end_ts": ts[ends],
+        "runtime_s": ts[ends] - ts[starts],
+        "liters": liters,
+        "energy_wh": energy_wh,
+    }
+
+
+def compare_to_recent(cycles: Dict[str, np.ndarray], n: int = 50) -> Dict[str, Dict[str, float]]:
+    """Sammenligner siste syklus med de n foregående ("de siste 50 syklusene").
+
+    Returnerer per kolonne: verdi, median, p10/p90 og z-score.
+    """
+
+    result: Dict[str, Dict[str, float]] = {}
+    for column in ("runtime_s", "liters", "energy_wh"):
+        values = np.asarray(cycles[column], dtype=np.float64)
+        if values.size < 2:
+            continue
+        last = values[-1]
+        window = values[-(n + 1):-1]
+        mean = window.mean()
+        std = window.std()
+        p10, median, p90 = np.percentile(window, [10, 50, 90])
+        result[column] = {
+            "value": float(last),
+            "median": float(median),
+            "p10": float(p10),
+            "p90": float(p90),
+            "z_score": float((last - mean) / std) if std > 0 else 0.0,
+        }
+    return result
@@ -0,0 +1,190 @@
+"""Lekkasjedeteksjon basert på nattvindu (flow_leakage_detection).
+
+Per natt (standard 02:00–05:00 lokal tid) beregnes:
+    min_flow_lpm        – laveste flow i vinduet (kontinuerlig gjennomstrømning)
+    night_usage_liters  – integrert forbruk i vinduet
+    cycle_count         – antall pumpesykluser som starter i vinduet
+    runtime_s           – samlet pumpetid for disse syklusene
+
+Baseline er en robust median over de foregående `window` nettene. Den samme
+score-funksjonen brukes både vektorisert over historikk (score_history) og
+inkrementelt per ny natt (LeakEngine), slik at resultatene er identiske.
+"""
+
+import warnings
+from collections import deque
+from statistics import median
+from typing import Any, Deque, Dict, Optional
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+FEATURES = ("min_flow_lpm", "night_usage_liters", "cycle_count", "runtime_s")
+
+# Vekting av relativt avvik fra baseline i leak_score.
+SCORE_WEIGHTS = {
+    "night_usage_liters": 1.0,
+    "min_flow_lpm": 1.0,
+    "cycle_count": 0.5,
+    "runtime_s": 0.5,
+}
+# Nedre grense for baseline i nevneren, så en tilnærmet tom natt ikke gir enorme avvik.
+SCORE_FLOORS = {
+    "night_usage_liters": 20.0,
+    "min_flow_lpm": 0.5,
+    "cycle_count": 1.0,
+    "runtime_s": 60.0,
+}
+# Lengste intervall et flow-sample regnes å gjelde; lengre hull er datautfall, ikke forbruk.
+MAX_SAMPLE_GAP_S = 300.0
+
+
+def night_features(
+    ts,
+    flow_lpm,
+    cycles: Optional[Dict[str, Any]] = None,
+    start_hour: int = 2,
+    end_hour: int = 5,
+    utc_offset_s: int = 0,
+    max_gap_s: float = MAX_SAMPLE_GAP_S,
+) -> Dict[str, np.ndarray]:
+    """Aggregerer flow- og syklusdata til én rad per natt.
+
+    `cycles` er resultatet fra analytics.cycles.detect_cycles (start_ts, runtime_s).
+    Returnerer kolonnen `night` (lokal dagindeks) pluss FEATURES.
+    """
+
+    ts = np.asarray(ts, dtype=np.float64)
+    flow = np.asarray(flow_lpm, dtype=np.float64)
+
+    local = ts + utc_offset_s
+    day = np.floor_divide(local, SECONDS_PER_DAY).astype(np.int64)
+    sod = local - day * SECONDS_PER_DAY
+    mask = (sod >= start_hour * 3600) & (sod < end_hour * 3600)
+
+    # Forbruk per sample: flow holdes konstant frem til neste sample, men aldri
+    # forbi slutten av nattvinduet eller lenger enn max_gap_s (datautfall).
+    dt = np.diff(ts, append=ts[-1] if ts.size else 0.0)
+    dt = np.minimum(dt, end_hour * 3600 - sod)
+    np.clip(dt, 0.0, max_gap_s, out=dt)
+    liters = flow * dt / 60.0
+
+    ids = day[mask]
+    nights, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+
+    if nights.size:
+        min_flow = np.minimum.reduceat(flow[mask], first)
+    else:
+        min_flow = np.zeros(0)
+    usage = np.bincount(inverse, weights=liters[mask], minlength=nights.size).astype(np.float64, copy=False)
+
+    cycle_count = np.zeros(nights.size)
+    runtime = np.zeros(nights.size)
+    if cycles is not None and nights.size:
+        c_local = np.asarray(cycles["start_ts"], dtype=np.float64) + utc_offset_s
+        c_day = np.floor_divide(c_local, SECONDS_PER_DAY).astype(np.int64)
+        c_sod = c_local - c_day * SECONDS_PER_DAY
+        c_mask = (c_sod >= start_hour * 3600) & (c_sod < end_hour * 3600)
+        pos = np.searchsorted(nights, c_day)
+        pos_clipped = np.minimum(pos, nights.size - 1)
+        c_mask &= nights[pos_clipped] == c_day
+        cycle_count = np.bincount(pos_clipped[c_mask], minlength=nights.size).astype(np.float64)
+        runtime = np.bincount(
+            pos_clipped[c_mask],
+            weights=np.asarray(cycles["runtime_s"], dtype=np.float64)[c_mask],
+            minlength=nights.size,
+        )
+
+    return {
+        "night": nights,
+        "min_flow_lpm": min_flow,
+        "night_usage_liters": usage,
+        "cycle_count": cycle_count,
+        "runtime_s": runtime,
+    }
+
+
+def _score(values: Dict[str, Any], baselines: Dict[str, Any]):
+    """leak_score i [0, 1) fra relativt overskudd over baseline. Virker på skalarer og arrays."""
+
+    total = 0.0
+    for name, weight in SCORE_WEIGHTS.items():
+        base = baselines[name]
+        excess = np.maximum(values[name] - base, 0.0) / np.maximum(base, SCORE_FLOORS[name])
+        total = total + weight * np.nan_to_num(excess, nan=0.0)
+    return 1.0 - np.exp(-total)
+
+
+def rolling_baseline(values, window: int = 14) -> np.ndarray:
+    """Median av de `window` foregående verdiene (ekskluderer inneværende natt)."""
+
+    values = np.asarray(values, dtype=np.float64)
+    if not values.size:
+        return np.zeros(0)
+    padded = np.concatenate((np.full(window, np.nan), values))
+    windows = np.lib.stride_tricks.sliding_window_view(padded[:-1], window)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # første natt: kun NaN
+        return np.nanmedian(windows, axis=1)
+
+
+def score_history(features: Dict[str, np.ndarray], window: int = 14) -> Dict[str, np.ndarray]:
+    """Rescorer hele historikken vektorisert.
+
+    Returnerer night, leak_score, night_usage_liters og baseline
+    (baseline = median nattforbruk for de foregående nettene, 0 uten historikk
+    som i status_block). Tom historikk gir tomme arrays.
+    """
+
+    baselines = {name: rolling_baseline(features[name], window) for name in FEATURES}
+    scores = _score(features, baselines)
+    return {
+        "night": features["night"],
+        "leak_score": scores,
+        "night_usage_liters": features["night_usage_liters"],
+        "baseline": np.nan_to_num(baselines["night_usage_liters"], nan=0.0),  # NaN -> 0
+    }
+
+
+class LeakEngine:
+    """Inkrementell scoring: én natt av gangen i konstant tid."""
+
+    def __init__(self, window: int = 14):
+        self.window = window
+        self._history: Dict[str, Deque[float]] = {name: deque(maxlen=window) for name in FEATURES}
+        self._last: Optional[Dict[str, float]] = None
+
+    def baseline(self) -> Dict[str, float]:
+        return {
+            name: median(values) if values else float("nan")
+            for name, values in self._history.items()
+        }
+
+    def score_night(self, night: Dict[str, float]) -> Dict[str, float]:
+        """Scorer en ny natt mot baseline og tar den deretter inn i historikken."""
+
+        baselines = self.baseline()
+        values = {name: float(night[name]) for name in FEATURES}
+        baseline = baselines["night_usage_liters"]
+        result = {
+            "leak_score": float(_score(values, baselines)),
+            "night_usage_liters": values["night_usage_liters"],
+            "baseline": 0.0 if baseline != baseline else baseline,  # første natt: 0 som i score_history
+        }
+        for name in FEATURES:
+            self._history[name].append(values[name])
+        self._last = result
+        return result
+
+    def warm_start(self, features: Dict[str, np.ndarray]) -> None:
+        """Fyller baseline fra historikk (f.eks. output fra night_features)."""
+
+        for name in FEATURES:
+            self._history[name].extend(float(v) for v in features[name][-self.window:])
+
+    def status_block(self) -> Dict[str, float]:
+        """`leakage`-blokken i system.get_status (API contract)."""
+
+        if self._last is None:
+            return {"leak_score": 0.0, "night_usage_liters": 0.0, "baseline": 0.0}
+        return dict(self._last)
@@ -0,0 +1,274 @@
+"""Inkrementell evaluering av driftsmodus og sikkerhetsregler.
+
+Master system model definerer operational_modes (med requirements som
+"mqtt_available" og "auto_manual_switch_p2=auto_shelly_and_legacy") og
+safety.fallback_rules ("if_mqtt_unavailable_then_use_mode_legacy_only",
+"if_node_red_down_then_block_ai_control"). ModeEngine kompilerer dem til et
+avhengighetsnett:
+
+    signal (get_system_health-felt, bryterstilling)
+      -> atom (f.eks. mqtt_available = mqtt_connected er sann)
+        -> modus-krav (AND av atomer) / fallback-regel
+          -> utfall: mode, ai_allowed_to_control
+
+update() merker bare nodene nedstrøms for signalene som faktisk endret verdi
+og regner dem om i topologisk rekkefølge. Resultatet publiseres som et
+uforanderlig ModeState, så dispatcheren leser `engine.current` i O(1).
+
+Ukjente signaler regnes som "ikke tilgjengelig": til helsedata er mottatt
+står systemet i legacy-modus og AI får ikke styre.
+"""
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import counter
+
+# Navn brukt i modellene -> signal (felt i events.get_system_health).
+SIGNAL_ALIASES: Dict[str, str] = {
+    "mqtt_available": "mqtt_connected",
+    "node_red_running": "node_red_alive",
+    "influxdb_available": "influxdb_connected",
+}
+
+# Subjekt i fallback-regler -> signal.
+FALLBACK_SUBJECTS: Dict[str, str] = {
+    "mqtt": "mqtt_connected",
+    "node_red": "node_red_alive",
+    "influxdb": "influxdb_connected",
+}
+
+HEALTH_SIGNALS = ("node_red_alive", "mqtt_connected", "influxdb_connected", "last_cycle_detection_ts")
+
+_FALLBACK = re.compile(
+    r"^if_(?P<subject>\w+?)_(?P<state>unavailable|down|offline)_then_"
+    r"(?:use_mode_(?P<mode>\w+)|(?P<block>block_ai_control))$"
+)
+
+
+@dataclass(frozen=True)
+class ModeState:
+    version: int
+    mode: str
+    ai_allowed_to_control: bool
+    reasons: Tuple[str, ...]
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Svar på formatet til mode.get_mode i API-kontrakten."""
+
+        return {"mode": self.mode, "ai_allowed_to_control": self.ai_allowed_to_control}
+
+
+class _Node:
+    __slots__ = ("name", "inputs", "func", "level", "value", "dependents")
+
+    def __init__(self, name: str, inputs: Tuple[str, ...], func: Callable[..., Any]):
+        self.name = name
+        self.inputs = inputs
+        self.func = func
+        self.level = 0
+        self.value: Any = None
+        self.dependents: List["_Node"] = []
+
+
+def _atom(requirement: str) -> Tuple[str, str, Callable[[Any], bool]]:
+    """requirement -> (nodenavn, signal, predikat)."""
+
+    if "=" in requirement:
+        signal, expected = (part.strip() for part in requirement.split("=", 1))
+        return requirement, signal, lambda value, expected=expected: value == expected
+    signal = SIGNAL_ALIASES.get(requirement, requirement)
+    return requirement, signal, lambda value: value is True
+
+
+class ModeEngine:
+    """Holder mode/ai_allowed_to_control oppdatert etter hvert som signaler endres."""
+
+    def __init__(self, operational_modes: List[Dict[str, Any]], fallback_rules: List[str]):
+        if not operational_modes:
+            raise ValueError("operational_modes is empty")
+
+        self._lock = threading.Lock()
+        self.signals: Dict[str, Any] = {}
+        self.nodes: Dict[str, _Node] = {}
+        self._signal_nodes: Dict[str, List[_Node]] = {}
+        self.modes = operational_modes
+        self.unparsed_rules: List[str] = []
+
+        # Tryggeste modus: første uten AI-styring (ellers den første).
+        self.safe_mode = next(
+            (m["id"] for m in operational_modes if not m.get("ai_allowed_to_control_pumps")),
+            operational_modes[0]["id"],
+        )
+
+        # Modus-krav: AND over atomer.
+        mode_nodes = []
+        for mode in operational_modes:
+            atoms = tuple(self._atom_node(req).name for req in mode.get("requirements", []))
+            node = self._add(f"mode:{mode['id']}", atoms, lambda *values: all(values))
+            mode_nodes.append((mode, node))
+
+        # Fallback-regler: hver blir en node som er sann når regelen slår inn.
+        forced: List[Tuple[str, str]] = []   # (regel, modus-id)
+        blocking: List[str] = []
+        for rule in fallback_rules:
+            match = _FALLBACK.match(rule)
+            if not match or match.group("subject") not in FALLBACK_SUBJECTS:
+                self.unparsed_rules.append(rule)
+                continue
+            signal = FALLBACK_SUBJECTS[match.group("subject")]
+            atom = self._atom_node(next((k for k, v in SIGNAL_ALIASES.items() if v == signal), signal))
+            self._add(f"rule:{rule}", (atom.name,), lambda ok: not ok)
+            if match.group("block"):
+                blocking.append(rule)
+            else:
+                target = self._mode_id(match.group("mode"))
+                if target is None:
+                    self.unparsed_rules.append(rule)
+                    continue
+                forced.append((rule, target))
+
+        # Utfall: modus og AI-tillatelse.
+        by_id = {mode["id"]: mode for mode in operational_modes}
+        # Mest kapable modus først (AI-styring), ellers rekkefølgen i modellen.
+        preference = sorted(mode_nodes, key=lambda pair: not pair[0].get("ai_allowed_to_control_pumps"))
+        forced_inputs = tuple(f"rule:{rule}" for rule, _ in forced)
+
+        def choose_mode(*values):
+            forced_values = values[:len(forced)]
+            for (rule, target), active in zip(forced, forced_values):
+                if active:
+                    return target, f"fallback:{rule}"
+            for (mode, _), met in zip(preference, values[len(forced):]):
+                if met:
+                    return mode["id"], f"requirements_met:{mode['id']}"
+            return self.safe_mode, "no_mode_requirements_met"
+
+        self._add("out:mode", forced_inputs + tuple(node.name for _, node in preference), choose_mode)
+
+        blocking_inputs = tuple(f"rule:{rule}" for rule in blocking)
+
+        def choose_allowed(mode_choice, *block_values):
+            mode_id, _ = mode_choice
+            if not by_id.get(mode_id, {}).get("ai_allowed_to_control_pumps"):
+                return False, f"mode_disallows_ai:{mode_id}"
+            for rule, active in zip(blocking, block_values):
+                if active:
+                    return False, f"fallback:{rule}"
+            return True, None
+
+        self._add("out:ai_allowed", ("out:mode",) + blocking_inputs, choose_allowed)
+
+        self._order = sorted(self.nodes.values(), key=lambda n: n.level)
+        for node in self._order:
+            node.value = node.func(*(self.nodes[i].value for i in node.inputs))
+        self.current = self._publish(0)
+
+    @classmethod
+    def from_master_model(cls, master: Dict[str, Any]) -> "ModeEngine":
+        return cls(
+            master.get("operational_modes", []),
+            master.get("safety", {}).get("fallback_rules", []),
+        )
+
+    # -- bygging --------------------------------------------------------
+
+    def _mode_id(self, name: str) -> Optional[str]:
+        for mode in self.modes:
+            if mode["id"] in (name, f"mode_{name}"):
+                return mode["id"]
+        return None
+
+    def _add(self, name: str, inputs: Tuple[str, ...], func: Callable[..., Any]) -> _Node:
+        node = self.nodes.get(name)
+        if node is not None:
+            return node
+        node = _Node(name, inputs, func)
+        for dep in inputs:
+            parent = self.nodes[dep]
+            parent.dependents.append(node)
+            node.level = max(node.level, parent.level + 1)
+        self.nodes[name] = node
+        return node
+
+    def _atom_node(self, requirement: str) -> _Node:
+        name, signal, predicate = _atom(requirement)
+        name = f"atom:{name}"
+        if name in self.nodes:
+            return self.nodes[name]
+        node = _Node(name, (), lambda predicate=predicate, signal=signal: predicate(self.signals.get(signal)))
+        node.level = 0
+        self.nodes[name] = node
+        self._signal_nodes.setdefault(signal, []).append(node)
+        return node
+
+    # -- evaluering -----------------------------------------------------
+
+    def update(self, **signals: Any) -> ModeState:
+        """Setter signaler og regner om bare det som avhenger av dem."""
+
+        with self._lock:
+            dirty: Dict[str, _Node] = {}
+            for name, value in signals.items():
+                if name in self.signals and self.signals[name] == value:
+                    continue
+                self.signals[name] = value
+                for node in self._signal_nodes.get(name, ()):
+                    dirty[node.name] = node
+            if not dirty:
+                return self.current
+
+            # Nivåvis propagering; en node regnes bare om hvis et input endret seg.
+            levels: Dict[int, Dict[str, _Node]] = {}
+            for node in dirty.values():
+                levels.setdefault(node.level, {})[node.name] = node
+            evaluated = 0
+            changed_outputs = False
+            level = 0
+            while levels:
+                batch = levels.pop(level, None)
+                level += 1
+                if not batch:
+                    continue
+                for node in batch.values():
+                    evaluated += 1
+                    value = node.func(*(self.nodes[i].value for i in node.inputs))
+                    if value == node.value:
+                        continue
+                    node.value = value
+                    if node.name.startswith("out:"):
+                        changed_outputs = True
+                    for child in node.dependents:
+                        levels.setdefault(child.level, {})[child.name] = child
+            counter("mode_engine.evaluations").inc(evaluated)
+
+            if changed_outputs:
+                self.current = self._publish(self.current.version + 1)
+            return self.current
+
+    def update_health(self, health: Dict[str, Any]) -> ModeState:
+        """Tar imot et events.get_system_health-svar.
+
+        Andre signaler modusene krever (f.eks. bryterstillingen
+        auto_manual_switch_p2 fra HA) kan ligge i samme dict.
+        """
+
+        return self.update(**{k: v for k, v in health.items() if k in HEALTH_SIGNALS or k in self._signal_nodes})
+
+    def _publish(self, version: int) -> ModeState:
+        mode_id, mode_reason = self.nodes["out:mode"].value
+        allowed, allowed_reason = self.nodes["out:ai_allowed"].value
+        reasons = (mode_reason,) + ((allowed_reason,) if allowed_reason else ())
+        return ModeState(version, mode_id, allowed, reasons)
+
+    # -- lesing (O(1), uten lås) ----------------------------------------
+
+    @property
+    def mode(self) -> str:
+        return self.current.mode
+
+    @property
+    def ai_allowed_to_control(self) -> bool:
+        return self.current.ai_allowed_to_control
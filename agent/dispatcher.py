@@ -1,26 +1,127 @@
-from tools.ha import HomeAssistantTool
-from tools.nodered import NodeRedTool
-from tools.influx import InfluxTool
+import importlib
+
+from utils.metrics import counter, span, traced
+from utils.schema_utils import SchemaValidationError, get_registry
+
+# Verktøynavn (agent_runtime.tools i manifestet) -> (modul, klasse).
+# Modulen importeres først når verktøyet brukes første gang.
+TOOL_REGISTRY = {
+    "home_assistant": ("tools.ha", "HomeAssistantTool"),
+    "node_red": ("tools.nodered", "NodeRedTool"),
+    "influxdb": ("tools.influx", "InfluxTool"),
+}
+
+# Alternative navn brukt i planer.
+TOOL_ALIASES = {
+    "nodered": "node_red",
+}
+
+# (verktøy, handling) -> navn på verktøyschemaet i tools/tools_*.json.
+# Input (args) og output valideres mot schemaet; handlinger uten schema valideres ikke.
+TOOL_SCHEMAS = {
+    ("home_assistant", "get_entity_state"): "ha_get_state",
+    ("influxdb", "query_latest"): "influx_query",
+    ("node_red", "invoke_flow"): "node_red_action",
+}
+
+# Resultater som betyr at steget ikke ble utført (eller ga ugyldig svar).
+FAILURE_PREFIXES = ("Blocked:", "Unknown tool:", "Invalid tool input:", "Invalid tool output:")
+
+# Handlinger som styrer anlegget og krever ai_allowed_to_control.
+# Node-RED-flyter kan starte/stoppe pumper (tools/tools_nodered.json) og vaktes derfor også.
+CONTROL_ACTIONS = {
+    ("home_assistant", "call_service"),
+    ("node_red", "invoke_flow"),
+    ("node_red", "inject_data"),
+}
+
+# Node-RED-flyter som bare leser (agentens spørreflyt) og kan kjøres uten styretillatelse.
+READ_ONLY_FLOWS = {"agent_query"}
+
+
+def is_control_step(key, args):
+    """Sann hvis (verktøy, handling) med disse argumentene kan styre anlegget."""
+
+    if key not in CONTROL_ACTIONS:
+        return False
+    return not (key == ("node_red", "invoke_flow") and args.get("flow") in READ_ONLY_FLOWS)
+
 
 class Dispatcher:
     """Knytter reasoning-plan til riktige verktøy."""
 
-    def __init__(self, manifest):
+    def __init__(self, manifest, guard=None, validate=True):
+        self.tools = {}
+        # ModeEngine (control.mode_engine); leses i O(1) før hver styrehandling.
+        # Den står i legacy-modus til noen mater den med helsedata (OynaAIAgent.update_health).
+        self.guard = guard
+        self.validate = validate
+        self.set_manifest(manifest)
+
+    def set_manifest(self, manifest):
+        """Bytter manifest (hot reload); verktøy som ikke lenger er tilgjengelige droppes."""
+
         self.manifest = manifest
-        self.tools = {
-            "home_assistant": HomeAssistantTool(),
-            "nodered": NodeRedTool(),
-            "influxdb": InfluxTool(),
-        }
+        configured = manifest.get("agent_runtime", {}).get("tools")
+        self.available = set(configured) if configured else set(TOOL_REGISTRY)
+        for name in list(self.tools):
+            if TOOL_ALIASES.get(name, name) not in self.available:
+                del self.tools[name]
 
-    def execute_plan(self, plan):
-        results = []
+    def get_tool(self, name):
+        """Returnerer verktøyinstans, og importerer/konstruerer den ved første bruk."""
+
+        tool = self.tools.get(name)
+        if tool is not None:
+            return tool
+
+        canonical = TOOL_ALIASES.get(name, name)
+        if canonical not in self.available or canonical not in TOOL_REGISTRY:
+            return None
+
+        module_name, class_name = TOOL_REGISTRY[canonical]
+        tool = getattr(importlib.import_module(module_name), class_name)()
+        self.tools[name] = tool
+        return tool
+
+    def iter_plan(self, plan):
+        """Utfører planen steg for steg og gir (steg, resultat) etter hvert som de er ferdige."""
+
+        registry = get_registry() if self.validate else None
         for step in plan:
-            tool = self.tools.get(step["tool"])
+            tool = self.get_tool(step["tool"])
             if not tool:
-                results.append(f"Unknown tool: {step['tool']}")
+                counter("dispatcher.unknown_tool").inc()
+                yield step, f"Unknown tool: {step['tool']}"
                 continue
-            result = tool.execute(step["action"], step.get("args", {}))
-            results.append(result)
+            key = (TOOL_ALIASES.get(step["tool"], step["tool"]), step["action"])
+            schema = TOOL_SCHEMAS.get(key) if registry is not None else None
+            args = step.get("args", {})
+            if schema is not None:
+                try:
+                    registry.validate_tool_input(schema, args)
+                except SchemaValidationError as e:
+                    counter("dispatcher.invalid_input").inc()
+                    yield step, f"Invalid tool input: {e}"
+                    continue
+            if is_control_step(key, args):
+                state = self.guard.current if self.guard is not None else None
+                if state is None or not state.ai_allowed_to_control:
+                    counter("dispatcher.control_blocked").inc()
+                    reason = ", ".join(state.reasons) if state is not None else "no mode engine"
+                    yield step, f"Blocked: AI control not allowed ({reason})"
+                    continue
+            with span(f"tool.{step['tool']}.{step['action']}"):
+                result = tool.execute(step["action"], args)
+            if schema is not None:
+                try:
+                    registry.validate_tool_output(schema, result)
+                except SchemaValidationError as e:
+                    counter("dispatcher.invalid_output").inc()
+                    result = f"Invalid tool output: {e}"
+            yield step, result
 
-        return results[-1] if len(results) == 1 else results
\ No newline at end of file
+    @traced("dispatcher.execute_plan")
+    def execute_plan(self, plan):
+        results = [result for _, result in self.iter_plan(plan)]
+        return results[-1] if len(results) == 1 else results
@@ -0,0 +1,307 @@
+"""Lokal store-and-forward-buffer for måledata ved brudd mot Influx/MQTT.
+
+Pumpehuset og beregningsnoden står på hver sin adresse og snakker over
+WiFi/MQTT. Når forbindelsen er nede, legges flow-, effekt- og syklusmålinger
+i en minnemappet ringbuffer med fast størrelse på disk:
+
+    header (64 B): magic, versjon, postlengde, kapasitet, head, tail, dropped
+    poster (48 B): seq, ts, kind, crc32, v1, v2, v3
+
+  * append() er hot-path: én struct.pack_into i mmap under en kort lås,
+    ingen fsync og ingen I/O. Er bufferen full, overskrives eldste post
+    (dropped telles) – inntak blokkerer aldri.
+  * Krasjsikker: hver post har sekvensnummer og CRC. Ved åpning valideres
+    [tail, head) og head rulles frem over gyldige poster som ble skrevet
+    før headeren rakk å oppdateres. Sidene ligger i page cache, så de
+    overlever at prosessen dør; flush() (msync) kjøres periodisk av
+    Forwarder mot strømbrudd.
+  * Forwarder sender ventende poster i batcher sortert på tidsstempel når
+    sink er tilgjengelig, og flytter tail først når alt er levert. Et avbrudd
+    midt i gir derfor duplikater, ikke hull (Influx-punkter med samme
+    tidsstempel og tagger overskrives).
+"""
+
+import mmap
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from utils.logging_utils import log
+from utils.metrics import counter
+
+MAGIC = b"OYNASFB1"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sIIQQQQ")
+HEADER_SIZE = 64
+_RECORD = struct.Struct("<QdB3xIddd")
+RECORD_SIZE = _RECORD.size  # 48
+_CRC_OFFSET = 20
+
+# kind -> (measurement, feltnavn for v1..v3)
+KINDS: Dict[int, Tuple[str, Tuple[str, str, str]]] = {
+    1: ("waterflow", ("liters_per_minute", "total_liters", "")),
+    2: ("pump_power", ("active_power_w", "running", "")),
+    3: ("pump_cycle", ("runtime_s", "liters", "energy_wh")),
+}
+KIND_FLOW = 1
+KIND_POWER = 2
+KIND_CYCLE = 3
+
+
+class Measurement(NamedTuple):
+    seq: int
+    ts: float
+    kind: int
+    v1: float
+    v2: float
+    v3: float
+
+    def fields(self) -> Dict[str, float]:
+        _, names = KINDS.get(self.kind, ("unknown", ("v1", "v2", "v3")))
+        return {name: value for name, value in zip(names, (self.v1, self.v2, self.v3)) if name}
+
+
+def _crc(record: bytes) -> int:
+    return zlib.crc32(record[:_CRC_OFFSET] + record[_CRC_OFFSET + 4:])
+
+
+class RingBuffer:
+    """Minnemappet ringbuffer med fast kapasitet (antall poster)."""
+
+    def __init__(self, path, capacity: int = 65536):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._open(capacity)
+
+    # -- fil ----------------------------------------------------------------
+
+    def _open(self, capacity: int) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        size = HEADER_SIZE + capacity * RECORD_SIZE
+        fresh = not self.path.exists() or self.path.stat().st_size < HEADER_SIZE
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fresh:
+                os.ftruncate(fd, size)
+            else:
+                magic, version, record_size, stored_capacity, *_ = _HEADER.unpack(os.pread(fd, _HEADER.size, 0))
+                if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD_SIZE:
+                    raise ValueError(f"{self.path}: not a store-and-forward buffer (or incompatible version)")
+                capacity = stored_capacity  # kapasiteten ligger i filen
+                size = HEADER_SIZE + capacity * RECORD_SIZE
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        self.capacity = capacity
+        if fresh:
+            self.head = self.tail = self.dropped = 0
+            self._write_header()
+        else:
+            _, _, _, _, self.head, self.tail, self.dropped = _HEADER.unpack_from(self._mm, 0)
+            self._recover()
+
+    def _write_header(self) -> None:
+        _HEADER.pack_into(self._mm, 0, MAGIC, FORMAT_VERSION, RECORD_SIZE, self.capacity,
+                          self.head, self.tail, self.dropped)
+
+    def _offset(self, seq: int) -> int:
+        return HEADER_SIZE + (seq % self.capacity) * RECORD_SIZE
+
+    def _read(self, seq: int) -> Optional[Measurement]:
+        offset = self._offset(seq)
+        raw = self._mm[offset:offset + RECORD_SIZE]
+        stored_seq, ts, kind, crc, v1, v2, v3 = _RECORD.unpack(raw)
+        if stored_seq != seq or crc != _crc(raw) or kind not in KINDS:
+            return None
+        return Measurement(seq, ts, kind, v1, v2, v3)
+
+    def _recover(self) -> None:
+        """Ruller head frem over gyldige poster og hopper over ødelagte i [tail, head)."""
+
+        rolled = 0
+        while self._read(self.head) is not None:
+            self.head += 1
+            rolled += 1
+        if self.head - self.tail > self.capacity:
+            self.dropped += self.head - self.capacity - self.tail
+            self.tail = self.head - self.capacity
+        while self.tail < self.head and self._read(self.tail) is None:
+            self.tail += 1
+            self.dropped += 1
+        self._write_header()
+        if rolled:
+            log("Store-and-forward buffer recovered records", path=str(self.path), records=rolled)
+
+    # -- hot path -------------------------------------------------------------
+
+    def append(self, kind: int, ts: float, v1: float = 0.0, v2: float = 0.0, v3: float = 0.0) -> int:
+        """Legger til én måling. Returnerer sekvensnummeret."""
+
+        # Ukjente typer ville blitt forkastet ved replay/gjenoppretting; avvis dem her.
+        if kind not in KINDS:
+            raise ValueError(f"Unknown measurement kind: {kind}")
+        with self._lock:
+            seq = self.head
+            if seq - self.tail >= self.capacity:
+                self.tail += 1
+                self.dropped += 1
+                counter("edge_buffer.dropped").inc()
+            offset = self._offset(seq)
+            mm = self._mm
+            _RECORD.pack_into(mm, offset, seq, ts, kind, 0, v1, v2, v3)
+            struct.pack_into("<I", mm, offset + _CRC_OFFSET, _crc(mm[offset:offset + RECORD_SIZE]))
+            self.head = seq + 1
+            _HEADER.pack_into(mm, 0, MAGIC, FORMAT_VERSION, RECORD_SIZE, self.capacity,
+                              self.head, self.tail, self.dropped)
+        return seq
+
+    def append_flow(self, ts: float, liters_per_minute: float, total_liters: float = 0.0) -> int:
+        return self.append(KIND_FLOW, ts, liters_per_minute, total_liters)
+
+    def append_power(self, ts: float, active_power_w: float, running: bool) -> int:
+        return self.append(KIND_POWER, ts, active_power_w, 1.0 if running else 0.0)
+
+    def append_cycle(self, ts: float, runtime_s: float, liters: float, energy_wh: float) -> int:
+        return self.append(KIND_CYCLE, ts, runtime_s, liters, energy_wh)
+
+    # -- lesing / commit ------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self.head - self.tail
+
+    def pending(self, limit: Optional[int] = None) -> Tuple[List[Measurement], int]:
+        """Kopi av ventende poster og head de gjelder til (for commit())."""
+
+        with self._lock:
+            tail, head = self.tail, self.head
+            if limit is not None:
+                head = min(head, tail + limit)
+            # Kopierer råbytes under lås; dekoding og CRC gjøres utenfor.
+            chunks = []
+            start = tail
+            while start < head:
+                slot = start % self.capacity
+                count = min(head - start, self.capacity - slot)
+                offset = HEADER_SIZE + slot * RECORD_SIZE
+                chunks.append((start, self._mm[offset:offset + count * RECORD_SIZE]))
+                start += count
+
+        records = []
+        for first_seq, raw in chunks:
+            for i, values in enumerate(_RECORD.iter_unpack(raw)):
+                seq, ts, kind, crc, v1, v2, v3 = values
+                chunk = raw[i * RECORD_SIZE:(i + 1) * RECORD_SIZE]
+                if seq != first_seq + i or crc != _crc(chunk):
+                    continue
+                records.append(Measurement(seq, ts, kind, v1, v2, v3))
+        return records, head
+
+    def commit(self, upto: int) -> None:
+        """Markerer alt før `upto` som levert."""
+
+        with self._lock:
+            if upto > self.tail:
+                self.tail = min(upto, self.head)
+                self._write_header()
+
+    def flush(self) -> None:
+        self._mm.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._write_header()
+            self._mm.flush()
+            self._mm.close()
+
+
+# -----------------------
+# Replay
+# -----------------------
+
+def to_line_protocol(records: Sequence[Measurement], tags: str = "site=oyna") -> List[str]:
+    """Influx line protocol (ns-tidsstempel)."""
+
+    lines = []
+    for record in records:
+        measurement, _ = KINDS[record.kind]
+        fields = ",".join(f"{name}={value!r}" for name, value in record.fields().items())
+        lines.append(f"{measurement},{tags} {fields} {int(record.ts * 1e9)}")
+    return lines
+
+
+class Forwarder:
+    """Tømmer bufferen mot en sink når den er tilgjengelig.
+
+    sink(batch) skal levere hele batchen eller kaste et unntak.
+    is_online() er en billig sjekk (f.eks. ModeEngine-signalet influxdb_connected).
+    """
+
+    def __init__(
+        self,
+        buffer: RingBuffer,
+        sink: Callable[[List[Measurement]], None],
+        is_online: Callable[[], bool] = lambda: True,
+        batch_size: int = 500,
+        interval_s: float = 5.0,
+        max_records_per_drain: Optional[int] = None,
+    ):
+        self.buffer = buffer
+        self.sink = sink
+        self.is_online = is_online
+        self.batch_size = batch_size
+        self.interval_s = interval_s
+        self.max_records_per_drain = max_records_per_drain
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def drain(self) -> int:
+        """Sender ventende poster i tidsrekkefølge. Returnerer antall levert."""
+
+        records, upto = self.buffer.pending(self.max_records_per_drain)
+        if not records:
+            self.buffer.commit(upto)
+            return 0
+        records.sort(key=lambda r: (r.ts, r.seq))
+        sent = 0
+        try:
+            for start in range(0, len(records), self.batch_size):
+                batch = records[start:start + self.batch_size]
+                self.sink(batch)
+                sent += len(batch)
+        except Exception as e:
+            self.last_error = str(e)
+            counter("edge_buffer.replay_failed").inc()
+            log("Store-and-forward replay failed", sent=sent, pending=len(records), error=self.last_error)
+            return sent
+        self.buffer.commit(upto)
+        self.last_error = None
+        counter("edge_buffer.replayed").inc(sent)
+        return sent
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self.buffer.flush()
+            if len(self.buffer) and self.is_online():
+                self.drain()
+
+    def start(self) -> threading.Thread:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="oyna-store-forward", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.buffer.flush()
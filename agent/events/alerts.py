@@ -0,0 +1,316 @@
+"""Korrelering, deduplisering og rate-limiting av alarmer (events.get_alerts).
+
+Samme fysiske hendelse gir ofte mange rå-alarmer: en lekkasje ses både som
+høy leak_score, korte pumpesykluser og nattforbruk, og en sensor som flapper
+gir en ny alarm for hver endring. AlertPipeline gjør dem om til én
+korrelert alarm (incident):
+
+  * dedup – nøkkel (source, kind) i et glidende vindu (OrderedDict sortert på
+    sist sett, så utløpte nøkler fjernes fra fronten i O(1) amortisert)
+  * korrelering – hendelser hvis kilder ligger innen `max_hops` i
+    causal_graph og innen `correlation_window_s` slås sammen. Nabolaget er
+    forhåndsberegnet, så oppslaget er O(grad)
+  * aktive alarmer – dict + min-heap på utløpstid med én post per alarm
+    (fristen flyttes først når posten når toppen; O(log n))
+  * varsling – token bucket per incident og globalt; undertrykte varsler telles
+"""
+
+import heapq
+import itertools
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.metrics import counter
+
+SEVERITY = {"info": 0, "warning": 1, "critical": 2}
+
+# Signaler/alarmkilder som ikke er egne noder i causal_graph.
+DEFAULT_SOURCE_NODES: Dict[str, str] = {
+    "short_cycles": "pump_p2",
+    "cycle_runtime": "pump_p2",
+    "pump_running": "pump_p2",
+    "night_flow": "waterflow_lpm",
+    "night_usage": "waterflow_lpm",
+    "leakage": "leak_score",
+    "pressure_low": "virtual_pressure",
+    "frost": "distribution_network",
+}
+
+
+@dataclass(frozen=True)
+class AlertEvent:
+    ts: float
+    source: str
+    kind: str
+    severity: str = "warning"
+    message: str = ""
+    value: Optional[float] = None
+
+
+@dataclass
+class Incident:
+    id: int
+    first_ts: float
+    last_ts: float
+    severity: str
+    nodes: Set[str]
+    keys: Dict[Tuple[str, str], int] = field(default_factory=dict)  # (source, kind) -> antall
+    events: int = 0
+    duplicates: int = 0
+    messages: Deque[str] = field(default_factory=lambda: deque(maxlen=5))
+    notified_severity: int = -1
+    tokens: float = 1.0
+    tokens_ts: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "severity": self.severity,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "components": sorted(self.nodes),
+            "signals": [f"{source}:{kind}" for source, kind in self.keys],
+            "event_count": self.events,
+            "duplicates_suppressed": self.duplicates,
+            "latest_messages": list(self.messages),
+        }
+
+
+def neighbourhoods(edges: Iterable[Dict[str, Any]], max_hops: int) -> Dict[str, Set[str]]:
+    """Node -> noder innen max_hops (urettet), inkludert noden selv."""
+
+    adjacency: Dict[str, Set[str]] = {}
+    for edge in edges:
+        a, b = edge["from"], edge["to"]
+        adjacency.setdefault(a, set()).add(b)
+        adjacency.setdefault(b, set()).add(a)
+
+    result = {}
+    for start in adjacency:
+        seen = {start}
+        frontier = [start]
+        for _ in range(max_hops):
+            frontier = [n for node in frontier for n in adjacency[node] if n not in seen]
+            seen.update(frontier)
+            if not frontier:
+                break
+        result[start] = seen
+    return result
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "ts")
+
+    def __init__(self, rate_per_s: float, burst: float):
+        self.rate = rate_per_s
+        self.burst = burst
+        self.tokens = burst
+        self.ts: Optional[float] = None
+
+    def take(self, now: float) -> bool:
+        if self.ts is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class AlertPipeline:
+    """Tar imot rå-alarmer og holder et sett med korrelerte, aktive alarmer."""
+
+    def __init__(
+        self,
+        causal_edges: Iterable[Dict[str, Any]] = (),
+        source_nodes: Optional[Dict[str, str]] = None,
+        max_hops: int = 2,
+        dedup_window_s: float = 300.0,
+        correlation_window_s: float = 900.0,
+        clear_after_s: float = 3600.0,
+        notify: Optional[Callable[[Dict[str, Any]], None]] = None,
+        notify_per_incident_s: float = 900.0,
+        notify_rate_per_min: float = 6.0,
+        notify_burst: int = 3,
+    ):
+        self.near = neighbourhoods(causal_edges, max_hops)
+        self.source_nodes = dict(DEFAULT_SOURCE_NODES if source_nodes is None else source_nodes)
+        self.dedup_window_s = dedup_window_s
+        self.correlation_window_s = correlation_window_s
+        self.clear_after_s = clear_after_s
+        self.notify = notify
+        self.notify_per_incident_s = notify_per_incident_s
+        self._global_bucket = _TokenBucket(notify_rate_per_min / 60.0, notify_burst)
+
+        self._seen: "OrderedDict[Tuple[str, str], Tuple[float, int]]" = OrderedDict()  # key -> (sist sett, incident)
+        self.active: Dict[int, Incident] = {}
+        self._by_node: Dict[str, Set[int]] = {}
+        self._expiry: List[Tuple[float, int]] = []
+        self._ids = itertools.count(1)
+        self.suppressed_notifications = 0
+
+    @classmethod
+    def from_master_model(cls, master: Dict[str, Any], **kwargs: Any) -> "AlertPipeline":
+        return cls(master.get("causal_graph", {}).get("edges", []), **kwargs)
+
+    def node_for(self, source: str) -> str:
+        return self.source_nodes.get(source, source)
+
+    # -- inntak -----------------------------------------------------------
+
+    def ingest(self, event: AlertEvent) -> Incident:
+        now = event.ts
+        self._expire(now)
+        key = (event.source, event.kind)
+        level = SEVERITY.get(event.severity, 1)
+
+        seen = self._seen.get(key)
+        if seen is not None and now - seen[0] <= self.dedup_window_s and seen[1] in self.active:
+            incident = self.active[seen[1]]
+            incident.duplicates += 1
+            counter("alerts.deduplicated").inc()
+        else:
+            node = self.node_for(event.source)
+            candidates = self._correlate(node, now)
+            if not candidates:
+                incident = Incident(next(self._ids), now, now, event.severity, {node}, tokens_ts=now)
+                self.active[incident.id] = incident
+                heapq.heappush(self._expiry, (now + self.clear_after_s, incident.id))
+                counter("alerts.incidents").inc()
+            else:
+                incident = candidates[0]
+                for other in candidates[1:]:
+                    # Hendelsen binder sammen to alarmer (f.eks. leak_score og pump_p2).
+                    self._merge(incident, other)
+                incident.nodes.add(node)
+                counter("alerts.correlated").inc()
+            self._by_node.setdefault(node, set()).add(incident.id)
+
+        self._seen[key] = (now, incident.id)
+        self._seen.move_to_end(key)
+        incident.keys[key] = incident.keys.get(key, 0) + 1
+        incident.events += 1
+        incident.last_ts = max(incident.last_ts, now)
+        if event.message:
+            incident.messages.append(event.message)
+        if level > SEVERITY.get(incident.severity, 1):
+            incident.severity = event.severity
+        self._maybe_notify(incident, now)
+        return incident
+
+    def ingest_many(self, events: Iterable[AlertEvent]) -> int:
+        """Batch-inntak (sortert på tid) for bursts."""
+
+        count = 0
+        for event in sorted(events, key=lambda e: e.ts):
+            self.ingest(event)
+            count += 1
+        return count
+
+    def _correlate(self, node: str, now: float) -> List[Incident]:
+        """Aktive alarmer innen max_hops og korrelasjonsvinduet, eldste først."""
+
+        found: Dict[int, Incident] = {}
+        for near in self.near.get(node, (node,)):
+            for incident_id in self._by_node.get(near, ()):
+                incident = self.active.get(incident_id)
+                if incident is not None and now - incident.last_ts <= self.correlation_window_s:
+                    found[incident_id] = incident
+        return [found[i] for i in sorted(found)]
+
+    def _merge(self, target: Incident, other: Incident) -> None:
+        self._remove(other)
+        for node in other.nodes:
+            self._by_node.setdefault(node, set()).add(target.id)
+        target.nodes |= other.nodes
+        for key, count in other.keys.items():
+            target.keys[key] = target.keys.get(key, 0) + count
+            seen = self._seen.get(key)
+            if seen is not None and seen[1] == other.id:
+                self._seen[key] = (seen[0], target.id)
+        target.first_ts = min(target.first_ts, other.first_ts)
+        target.last_ts = max(target.last_ts, other.last_ts)
+        target.events += other.events
+        target.duplicates += other.duplicates
+        target.messages.extend(other.messages)
+        target.notified_severity = max(target.notified_severity, other.notified_severity)
+        if SEVERITY.get(other.severity, 1) > SEVERITY.get(target.severity, 1):
+            target.severity = other.severity
+        counter("alerts.merged").inc()
+
+    # -- utløp ------------------------------------------------------------
+
+    def _expire(self, now: float) -> None:
+        seen = self._seen
+        horizon = now - max(self.dedup_window_s, self.correlation_window_s)
+        while seen:
+            key, (ts, _) = next(iter(seen.items()))
+            if ts >= horizon:
+                break
+            seen.popitem(last=False)
+
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            deadline, incident_id = heapq.heappop(expiry)
+            incident = self.active.get(incident_id)
+            if incident is None:
+                continue  # allerede fjernet (clear/merge)
+            if incident.last_ts + self.clear_after_s > deadline:
+                # Oppdatert siden posten ble lagt inn: legg inn ny frist (én post per alarm).
+                heapq.heappush(expiry, (incident.last_ts + self.clear_after_s, incident_id))
+                continue
+            self._remove(incident)
+            counter("alerts.cleared").inc()
+
+    def _remove(self, incident: Incident) -> None:
+        del self.active[incident.id]
+        for node in incident.nodes:
+            ids = self._by_node.get(node)
+            if ids is not None:
+                ids.discard(incident.id)
+                if not ids:
+                    del self._by_node[node]
+
+    def clear(self, incident_id: int) -> bool:
+        """Kvitterer ut en alarm manuelt (heap-posten hoppes over når den når toppen)."""
+
+        incident = self.active.get(incident_id)
+        if incident is None:
+            return False
+        self._remove(incident)
+        return True
+
+    # -- varsling ---------------------------------------------------------
+
+    def _maybe_notify(self, incident: Incident, now: float) -> None:
+        level = SEVERITY.get(incident.severity, 1)
+        if level <= incident.notified_severity:
+            # Samme nivå: høyst ett varsel per notify_per_incident_s.
+            incident.tokens = min(1.0, incident.tokens + (now - incident.tokens_ts) / self.notify_per_incident_s)
+            incident.tokens_ts = now
+            if incident.tokens < 1.0:
+                return
+        if not self._global_bucket.take(now):
+            self.suppressed_notifications += 1
+            counter("alerts.notifications_suppressed").inc()
+            return
+        incident.tokens = 0.0
+        incident.tokens_ts = now
+        incident.notified_severity = max(incident.notified_severity, level)
+        counter("alerts.notifications").inc()
+        if self.notify is not None:
+            self.notify(incident.as_dict())
+
+    # -- lesing -----------------------------------------------------------
+
+    def get_alerts(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Svar på formatet til events.get_alerts."""
+
+        if now is not None:
+            self._expire(now)
+        ordered = sorted(
+            self.active.values(),
+            key=lambda i: (-SEVERITY.get(i.severity, 1), -i.last_ts),
+        )
+        return {"active_alerts": [incident.as_dict() for incident in ordered]}
@@ -0,0 +1,522 @@
+"""Entitetsoppslag på tvers av modellene.
+
+Samme ting har ulike ID-er og navn i digital twin, master system model,
+knowledge graph og de frie knowledge/*.json-modulene ("pump_p2",
+"Pressure Pump P2", "Trykkpumpe (P2)", "k02" vs "contactor_k02" ...).
+
+build_entity_index() gjør all matching én gang:
+  * samler alle objekter med "id" (og HA-entiteter) fra modellene i manifestet
+  * slår sammen ID-er med lik ID, likt normalisert navn eller entydig
+    suffiks ("k02" -> "contactor_k02") – bare når typene er forenlige, så
+    kurs_6 ("Pressure Pump P2", motor_circuit) ikke blir pumpen
+  * knytter HA-entiteter til utstyret de styrer (HA_EQUIPMENT)
+  * velger kanonisk ID (knowledge graph > master model > twin)
+  * lager fuzzy-nøkler (uten mellomrom, én slettet bokstav) for alle alias
+  * finner forekomster i knowledge-modulene via token-trie
+og lagrer resultatet som JSON (alias-hashmap, fuzzy-hashmap og
+lokasjoner som JSON-pekere).
+
+EntityIndex laster artefakten og gjør oppslag i O(1) (resolve, også med
+skrivefeil) eller lineært i teksten (find_mentions), uten å skanne modellene.
+"""
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_MANIFEST = PROJECT_ROOT / "models" / "v2" / "ai_master_manifest_v2.json"
+DEFAULT_INDEX_PATH = PROJECT_ROOT / ".cache" / "entity_index.json"
+INDEX_FORMAT = 2
+
+# Modeller i manifestet som indekseres, i prioritet for valg av kanonisk ID.
+MODEL_PRIORITY = ("knowledge_graph", "master_system_model", "digital_twin")
+
+# Manuelle alias (norsk fagspråk og kortformer brukt i dokumentene).
+ALIASES: Dict[str, List[str]] = {
+    "pump_p1": ["p1", "brønnpumpe", "brønnpumpe p1", "well pump"],
+    "pump_p2": ["p2", "pump p2", "trykkpumpe", "trykkpumpe p2", "pressure pump"],
+    "tank_6000l": ["6000 l", "6000l", "hovedtank", "rentvannstank", "6000 l hovedtank"],
+    "tank_pressure_150l": ["150 l", "150l", "trykktank", "hydrofor", "150 l trykktank"],
+    "flow_meter_sensus_620": ["sensus 620", "sensus", "hovedvannmåler", "vannmåler"],
+    "shelly_pro_em50": ["em50", "shelly em50", "pro em50"],
+    "shelly_1_gen4": ["shelly 1", "shelly 1 gen4", "shelly 1g4"],
+    "pulse_hri_1": ["hri", "sensus hri"],
+    "wifi_ruckus_r310": ["ruckus", "ruckus r310", "r310"],
+    "mqtt_broker_mosquitto": ["mosquitto", "mqtt broker"],
+    "well_1": ["brønn", "brønnen", "borebrønn"],
+    "distribution_network": ["distribusjonsnett", "ledningsnett", "hovedledningsnett"],
+    "dist_board_garo": ["garo", "hovedtavle", "sikringsskap"],
+}
+
+# HA-entitet -> [utstyret den er et navn på, øvrig utstyr den virker på].
+# Entiteten slås sammen med det første; de øvrige blir relasjoner.
+HA_EQUIPMENT: Dict[str, List[str]] = {
+    "switch.pressure_pump_contactor": ["pump_p2", "contactor_k02", "abb_contactor_p2"],
+}
+
+# Listenøkler som ikke sier noe om hva slags ting elementene er.
+_GENERIC_CONTAINERS = {"nodes", "components", "items", "entities"}
+
+# Fuzzy-nøkler lages bare for alias med minst så mange tegn (korte ID-er er for tvetydige).
+FUZZY_MIN_LENGTH = 5
+
+_HA_ENTITY = re.compile(r"^(sensor|binary_sensor|switch|input_number|input_boolean)\.[a-z0-9_]+$")
+_TOKEN = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    """Små bokstaver, skilletegn/understrek -> mellomrom."""
+
+    return " ".join(_TOKEN.findall(text.lower()))
+
+
+def fuzzy_keys(norm: str) -> List[str]:
+    """Nøkler for skrivefeil-tolerant oppslag: kompakt form og alle varianter med én bokstav slettet."""
+
+    compact = norm.replace(" ", "")
+    if len(compact) < FUZZY_MIN_LENGTH:
+        return []
+    keys = {compact}
+    keys.update(compact[:i] + compact[i + 1:] for i in range(len(compact)))
+    return sorted(keys)
+
+
+def _pointer(parts: Tuple[Any, ...]) -> str:
+    return "".join("/" + str(p).replace("~", "~0").replace("/", "~1") for p in parts)
+
+
+def _walk(node: Any, path: Tuple[Any, ...] = ()) -> Iterator[Tuple[Tuple[Any, ...], Any]]:
+    yield path, node
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _walk(value, path + (key,))
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            yield from _walk(value, path + (i,))
+
+
+def _sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: Dict[str, str] = {}
+
+    def add(self, item: str) -> None:
+        self.parent.setdefault(item, item)
+
+    def find(self, item: str) -> str:
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a: str, b: str) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+# -----------------------
+# Trie over alias-tokens
+# -----------------------
+
+def build_trie(aliases: Dict[str, str]) -> Dict[str, Any]:
+    """Token-trie: {"pressure": {"pump": {"p2": {"$": "pump_p2"}}}}."""
+
+    root: Dict[str, Any] = {}
+    for alias, canonical in aliases.items():
+        node = root
+        for token in alias.split():
+            node = node.setdefault(token, {})
+        node["$"] = canonical
+    return root
+
+
+def scan_trie(trie: Dict[str, Any], text: str) -> List[str]:
+    """Lengste treff fra venstre mot høyre; returnerer kanoniske ID-er i rekkefølge."""
+
+    tokens = normalize(text).split()
+    found: List[str] = []
+    i = 0
+    while i < len(tokens):
+        node = trie
+        match = None
+        match_end = i
+        j = i
+        while j < len(tokens) and tokens[j] in node:
+            node = node[tokens[j]]
+            j += 1
+            if "$" in node:
+                match, match_end = node["$"], j
+        if match is not None:
+            found.append(match)
+            i = match_end
+        else:
+            i += 1
+    return found
+
+
+# -----------------------
+# Bygging
+# -----------------------
+
+def _load_models(
+    manifest: Dict[str, Any], project_root: Path, loaded: Optional[Dict[str, Any]] = None
+) -> Dict[str, Tuple[str, Path, Any]]:
+    """{model_key: (model_id, path, data)} for modellene i MODEL_PRIORITY.
+
+    `loaded` er allerede parsede modeller ({model_key: data}) som gjenbrukes.
+    """
+
+    models = {}
+    for key in MODEL_PRIORITY:
+        entry = manifest.get("models", {}).get(key)
+        if not entry:
+            continue
+        path = project_root / entry["path"]
+        if loaded is not None and key in loaded:
+            data = loaded[key]
+        else:
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        models[key] = (entry.get("id", key), path, data)
+    return models
+
+
+def _knowledge_files(project_root: Path) -> List[Path]:
+    return sorted((project_root / "knowledge").glob("*.json"))
+
+
+def source_files(manifest: Dict[str, Any], project_root: Path = PROJECT_ROOT) -> List[Path]:
+    files = []
+    for key in MODEL_PRIORITY:
+        entry = manifest.get("models", {}).get(key)
+        if entry:
+            files.append(project_root / entry["path"])
+    return files + _knowledge_files(project_root)
+
+
+def build_entity_index(
+    manifest: Dict[str, Any], project_root: Path = PROJECT_ROOT, loaded: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    models = _load_models(manifest, project_root, loaded)
+    uf = _UnionFind()
+
+    # id -> {"labels": set, "type": str|None, "types": set, "containers": set,
+    #        "priority": int, "locations": {model_id: [ptr]}}
+    records: Dict[str, Dict[str, Any]] = {}
+
+    def record(entity_id: str, model_id: str, pointer: str, priority: int,
+               label: Optional[str] = None, entity_type: Optional[str] = None,
+               container: Optional[str] = None) -> None:
+        rec = records.setdefault(entity_id, {
+            "labels": set(), "type": None, "types": set(), "containers": set(),
+            "priority": priority, "locations": {},
+        })
+        uf.add(entity_id)
+        rec["priority"] = min(rec["priority"], priority)
+        if label:
+            rec["labels"].add(label)
+        if entity_type:
+            rec["types"].add(entity_type)
+            if rec["type"] is None:
+                rec["type"] = entity_type
+        if container and container not in _GENERIC_CONTAINERS:
+            rec["containers"].add(container)
+        rec["locations"].setdefault(model_id, [])
+        if pointer not in rec["locations"][model_id]:
+            rec["locations"][model_id].append(pointer)
+
+    for priority, key in enumerate(MODEL_PRIORITY):
+        if key not in models:
+            continue
+        model_id, _, data = models[key]
+        for path, node in _walk(data):
+            if isinstance(node, dict) and isinstance(node.get("id"), str):
+                # Listen elementet står i ("circuits", "pumps") sier hva slags ting det er.
+                container = str(path[-2]) if len(path) >= 2 and isinstance(path[-1], int) else None
+                record(node["id"], model_id, _pointer(path), priority,
+                       label=node.get("label") or node.get("name"), entity_type=node.get("type"),
+                       container=container)
+            elif isinstance(node, str) and _HA_ENTITY.match(node):
+                record(node, model_id, _pointer(path), priority, entity_type="ha_entity")
+
+    def compatible(a: str, b: str) -> bool:
+        """Samme slags ting: felles type og felles liste, der begge sider har det."""
+        ra, rb = records[a], records[b]
+        for field in ("types", "containers"):
+            if ra[field] and rb[field] and not ra[field] & rb[field]:
+                return False
+        return True
+
+    # 1) likt normalisert navn
+    by_label: Dict[str, List[str]] = {}
+    for entity_id, rec in records.items():
+        for label in rec["labels"]:
+            bucket = by_label.setdefault(normalize(label), [])
+            match = next((other for other in bucket if compatible(other, entity_id)), None)
+            if match is not None:
+                uf.union(match, entity_id)
+            else:
+                bucket.append(entity_id)
+
+    # 2) entydig suffiks: "k02" -> "contactor_k02"
+    ids = list(records)
+    for short in ids:
+        if "_" in short or "." in short:
+            continue
+        candidates = [other for other in ids if other != short and other.endswith("_" + short)]
+        if len(candidates) == 1 and compatible(short, candidates[0]):
+            uf.union(short, candidates[0])
+
+    # 3) HA-entiteter er navn på utstyret de styrer (manuelt, uavhengig av type)
+    for entity_id, equipment in HA_EQUIPMENT.items():
+        if entity_id in records and equipment[0] in records:
+            uf.union(equipment[0], entity_id)
+
+    # Grupper og velg kanonisk ID
+    groups: Dict[str, List[str]] = {}
+    for entity_id in records:
+        groups.setdefault(uf.find(entity_id), []).append(entity_id)
+
+    canonical_of: Dict[str, str] = {}
+    entities: Dict[str, Dict[str, Any]] = {}
+    for members in groups.values():
+        canonical = min(members, key=lambda m: (records[m]["priority"], len(m), m))
+        labels = sorted({label for m in members for label in records[m]["labels"]})
+        locations: Dict[str, List[str]] = {}
+        for m in sorted(members):
+            canonical_of[m] = canonical
+            for model_id, pointers in records[m]["locations"].items():
+                locations.setdefault(model_id, []).extend(pointers)
+        entities[canonical] = {
+            "type": records[canonical]["type"] or next((records[m]["type"] for m in members if records[m]["type"]), None),
+            "label": min(records[canonical]["labels"] or labels or [canonical]),
+            "ids": sorted(members),
+            "aliases": [],
+            "locations": locations,
+            "related": [],
+        }
+
+    # Alias-hashmap: normalisert form -> kanonisk ID
+    aliases: Dict[str, str] = {}
+
+    def add_alias(text: str, canonical: str) -> None:
+        norm = normalize(text)
+        if norm and norm not in aliases:
+            aliases[norm] = canonical
+            entities[canonical]["aliases"].append(norm)
+
+    for canonical, entity in entities.items():
+        add_alias(canonical, canonical)
+    for canonical, entity in entities.items():
+        for member in entity["ids"]:
+            add_alias(member, canonical)
+            if member.count(".") == 1:
+                add_alias(member.split(".", 1)[1], canonical)  # "pressure_pump_contactor"
+        for label in sorted({label for m in entity["ids"] for label in records[m]["labels"]}):
+            add_alias(label, canonical)
+    for entity_id, extra in ALIASES.items():
+        canonical = canonical_of.get(entity_id)
+        if canonical:
+            for alias in extra:
+                add_alias(alias, canonical)
+
+    # Fuzzy-nøkler: bare entydige nøkler som ikke allerede er et eksakt alias
+    fuzzy_candidates: Dict[str, set] = {}
+    for norm, canonical in aliases.items():
+        for key in fuzzy_keys(norm):
+            fuzzy_candidates.setdefault(key, set()).add(canonical)
+    fuzzy = {
+        key: next(iter(found))
+        for key, found in sorted(fuzzy_candidates.items())
+        if len(found) == 1 and key not in aliases
+    }
+
+    # HA-entitet -> øvrig utstyr den virker på
+    for entity_id, equipment in HA_EQUIPMENT.items():
+        a = canonical_of.get(entity_id)
+        for other in equipment[1:]:
+            b = canonical_of.get(other)
+            if a and b and a != b:
+                entities[a]["related"].append({"id": b, "type": "switches", "direction": "out"})
+                entities[b]["related"].append({"id": a, "type": "switches", "direction": "in"})
+
+    # Relasjoner fra knowledge graph (kanten går mellom kanoniske ID-er)
+    if "knowledge_graph" in models:
+        for edge in models["knowledge_graph"][2].get("edges", []):
+            a = canonical_of.get(edge.get("from"))
+            b = canonical_of.get(edge.get("to"))
+            if a and b and a != b:
+                entities[a]["related"].append({"id": b, "type": edge.get("type"), "direction": "out"})
+                entities[b]["related"].append({"id": a, "type": edge.get("type"), "direction": "in"})
+
+    # Forekomster i de frie knowledge-modulene
+    trie = build_trie(aliases)
+    for path in _knowledge_files(project_root):
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        module_id = f"knowledge/{path.stem}"
+        for ptr_parts, node in _walk(data):
+            if not isinstance(node, str):
+                continue
+            pointer = _pointer(ptr_parts)
+            for canonical in set(scan_trie(trie, node)):
+                locations = entities[canonical]["locations"].setdefault(module_id, [])
+                locations.append(pointer)
+
+    return {
+        "format": INDEX_FORMAT,
+        "sources": {
+            str(p.relative_to(project_root).as_posix()): _sha256(p)
+            for p in source_files(manifest, project_root)
+        },
+        "models": {key: {"id": mid, "path": str(p.relative_to(project_root).as_posix())} for key, (mid, p, _) in models.items()},
+        "entities": entities,
+        "aliases": aliases,
+        "fuzzy": fuzzy,
+    }
+
+
+# -----------------------
+# Oppslag
+# -----------------------
+
+class EntityIndex:
+    """Runtime-oppslag mot en ferdigbygget indeks."""
+
+    def __init__(self, data: Dict[str, Any], project_root: Path = PROJECT_ROOT):
+        self.data = data
+        self.project_root = project_root
+        self.entities: Dict[str, Dict[str, Any]] = data["entities"]
+        self.aliases: Dict[str, str] = data["aliases"]
+        self.fuzzy: Dict[str, str] = data.get("fuzzy", {})
+        self._trie = build_trie(self.aliases)
+        self._documents: Dict[str, Any] = {}
+
+    @classmethod
+    def load(
+        cls,
+        manifest: Optional[Dict[str, Any]] = None,
+        index_path: Path = DEFAULT_INDEX_PATH,
+        project_root: Path = PROJECT_ROOT,
+        rebuild_if_stale: bool = True,
+    ) -> "EntityIndex":
+        """Laster indeksen fra disk; bygger (og lagrer) den på nytt hvis kildene er endret."""
+
+        if manifest is None:
+            with DEFAULT_MANIFEST.open("r", encoding="utf-8") as f:
+                manifest = json.load(f)
+
+        data = None
+        if index_path.exists():
+            with index_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != INDEX_FORMAT:
+                data = None
+            elif rebuild_if_stale and is_stale(data, manifest, project_root):
+                data = None
+
+        if data is None:
+            data = build_entity_index(manifest, project_root)
+            save_index(data, index_path)
+        return cls(data, project_root)
+
+    def resolve(self, mention: str) -> Optional[str]:
+        """Kanonisk ID for en omtale ("Pressure Pump P2", "k02", "switch.pressure_pump_contactor").
+
+        Uten eksakt treff prøves fuzzy-nøklene; treffet brukes bare hvis det er entydig.
+        """
+
+        norm = normalize(mention)
+        exact = self.aliases.get(norm)
+        if exact is not None:
+            return exact
+        found = {self.fuzzy[key] for key in fuzzy_keys(norm) if key in self.fuzzy}
+        return found.pop() if len(found) == 1 else None
+
+    def find_mentions(self, text: str) -> List[str]:
+        """Alle entiteter nevnt i fritekst, i rekkefølge, uten duplikater."""
+
+        seen: Dict[str, None] = {}
+        for canonical in scan_trie(self._trie, text):
+            seen.setdefault(canonical, None)
+        return list(seen)
+
+    def entity(self, canonical: str) -> Optional[Dict[str, Any]]:
+        return self.entities.get(canonical)
+
+    def locations(self, mention: str, model: Optional[str] = None) -> Dict[str, List[str]]:
+        canonical = self.resolve(mention) or mention
+        entity = self.entities.get(canonical)
+        if entity is None:
+            return {}
+        if model is None:
+            return entity["locations"]
+        return {model: entity["locations"].get(model, [])}
+
+    def subtrees(self, mention: str, model: Optional[str] = None) -> List[Tuple[str, str, Any]]:
+        """(modell, JSON-peker, node) for hver forekomst – hentes direkte uten skanning."""
+
+        result = []
+        for model_id, pointers in self.locations(mention, model).items():
+            document = self._document(model_id)
+            if document is None:
+                continue
+            for pointer in pointers:
+                result.append((model_id, pointer, resolve_pointer(document, pointer)))
+        return result
+
+    def _document(self, model_id: str) -> Any:
+        if model_id not in self._documents:
+            path = None
+            if model_id.startswith("knowledge/"):
+                path = self.project_root / (model_id + ".json")
+            else:
+                for entry in self.data.get("models", {}).values():
+                    if entry["id"] == model_id:
+                        path = self.project_root / entry["path"]
+            if path is None or not path.exists():
+                self._documents[model_id] = None
+            else:
+                with path.open("r", encoding="utf-8") as f:
+                    self._documents[model_id] = json.load(f)
+        return self._documents[model_id]
+
+
+def resolve_pointer(document: Any, pointer: str) -> Any:
+    node = document
+    for part in pointer.split("/")[1:]:
+        part = part.replace("~1", "/").replace("~0", "~")
+        node = node[int(part)] if isinstance(node, list) else node[part]
+    return node
+
+
+def is_stale(data: Dict[str, Any], manifest: Dict[str, Any], project_root: Path = PROJECT_ROOT) -> bool:
+    current = {
+        str(p.relative_to(project_root).as_posix()): _sha256(p)
+        for p in source_files(manifest, project_root)
+        if p.exists()
+    }
+    return current != data.get("sources")
+
+
+def save_index(data: Dict[str, Any], index_path: Path = DEFAULT_INDEX_PATH) -> None:
+    """Skriver til en tmp-fil og bytter den inn, så lesere aldri ser en halv indeks."""
+
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = index_path.with_suffix(index_path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, index_path)
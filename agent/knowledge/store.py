@@ -0,0 +1,338 @@
+"""Spørrbar kunnskapsbase over knowledge/*.json.
+
+Modulene fra generate_knowledge.py har fri, ulik struktur. build_knowledge_db()
+flater dem ut til én SQLite-tabell:
+
+    facts(module, json_path, parent_path, path_key, key, value, type)
+
+  json_path   "components.water_tanks[1].capacity"
+  parent_path "components.water_tanks[1]"      (objektet verdien tilhører)
+  path_key    "components.water_tanks.capacity" (uten indekser – indeksert)
+
+Tekstverdier legges i en FTS5-tabell (facts_fts). KnowledgeStore spør med
+faste, parametriserte SQL-setninger (sqlite3 cacher de preparerte setningene
+per tilkobling), så et oppslag blir et indeksoppslag i stedet for å parse og
+gå gjennom JSON-filene.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.logging_utils import log
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_KNOWLEDGE_DIR = PROJECT_ROOT / "knowledge"
+DEFAULT_DB_PATH = PROJECT_ROOT / ".cache" / "knowledge.sqlite"
+DB_FORMAT = 1
+
+_FTS_TOKEN = re.compile(r"[^\W_]+", re.UNICODE)
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE sources (module TEXT PRIMARY KEY, path TEXT NOT NULL, sha256 TEXT NOT NULL);
+CREATE TABLE facts (
+    id INTEGER PRIMARY KEY,
+    module TEXT NOT NULL,
+    json_path TEXT NOT NULL,
+    parent_path TEXT NOT NULL,
+    path_key TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    type TEXT NOT NULL
+);
+CREATE INDEX facts_path_key ON facts (path_key);
+CREATE INDEX facts_parent ON facts (module, parent_path);
+CREATE INDEX facts_json_path ON facts (module, json_path);
+CREATE INDEX facts_key ON facts (key);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE facts_fts USING fts5(
+    value, content='facts', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+# Faste spørringer; bare parametrene varierer.
+SQL_BY_PATH = (
+    "SELECT module, json_path, key, value, type FROM facts "
+    "WHERE (path_key = ? OR path_key >= ? AND path_key < ?) ORDER BY module, id LIMIT ?"
+)
+SQL_BY_PATH_MODULE = (
+    "SELECT module, json_path, key, value, type FROM facts "
+    "WHERE (path_key = ? OR path_key >= ? AND path_key < ?) AND module = ? ORDER BY id LIMIT ?"
+)
+SQL_BY_KEY = "SELECT module, json_path, key, value, type FROM facts WHERE key = ? ORDER BY module, id LIMIT ?"
+SQL_SEARCH = (
+    "SELECT f.module, f.json_path, f.key, f.value, f.type, f.parent_path "
+    "FROM facts_fts JOIN facts f ON f.id = facts_fts.rowid "
+    "WHERE facts_fts MATCH ? ORDER BY bm25(facts_fts) LIMIT ?"
+)
+SQL_SEARCH_LIKE = (
+    "SELECT module, json_path, key, value, type, parent_path FROM facts "
+    "WHERE type = 'string' AND value LIKE ? ESCAPE '\\' ORDER BY module, id LIMIT ?"
+)
+SQL_SIBLINGS = (
+    "SELECT module, json_path, key, value, type FROM facts "
+    "WHERE module = ? AND parent_path = ? ORDER BY id"
+)
+SQL_SUBTREE = (
+    "SELECT json_path, value, type FROM facts "
+    "WHERE module = ? AND json_path >= ? AND json_path < ? ORDER BY id"
+)
+SQL_MODULES = "SELECT module, path FROM sources ORDER BY module"
+
+
+def _sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _value_type(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    return "string"
+
+
+def _prefix_end(prefix: str) -> str:
+    """Øvre grense for prefikssøk med indeks (prefix <= x < prefix_end)."""
+
+    return prefix + "\uffff"
+
+
+def flatten(node: Any, path: str = "", path_key: str = "", key: str = "", parent: str = "") -> Iterator[Tuple[str, str, str, str, Optional[str], str]]:
+    """(json_path, parent_path, path_key, key, value, type) for hver bladverdi.
+
+    Elementer i lister av skalarer får objektet rundt listen som parent, så
+    f.eks. features[0] blir søsken av name/type på samme pumpe.
+    """
+
+    if isinstance(node, dict):
+        for k, v in node.items():
+            k = str(k)
+            yield from flatten(v, f"{path}.{k}" if path else k, f"{path_key}.{k}" if path_key else k, k, path)
+    elif isinstance(node, list):
+        for i, v in enumerate(node):
+            yield from flatten(v, f"{path}[{i}]", path_key, key, parent)
+    else:
+        if isinstance(node, bool):
+            value = "true" if node else "false"
+        elif node is None:
+            value = None
+        else:
+            value = str(node)
+        yield path, parent, path_key, key, value, _value_type(node)
+
+
+def fts5_available() -> bool:
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+def source_hashes(knowledge_dir: Path = DEFAULT_KNOWLEDGE_DIR) -> Dict[str, str]:
+    return {path.stem: _sha256(path) for path in sorted(knowledge_dir.glob("*.json"))}
+
+
+def build_knowledge_db(knowledge_dir: Path = DEFAULT_KNOWLEDGE_DIR, db_path: Path = DEFAULT_DB_PATH) -> Dict[str, int]:
+    """Bygger databasen fra bunnen (skriver til tmp-fil og bytter atomisk)."""
+
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = db_path.with_suffix(db_path.suffix + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    use_fts = fts5_available()
+    conn = sqlite3.connect(str(tmp_path))
+    modules = 0
+    rows = 0
+    try:
+        conn.executescript(SCHEMA)
+        if use_fts:
+            conn.executescript(FTS_SCHEMA)
+        conn.execute("INSERT INTO meta VALUES ('format', ?)", (str(DB_FORMAT),))
+        conn.execute("INSERT INTO meta VALUES ('fts5', ?)", ("1" if use_fts else "0",))
+
+        for path in sorted(knowledge_dir.glob("*.json")):
+            try:
+                with path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                log("Skipping knowledge module", file=path.name, error=str(e))
+                continue
+            module = path.stem
+            conn.execute(
+                "INSERT INTO sources VALUES (?, ?, ?)",
+                (module, path.relative_to(knowledge_dir.parent).as_posix(), _sha256(path)),
+            )
+            batch = [(module,) + row for row in flatten(data)]
+            conn.executemany(
+                "INSERT INTO facts (module, json_path, parent_path, path_key, key, value, type) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+            modules += 1
+            rows += len(batch)
+
+        if use_fts:
+            conn.execute(
+                "INSERT INTO facts_fts (rowid, value) SELECT id, value FROM facts WHERE type = 'string'"
+            )
+            conn.execute("INSERT INTO facts_fts (facts_fts) VALUES ('optimize')")
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+    tmp_path.replace(db_path)
+    return {"modules": modules, "facts": rows, "fts5": int(use_fts)}
+
+
+def is_stale(db_path: Path = DEFAULT_DB_PATH, knowledge_dir: Path = DEFAULT_KNOWLEDGE_DIR) -> bool:
+    if not db_path.exists():
+        return True
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        fmt = conn.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        if fmt is None or fmt[0] != str(DB_FORMAT):
+            return True
+        stored = dict(conn.execute("SELECT module, sha256 FROM sources"))
+    except sqlite3.DatabaseError:
+        return True
+    finally:
+        conn.close()
+    return stored != source_hashes(knowledge_dir)
+
+
+def fts_query(text: str, any_terms: bool = False) -> str:
+    """Gjør fritekst om til en trygg FTS5-spørring (hvert ord i anførselstegn)."""
+
+    tokens = _FTS_TOKEN.findall(text)
+    return (" OR " if any_terms else " ").join(f'"{t}"' for t in tokens)
+
+
+def _like_pattern(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _rows(cursor) -> List[Dict[str, Any]]:
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
+
+
+class KnowledgeStore:
+    """Skrivebeskyttet oppslag mot knowledge-databasen."""
+
+    def __init__(self, db_path: Path = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(
+            f"file:{db_path}?mode=ro", uri=True, check_same_thread=False, cached_statements=64
+        )
+        self.fts5 = self.conn.execute("SELECT value FROM meta WHERE key = 'fts5'").fetchone() == ("1",)
+
+    @classmethod
+    def open(
+        cls,
+        db_path: Path = DEFAULT_DB_PATH,
+        knowledge_dir: Path = DEFAULT_KNOWLEDGE_DIR,
+        rebuild_if_stale: bool = True,
+    ) -> "KnowledgeStore":
+        """Åpner databasen; bygger den først hvis den mangler eller kildene er endret."""
+
+        if not db_path.exists() or (rebuild_if_stale and is_stale(db_path, knowledge_dir)):
+            build_knowledge_db(knowledge_dir, db_path)
+        return cls(db_path)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def modules(self) -> List[Dict[str, Any]]:
+        return _rows(self.conn.execute(SQL_MODULES))
+
+    def by_path(self, path_key: str, module: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+        """Alle verdier under en sti uten indekser, f.eks. "components.pumps"."""
+
+        params = (path_key, path_key + ".", _prefix_end(path_key + "."))
+        if module is None:
+            return _rows(self.conn.execute(SQL_BY_PATH, params + (limit,)))
+        return _rows(self.conn.execute(SQL_BY_PATH_MODULE, params + (module, limit)))
+
+    def by_key(self, key: str, limit: int = 200) -> List[Dict[str, Any]]:
+        return _rows(self.conn.execute(SQL_BY_KEY, (key, limit)))
+
+    def search(self, text: str, limit: int = 20, any_terms: bool = False) -> List[Dict[str, Any]]:
+        """Fulltekstsøk i tekstverdier, rangert med bm25."""
+
+        if self.fts5:
+            query = fts_query(text, any_terms)
+            if not query:
+                return []
+            return _rows(self.conn.execute(SQL_SEARCH, (query, limit)))
+        return _rows(self.conn.execute(SQL_SEARCH_LIKE, (_like_pattern(text), limit)))
+
+    def siblings(self, module: str, parent_path: str) -> List[Dict[str, Any]]:
+        """Alle verdier i samme objekt (f.eks. capacity ved siden av type)."""
+
+        return _rows(self.conn.execute(SQL_SIBLINGS, (module, parent_path)))
+
+    def attribute(self, subject: str, key: str, module_prefix: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Verdien `key` på objektene som omtaler `subject`.
+
+        attribute("pressure tank", "capacity") finner objektene hvor en tekstverdi
+        matcher "pressure tank" og returnerer capacity-feltet deres.
+        """
+
+        key = key.lower()
+        results = []
+        seen = set()
+        for hit in self.search(subject, limit=limit * 4):
+            if module_prefix and not hit["module"].startswith(module_prefix):
+                continue
+            anchor = (hit["module"], hit["parent_path"])
+            if anchor in seen:
+                continue
+            seen.add(anchor)
+            for row in self.siblings(*anchor):
+                if key in row["key"].lower():
+                    row["matched"] = hit["json_path"]
+                    results.append(row)
+            if len(results) >= limit:
+                break
+        return results[:limit]
+
+    def fields(self, module: str, json_path: str = "") -> Dict[str, Any]:
+        """Alle bladverdier under json_path som {relativ sti: verdi}."""
+
+        rows = self.conn.execute(SQL_SUBTREE, (module, json_path, _prefix_end(json_path)))
+        result: Dict[str, Any] = {}
+        for path, value, vtype in rows:
+            rest = path[len(json_path):]
+            if json_path and rest and rest[0] not in ".[":
+                continue  # "pumps" skal ikke treffe "pumps_extra"
+            result[rest.lstrip(".")] = _decode(value, vtype)
+        return result
+
+
+def _decode(value: Optional[str], vtype: str) -> Any:
+    if vtype == "null":
+        return None
+    if vtype == "boolean":
+        return value == "true"
+    if vtype == "number":
+        number = float(value)
+        return int(number) if number.is_integer() and "." not in value and "e" not in value.lower() else number
+    return value
@@ -0,0 +1,432 @@
+"""Modeller og manifest med hot reload.
+
+ModelStore holder et uforanderlig ModelSnapshot (manifest, parsede modeller og
+avledede indekser). reload() – manuelt eller fra watcher-tråden – gjør bare
+arbeid for filene som faktisk er endret:
+
+  1. stat (mtime/størrelse) -> sha256 bare for kandidater -> parse bare endrede
+  2. validering mot models/schemas for de endrede filene
+  3. strukturell diff mot forrige versjon
+  4. bygger bare de avledede indeksene som avhenger av endrede modeller
+     (KG-naboliste, entitetsindeks, retrieval-chunks – chunks gjenbrukes
+     for seksjoner diffen ikke berører)
+  5. publiserer nytt snapshot med én referansetilordning
+
+Lesere tar `store.snapshot` og bruker det uten lås (RCU): et snapshot endres
+aldri etter publisering, så en leser ser alltid én konsistent versjon.
+Feiler parsing eller validering, beholdes forrige snapshot.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from utils.logging_utils import log
+from utils.metrics import counter, traced
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SCHEMAS_DIR = PROJECT_ROOT / "models" / "schemas"
+
+# Samme navn som tools/validate_models.py.
+SCHEMA_FILES: Dict[str, str] = {
+    "api_contract": "api_contract_schema.json",
+    "digital_twin": "digital_twin_schema.json",
+    "knowledge_graph": "knowledge_graph_schema.json",
+    "master_system_model": "master_system_model_schema.json",
+    "manifest": "manifest_schema.json",
+}
+
+MANIFEST_KEY = "manifest"
+
+
+# -----------------------
+# Snapshot
+# -----------------------
+
+@dataclass(frozen=True)
+class FileState:
+    path: Path
+    mtime_ns: int
+    size: int
+    sha256: str
+
+
+@dataclass(frozen=True)
+class ModelSnapshot:
+    """Én publisert versjon. Skal behandles som skrivebeskyttet."""
+
+    version: int
+    manifest: Dict[str, Any]
+    models: Dict[str, Any]
+    files: Dict[str, FileState]
+    derived: Dict[str, Any]
+    loaded_at: float = field(default_factory=time.time)
+
+    def index(self, name: str) -> Any:
+        return self.derived.get(name)
+
+
+@dataclass(frozen=True)
+class ReloadResult:
+    version: int
+    changed: FrozenSet[str]
+    diffs: Dict[str, List[Dict[str, str]]]
+    rebuilt: Tuple[str, ...]
+    duration_ms: float
+
+
+# -----------------------
+# Strukturell diff
+# -----------------------
+
+def _pointer_part(part: Any) -> str:
+    return str(part).replace("~", "~0").replace("/", "~1")
+
+
+def _id_list(value: Any) -> bool:
+    return (
+        isinstance(value, list)
+        and bool(value)
+        and all(isinstance(item, dict) and isinstance(item.get("id"), str) for item in value)
+    )
+
+
+def structural_diff(old: Any, new: Any, path: str = "") -> List[Dict[str, str]]:
+    """Endringer som [{"op": add|remove|replace, "path": JSON-peker}].
+
+    Lister av objekter med "id" sammenlignes på id (ikke posisjon), så et nytt
+    element midt i listen gir én "add" og ikke en kaskade av "replace".
+    """
+
+    if old is new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in old.keys() - new.keys():
+            changes.append({"op": "remove", "path": f"{path}/{_pointer_part(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_pointer_part(key)}"
+            if key not in old:
+                changes.append({"op": "add", "path": child})
+            else:
+                changes.extend(structural_diff(old[key], value, child))
+        return changes
+    if _id_list(old) and _id_list(new):
+        old_by_id = {item["id"]: item for item in old}
+        new_ids = set()
+        changes = []
+        for i, item in enumerate(new):
+            new_ids.add(item["id"])
+            child = f"{path}/{i}"
+            if item["id"] not in old_by_id:
+                changes.append({"op": "add", "path": child})
+            else:
+                changes.extend(structural_diff(old_by_id[item["id"]], item, child))
+        for i, item in enumerate(old):
+            if item["id"] not in new_ids:
+                changes.append({"op": "remove", "path": f"{path}/{i}"})
+        return changes
+    if isinstance(old, list) and isinstance(new, list):
+        changes = []
+        for i in range(max(len(old), len(new))):
+            child = f"{path}/{i}"
+            if i >= len(old):
+                changes.append({"op": "add", "path": child})
+            elif i >= len(new):
+                changes.append({"op": "remove", "path": child})
+            else:
+                changes.extend(structural_diff(old[i], new[i], child))
+        return changes
+    if old != new or type(old) is not type(new):
+        return [{"op": "replace", "path": path}]
+    return []
+
+
+# -----------------------
+# Avledede indekser
+# -----------------------
+
+def build_kg_adjacency(models: Dict[str, Any]) -> Dict[str, Dict[str, List[Tuple[str, str]]]]:
+    """{"out": {node: [(til, type)]}, "in": {node: [(fra, type)]}} fra knowledge graph."""
+
+    out: Dict[str, List[Tuple[str, str]]] = {}
+    incoming: Dict[str, List[Tuple[str, str]]] = {}
+    graph = models.get("knowledge_graph") or {}
+    for node in graph.get("nodes", []):
+        out.setdefault(node["id"], [])
+        incoming.setdefault(node["id"], [])
+    for edge in graph.get("edges", []):
+        out.setdefault(edge["from"], []).append((edge["to"], edge.get("type", "")))
+        incoming.setdefault(edge["to"], []).append((edge["from"], edge.get("type", "")))
+    return {"out": out, "in": incoming}
+
+
+def _chunk_sections(model_key: str, data: Any) -> Dict[str, Any]:
+    """Chunk-id -> subtre: én chunk per seksjon på nivå 2 (f.eks. /physical_layer/pumps)."""
+
+    sections = {}
+    if not isinstance(data, dict):
+        return {f"{model_key}:": data}
+    for key, value in data.items():
+        top = f"/{_pointer_part(key)}"
+        if isinstance(value, dict) and value:
+            for sub, subvalue in value.items():
+                sections[f"{model_key}:{top}/{_pointer_part(sub)}"] = subvalue
+        else:
+            sections[f"{model_key}:{top}"] = value
+    return sections
+
+
+def _chunk(chunk_id: str, value: Any) -> Dict[str, str]:
+    model_key, pointer = chunk_id.split(":", 1)
+    return {
+        "id": chunk_id,
+        "model": model_key,
+        "pointer": pointer,
+        "text": json.dumps(value, ensure_ascii=False, separators=(",", ":")),
+    }
+
+
+def build_retrieval_chunks(
+    models: Dict[str, Any],
+    previous: Optional[Dict[str, Dict[str, str]]] = None,
+    diffs: Optional[Dict[str, List[Dict[str, str]]]] = None,
+) -> Dict[str, Dict[str, str]]:
+    """Chunks for retrieval. Med previous/diffs lages bare berørte chunks på nytt."""
+
+    chunks: Dict[str, Dict[str, str]] = {}
+    for model_key, data in models.items():
+        touched = None
+        if previous is not None and diffs is not None:
+            touched = [change["path"] for change in diffs.get(model_key, [])]
+        for chunk_id, value in _chunk_sections(model_key, data).items():
+            pointer = chunk_id.split(":", 1)[1]
+            reuse = (
+                touched is not None
+                and chunk_id in previous
+                and not any(p == pointer or p.startswith(pointer + "/") or pointer.startswith(p + "/") or p == ""
+                            for p in touched)
+            )
+            chunks[chunk_id] = previous[chunk_id] if reuse else _chunk(chunk_id, value)
+    return chunks
+
+
+def _build_entity_index(store: "ModelStore", models: Dict[str, Any], manifest: Dict[str, Any]) -> Any:
+    from knowledge.entity_index import EntityIndex, build_entity_index
+
+    return EntityIndex(build_entity_index(manifest, store.project_root, loaded=models), store.project_root)
+
+
+# Navn -> modeller indeksen avhenger av ("manifest" betyr alltid ombygging).
+DERIVED_DEPENDENCIES: Dict[str, FrozenSet[str]] = {
+    "kg_adjacency": frozenset({"knowledge_graph"}),
+    "entity_index": frozenset({"knowledge_graph", "master_system_model", "digital_twin"}),
+    "retrieval_chunks": frozenset({"knowledge_graph", "master_system_model", "digital_twin", "api_contract"}),
+}
+
+
+# -----------------------
+# Store
+# -----------------------
+
+def _sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class ModelLoadError(Exception):
+    pass
+
+
+class ModelStore:
+    """Versjonerte snapshots av manifest + modeller, med inkrementell reload."""
+
+    def __init__(self, manifest_path, project_root: Path = PROJECT_ROOT, validate: bool = True):
+        self.manifest_path = Path(manifest_path).resolve()
+        self.project_root = project_root
+        self.validate = validate
+        self.last_error: Optional[str] = None
+        self._write_lock = threading.Lock()
+        self._subscribers: List[Callable[[ModelSnapshot, ReloadResult], None]] = []
+        self._validators: Dict[str, Tuple[str, Any]] = {}
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._snapshot = ModelSnapshot(version=0, manifest={}, models={}, files={}, derived={})
+        if self.reload() is None:
+            raise ModelLoadError(self.last_error)
+
+    @property
+    def snapshot(self) -> ModelSnapshot:
+        """Gjeldende versjon. Lesere holder referansen så lenge de trenger den."""
+
+        return self._snapshot
+
+    def subscribe(self, callback: Callable[[ModelSnapshot, ReloadResult], None]) -> None:
+        self._subscribers.append(callback)
+
+    # -- reload --------------------------------------------------------
+
+    def _model_paths(self, manifest: Dict[str, Any]) -> Dict[str, Path]:
+        paths = {MANIFEST_KEY: self.manifest_path}
+        for key, entry in manifest.get("models", {}).items():
+            if isinstance(entry, dict) and entry.get("path"):
+                paths[key] = self.project_root / entry["path"]
+        return paths
+
+    def _stat_changed(self, paths: Dict[str, Path], old: Dict[str, FileState]) -> Dict[str, FileState]:
+        """Ny FileState for filer der stat er endret; sha256 regnes bare for disse.
+
+        Kalleren sammenligner sha256 for å skille innholdsendring fra "touch".
+        """
+
+        changed = {}
+        for key, path in paths.items():
+            st = path.stat()
+            prev = old.get(key)
+            if prev is not None and prev.path == path and prev.mtime_ns == st.st_mtime_ns and prev.size == st.st_size:
+                continue
+            changed[key] = FileState(path, st.st_mtime_ns, st.st_size, _sha256(path))
+        return changed
+
+    def _validator(self, key: str) -> Any:
+        filename = SCHEMA_FILES.get(key)
+        if filename is None:
+            return None
+        schema_path = SCHEMAS_DIR / filename
+        if not schema_path.exists():
+            return None
+        digest = _sha256(schema_path)
+        cached = self._validators.get(key)
+        if cached and cached[0] == digest:
+            return cached[1]
+        try:
+            from jsonschema import Draft202012Validator
+        except ImportError:
+            return None
+        with schema_path.open("r", encoding="utf-8") as f:
+            validator = Draft202012Validator(json.load(f))
+        self._validators[key] = (digest, validator)
+        return validator
+
+    def _parse(self, key: str, state: FileState) -> Any:
+        with state.path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        if self.validate:
+            validator = self._validator(key)
+            if validator is not None:
+                error = next(iter(validator.iter_errors(data)), None)
+                if error is not None:
+                    location = "/".join(str(p) for p in error.path) or "<root>"
+                    raise ModelLoadError(f"{state.path.name}: {location}: {error.message}")
+        return data
+
+    @traced("models.reload")
+    def reload(self) -> Optional[ReloadResult]:
+        """Laster inn endrede filer og publiserer nytt snapshot.
+
+        Returnerer None ved feil (forrige snapshot beholdes, se last_error),
+        og et ReloadResult med tomt `changed` hvis ingenting er endret.
+        """
+
+        with self._write_lock:
+            start = time.perf_counter()
+            old = self._snapshot
+            try:
+                manifest = old.manifest
+                files = dict(old.files)
+                parsed: Dict[str, Any] = {}
+
+                manifest_change = self._stat_changed({MANIFEST_KEY: self.manifest_path}, old.files)
+                if manifest_change:
+                    state = manifest_change[MANIFEST_KEY]
+                    files[MANIFEST_KEY] = state
+                    if old.files.get(MANIFEST_KEY) is None or old.files[MANIFEST_KEY].sha256 != state.sha256:
+                        manifest = self._parse(MANIFEST_KEY, state)
+                        parsed[MANIFEST_KEY] = manifest
+
+                paths = self._model_paths(manifest)
+                paths.pop(MANIFEST_KEY)
+                for key, state in self._stat_changed(paths, old.files).items():
+                    files[key] = state
+                    prev = old.files.get(key)
+                    if prev is None or prev.sha256 != state.sha256 or key not in old.models:
+                        parsed[key] = self._parse(key, state)
+            except (OSError, json.JSONDecodeError, ModelLoadError) as e:
+                self.last_error = str(e)
+                counter("models.reload_failed").inc()
+                log("Model reload failed", error=self.last_error)
+                return None
+
+            for key in [k for k in files if k != MANIFEST_KEY and k not in paths]:
+                files.pop(key)  # fjernet fra manifestet
+
+            models = {key: old.models[key] for key in paths if key in old.models and key not in parsed}
+            models.update({key: data for key, data in parsed.items() if key != MANIFEST_KEY})
+            removed = set(old.models) - set(models)
+            changed = frozenset(parsed) | frozenset(removed)
+
+            if not changed:
+                if files != old.files:
+                    # Bare stat-endringer: samme innhold, samme versjon.
+                    self._snapshot = ModelSnapshot(old.version, old.manifest, old.models, files, old.derived, old.loaded_at)
+                return ReloadResult(old.version, frozenset(), {}, (), (time.perf_counter() - start) * 1000.0)
+
+            diffs = {key: structural_diff(old.models.get(key, {}), models.get(key, {})) for key in changed - {MANIFEST_KEY}}
+            if MANIFEST_KEY in parsed:
+                diffs[MANIFEST_KEY] = structural_diff(old.manifest, manifest)
+
+            derived = dict(old.derived)
+            rebuilt = []
+            for name, deps in DERIVED_DEPENDENCIES.items():
+                if name in derived and MANIFEST_KEY not in changed and not (deps & changed):
+                    continue
+                if name == "kg_adjacency":
+                    derived[name] = build_kg_adjacency(models)
+                elif name == "entity_index":
+                    derived[name] = _build_entity_index(self, models, manifest)
+                elif name == "retrieval_chunks":
+                    derived[name] = build_retrieval_chunks(models, old.derived.get(name), diffs if name in old.derived else None)
+                rebuilt.append(name)
+
+            snapshot = ModelSnapshot(old.version + 1, manifest, models, files, derived)
+            self._snapshot = snapshot  # publisering: én atomisk tilordning
+            self.last_error = None
+            result = ReloadResult(snapshot.version, changed, diffs, tuple(rebuilt), (time.perf_counter() - start) * 1000.0)
+
+        counter("models.reloads").inc()
+        if old.version:
+            log("Models reloaded", version=snapshot.version, changed=",".join(sorted(changed)),
+                rebuilt=",".join(rebuilt), ms=f"{result.duration_ms:.1f}")
+        for callback in list(self._subscribers):
+            callback(snapshot, result)
+        return result
+
+    # -- watcher -------------------------------------------------------
+
+    def start_watcher(self, interval: float = 1.0) -> threading.Thread:
+        """Poller filene i en daemon-tråd og kaller reload() ved endring."""
+
+        if self._watcher is not None and self._watcher.is_alive():
+            return self._watcher
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:  # watcheren skal aldri dø
+                    self.last_error = str(e)
+                    log("Model watcher error", error=self.last_error)
+
+        self._watcher = threading.Thread(target=run, name="oyna-model-watcher", daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    def stop_watcher(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout)
+            self._watcher = None
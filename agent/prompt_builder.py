@@ -0,0 +1,326 @@
+"""Promptbygging med stabile prefikser per målgruppe.
+
+Systemprompt, stil og utvalgt modellkontekst er like for alle spørsmål fra
+samme målgruppe. PromptBuilder setter dem sammen én gang per målgruppe
+(og per modellversjon) til et prefiks som er byte-identisk mellom kall, slik
+at prefiks-caching hos LLM-leverandøren slår inn. Bare suffikset (historikk,
+verktøyresultater og spørsmålet) bygges per kall, innenfor et token-budsjett.
+
+Modellkontekst serialiseres kanonisk (sorterte nøkler, faste skilletegn), så
+samme modellinnhold alltid gir samme bytes. Tokentelling er memoisert.
+FakeTokenizer gjør det mulig å teste alt uten nettverk eller tiktoken.
+"""
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils.metrics import counter
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+PROMPTS_DIR = PROJECT_ROOT / "prompts"
+
+SYSTEM_PROMPT_FILE = "system_prompt.txt"
+AUDIENCE_STYLES: Dict[str, str] = {
+    "admin": "style_admin.txt",
+    "cabin_owner": "style_cabin_owner.txt",
+}
+
+# Modellkontekst per målgruppe: (modellnøkkel i manifestet, toppnivånøkler).
+AUDIENCE_CONTEXT: Dict[str, List[Tuple[str, Tuple[str, ...]]]] = {
+    "admin": [
+        ("master_system_model", ("operational_modes", "safety", "causal_graph", "io_layer")),
+        ("digital_twin", ("safety_and_failover",)),
+    ],
+    "cabin_owner": [
+        ("digital_twin", ("description", "locations")),
+        ("master_system_model", ("operational_modes",)),
+    ],
+}
+
+SECTION_SEPARATOR = "\n\n"
+QUESTION_HEADER = "Spørsmål: "
+HISTORY_HEADER = "Tidligere i samtalen:"
+
+
+# -----------------------
+# Tokenisering
+# -----------------------
+
+class FakeTokenizer:
+    """Deterministisk tokenizer for offline bruk: ord, tall og tegn er egne tokens."""
+
+    name = "fake"
+    _TOKEN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+    def encode(self, text: str) -> List[str]:
+        return self._TOKEN.findall(text)
+
+    def count(self, text: str) -> int:
+        return len(self._TOKEN.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        matches = list(self._TOKEN.finditer(text))
+        if len(matches) <= max_tokens:
+            return text
+        return text[:matches[max_tokens - 1].end()]
+
+
+class TiktokenTokenizer:
+    """tiktoken-basert telling (valgfri avhengighet)."""
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        import tiktoken
+
+        self.name = encoding
+        self._enc = tiktoken.get_encoding(encoding)
+
+    def count(self, text: str) -> int:
+        return len(self._enc.encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        tokens = self._enc.encode(text)
+        return text if len(tokens) <= max_tokens else self._enc.decode(tokens[:max_tokens])
+
+
+def get_tokenizer(encoding: Optional[str] = None):
+    """tiktoken hvis installert og ønsket, ellers FakeTokenizer."""
+
+    if encoding:
+        try:
+            return TiktokenTokenizer(encoding)
+        except ImportError:
+            pass
+    return FakeTokenizer()
+
+
+# -----------------------
+# Prompt-typer
+# -----------------------
+
+@dataclass(frozen=True)
+class PromptPrefix:
+    audience: str
+    text: str
+    tokens: int
+    sha256: str
+    model_version: Any
+
+
+@dataclass(frozen=True)
+class Prompt:
+    prefix: PromptPrefix
+    suffix: str
+    suffix_tokens: int
+    dropped: Tuple[str, ...]
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prefix.tokens + self.suffix_tokens
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Chat-format: prefikset som system-melding, suffikset som bruker-melding."""
+
+        return [
+            {"role": "system", "content": self.prefix.text},
+            {"role": "user", "content": self.suffix},
+        ]
+
+
+def canonical_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+# -----------------------
+# Builder
+# -----------------------
+
+class PromptBuilder:
+    """Bygger og cacher prefikser per målgruppe; setter sammen suffiks per kall.
+
+    `load_model(key)` returnerer parset modell for en manifestnøkkel, og
+    `model_version()` en verdi som endres når modellene endres (f.eks.
+    ModelStore.snapshot.version). Uten dem leses modellene fra disk én gang.
+    """
+
+    def __init__(
+        self,
+        manifest: Dict[str, Any],
+        tokenizer=None,
+        prompts_dir: Path = PROMPTS_DIR,
+        load_model: Optional[Callable[[str], Any]] = None,
+        model_version: Optional[Callable[[], Any]] = None,
+        count_cache_size: int = 4096,
+    ):
+        self.manifest = manifest
+        self.tokenizer = tokenizer or FakeTokenizer()
+        self.prompts_dir = Path(prompts_dir)
+        self._load_model = load_model or self._load_model_from_disk
+        self._model_version = model_version or (lambda: 0)
+        self._prefixes: Dict[str, PromptPrefix] = {}
+        self._models: Dict[str, Any] = {}
+        self.count_tokens = lru_cache(maxsize=count_cache_size)(self.tokenizer.count)
+
+    def _load_model_from_disk(self, key: str) -> Any:
+        if key not in self._models:
+            entry = self.manifest.get("models", {}).get(key)
+            if not entry:
+                self._models[key] = {}
+            else:
+                with (PROJECT_ROOT / entry["path"]).open("r", encoding="utf-8") as f:
+                    self._models[key] = json.load(f)
+        return self._models[key]
+
+    def _read_prompt(self, filename: str) -> str:
+        return (self.prompts_dir / filename).read_text(encoding="utf-8").strip()
+
+    # -- prefiks -------------------------------------------------------
+
+    def _context(self, audience: str) -> str:
+        parts = []
+        for model_key, sections in AUDIENCE_CONTEXT.get(audience, []):
+            model = self._load_model(model_key) or {}
+            selected = {name: model[name] for name in sections if name in model}
+            if selected:
+                parts.append(f"### {model_key}\n{canonical_json(selected)}")
+        return "\n".join(parts)
+
+    def prefix(self, audience: str) -> PromptPrefix:
+        """Prefiks for målgruppen; bygges på nytt bare når modellversjonen endres."""
+
+        if audience not in AUDIENCE_STYLES:
+            raise ValueError(f"Unknown audience: {audience}")
+        version = self._model_version()
+        cached = self._prefixes.get(audience)
+        if cached is not None and cached.model_version == version:
+            counter("prompt.prefix_hit").inc()
+            return cached
+
+        sections = [
+            self._read_prompt(SYSTEM_PROMPT_FILE),
+            self._read_prompt(AUDIENCE_STYLES[audience]),
+        ]
+        context = self._context(audience)
+        if context:
+            sections.append("Systemmodell (utdrag):\n" + context)
+        text = SECTION_SEPARATOR.join(sections) + SECTION_SEPARATOR
+        prefix = PromptPrefix(
+            audience=audience,
+            text=text,
+            tokens=self.tokenizer.count(text),
+            sha256=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            model_version=version,
+        )
+        self._prefixes[audience] = prefix
+        counter("prompt.prefix_build").inc()
+        return prefix
+
+    def warm(self) -> None:
+        for audience in AUDIENCE_STYLES:
+            self.prefix(audience)
+
+    def invalidate(self) -> None:
+        """Tømmer prefikser (f.eks. når prompts/-filene er endret)."""
+
+        self._prefixes.clear()
+        self._models.clear()
+
+    # -- suffiks -------------------------------------------------------
+
+    def build(
+        self,
+        audience: str,
+        question: str,
+        tool_results: Sequence[Any] = (),
+        history: Sequence[Tuple[str, str]] = (),
+        budget_tokens: int = 8192,
+    ) -> Prompt:
+        """Prefiks + suffiks innenfor budget_tokens.
+
+        Spørsmålet tas alltid med (avkortes om nødvendig); er budsjettet for
+        lite til prefikset og et spørsmål, kastes ValueError. Deretter fylles
+        budsjettet med verktøyresultater og så historikk, nyeste først;
+        det som ikke får plass, droppes og rapporteres i `dropped`.
+        Overskrifter og skilletegn regnes med i budsjettet.
+        """
+
+        prefix = self.prefix(audience)
+        available = budget_tokens - prefix.tokens
+
+        min_question = self.count_tokens(QUESTION_HEADER) + 1
+        if available < min_question:
+            raise ValueError(
+                f"budget_tokens={budget_tokens} leaves {available} tokens after the prefix "
+                f"({prefix.tokens}); the question needs at least {min_question}"
+            )
+        question_block = f"{QUESTION_HEADER}{question.strip()}"
+        q_tokens = self.count_tokens(question_block)
+        if q_tokens > available:
+            question_block = self.tokenizer.truncate(question_block, available)
+            q_tokens = self.count_tokens(question_block)
+        remaining = available - q_tokens
+
+        separator_cost = self.count_tokens(SECTION_SEPARATOR)
+        dropped: List[str] = []
+        tool_blocks: List[Tuple[int, str]] = []
+        for i in range(len(tool_results) - 1, -1, -1):
+            result = tool_results[i]
+            text = result if isinstance(result, str) else canonical_json(result)
+            block = f"Verktøyresultat {i + 1}: {text}"
+            # Første blokk i seksjonen betaler skilletegnet mot neste seksjon.
+            cost = self.count_tokens(block) + 1 + (separator_cost if not tool_blocks else 0)
+            if cost <= remaining:
+                tool_blocks.append((i, block))
+                remaining -= cost
+            else:
+                dropped.append(f"tool_result:{i + 1}")
+        tool_blocks.reverse()
+
+        history_blocks: List[Tuple[int, str]] = []
+        header_cost = self.count_tokens(HISTORY_HEADER) + 1 + separator_cost
+        for i in range(len(history) - 1, -1, -1):
+            role, text = history[i]
+            block = f"{role}: {text}"
+            cost = self.count_tokens(block) + 1 + (header_cost if not history_blocks else 0)
+            if cost <= remaining:
+                history_blocks.append((i, block))
+                remaining -= cost
+            else:
+                # Eldre historikk enn det som ikke fikk plass gir ikke mening alene.
+                dropped.extend(f"history:{j + 1}" for j in range(i, -1, -1))
+                break
+        history_blocks.reverse()
+
+        # Tokenizere er ikke alltid additive (BPE kan slå sammen over skjøter);
+        # ferdig suffiks kontrolltelles, og eldste innhold droppes til det passer.
+        while True:
+            suffix = self._assemble(history_blocks, tool_blocks, question_block)
+            suffix_tokens = self.count_tokens(suffix)
+            if suffix_tokens <= available or not (history_blocks or tool_blocks):
+                break
+            if history_blocks:
+                dropped.append(f"history:{history_blocks.pop(0)[0] + 1}")
+            else:
+                dropped.append(f"tool_result:{tool_blocks.pop(0)[0] + 1}")
+
+        if dropped:
+            counter("prompt.items_dropped").inc(len(dropped))
+        return Prompt(prefix, suffix, suffix_tokens, tuple(dropped))
+
+    @staticmethod
+    def _assemble(history_blocks, tool_blocks, question_block: str) -> str:
+        blocks = []
+        if history_blocks:
+            blocks.append(HISTORY_HEADER + "\n" + "\n".join(block for _, block in history_blocks))
+        if tool_blocks:
+            blocks.append("\n".join(block for _, block in tool_blocks))
+        blocks.append(question_block)
+        return SECTION_SEPARATOR.join(blocks)
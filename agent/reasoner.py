@@ -1,24 +1,29 @@
+from utils.metrics import traced
+
+
 class Reasoner:
     """Planlegger arbeidssteg basert på spørsmål."""
 
     def __init__(self, manifest):
         self.manifest = manifest
 
+    @traced("reasoner.plan")
     def plan(self, query: str):
         q = query.lower()
 
         if "pumpe" in q:
             return [
                 {"tool": "home_assistant", "action": "get_entity_state",
-                 "args": {"entity_id": "switch.pressure_pump_contactor"}}
+                 "args": {"entities": "switch.pressure_pump_contactor"}}
             ]
 
         if "vannforbruk" in q:
             return [
                 {"tool": "influxdb", "action": "query_latest",
-                 "args": {"bucket": "haos-oyna-waterflow"}}
+                 "args": {"bucket": "haos-oyna-waterflow", "query": "latest"}}
             ]
 
         return [
-            {"tool": "nodered", "action": "invoke_flow", "args": {"query": query}}
+            {"tool": "nodered", "action": "invoke_flow",
+             "args": {"flow": "agent_query", "payload": {"query": query}}}
         ]
\ No newline at end of file
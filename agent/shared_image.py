@@ -0,0 +1,204 @@
+"""Skrivebeskyttet modellbilde som deles mellom prosesser.
+
+build_image() skriver avledede strukturer til én fil som flere
+agent-prosesser kan mappe inn (np.memmap) uten å kopiere: sidene ligger én
+gang i page cache uansett hvor mange workere som leser dem.
+
+Innhold:
+    kg_indptr / kg_indices / kg_edge_type – knowledge graph som CSR (int32)
+    chunk_vectors                        – retrieval-chunks som L2-normaliserte
+                                           hashede ordvektorer (float32, n × dim)
+    meta (JSON)                          – node-ID-er, kanttyper, chunk-metadata
+
+Filformat: 8 byte magic, 8 byte lengde på JSON-header, header, deretter
+arrays justert til 64 byte. Headeren beskriver offset, dtype og shape.
+"""
+
+import json
+import os
+import re
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_IMAGE_PATH = PROJECT_ROOT / ".cache" / "shared_models.img"
+
+MAGIC = b"OYNAIMG1"
+_ALIGN = 64
+VECTOR_DIM = 1024
+
+_WORD = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def hashed_vector(text: str, dim: int = VECTOR_DIM) -> np.ndarray:
+    """Ordvektor via feature hashing (crc32, stabil på tvers av prosesser)."""
+
+    vec = np.zeros(dim, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        vec[zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+    np.log1p(vec, out=vec)
+    norm = float(np.linalg.norm(vec))
+    if norm:
+        vec /= norm
+    return vec
+
+
+def _kg_csr(graph: Dict[str, Any]) -> Tuple[List[str], List[str], Dict[str, np.ndarray]]:
+    nodes = [node["id"] for node in graph.get("nodes", [])]
+    index = {node: i for i, node in enumerate(nodes)}
+    for edge in graph.get("edges", []):
+        for end in (edge["from"], edge["to"]):
+            if end not in index:
+                index[end] = len(nodes)
+                nodes.append(end)
+    edge_types = sorted({edge.get("type", "") for edge in graph.get("edges", [])})
+    type_index = {t: i for i, t in enumerate(edge_types)}
+
+    src = np.array([index[e["from"]] for e in graph.get("edges", [])], dtype=np.int32)
+    dst = np.array([index[e["to"]] for e in graph.get("edges", [])], dtype=np.int32)
+    etype = np.array([type_index[e.get("type", "")] for e in graph.get("edges", [])], dtype=np.int32)
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int32)
+    np.add.at(indptr, src + 1, 1)
+    np.cumsum(indptr, out=indptr)
+    return nodes, edge_types, {
+        "kg_indptr": indptr,
+        "kg_indices": dst[order],
+        "kg_edge_type": etype[order],
+    }
+
+
+def build_image(models: Dict[str, Any], chunks: Dict[str, Dict[str, str]], path: Path = DEFAULT_IMAGE_PATH) -> Path:
+    """Skriver bildet atomisk (tmp-fil + rename).
+
+    `chunks` er retrieval-chunks som i model_store.build_retrieval_chunks.
+    """
+
+    nodes, edge_types, arrays = _kg_csr(models.get("knowledge_graph") or {})
+    chunk_ids = sorted(chunks)
+    vectors = np.zeros((len(chunk_ids), VECTOR_DIM), dtype=np.float32)
+    for i, chunk_id in enumerate(chunk_ids):
+        vectors[i] = hashed_vector(chunks[chunk_id]["text"])
+    arrays["chunk_vectors"] = vectors
+
+    meta = {
+        "nodes": nodes,
+        "edge_types": edge_types,
+        "chunks": [{k: chunks[c][k] for k in ("id", "model", "pointer")} for c in chunk_ids],
+        "vector_dim": VECTOR_DIM,
+    }
+
+    # Første pass: beregn offsets med en header som har plass nok.
+    layout: Dict[str, Dict[str, Any]] = {}
+    header = {"meta": meta, "arrays": layout}
+    header_bytes = b""
+    for _ in range(3):
+        offset = 16 + len(header_bytes)
+        for name, array in arrays.items():
+            offset = -(-offset // _ALIGN) * _ALIGN
+            layout[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+            offset += array.nbytes
+        new_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        if len(new_bytes) == len(header_bytes):
+            break
+        header_bytes = new_bytes
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Egen tmp-fil per prosess: flere workere kan bygge om samtidig etter hot reload.
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp.open("wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+    tmp.replace(path)
+    return path
+
+
+class SharedImage:
+    """Null-kopi-visning av et modellbilde (arrays er skrivebeskyttede memmaps)."""
+
+    def __init__(self, path: Path = DEFAULT_IMAGE_PATH):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            if f.read(8) != MAGIC:
+                raise ValueError(f"{self.path}: not a shared model image")
+            length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(length).decode("utf-8"))
+        self.meta: Dict[str, Any] = header["meta"]
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, spec in header["arrays"].items():
+            shape = tuple(spec["shape"])
+            if 0 in shape:
+                self.arrays[name] = np.zeros(shape, dtype=np.dtype(spec["dtype"]))
+                continue
+            self.arrays[name] = np.memmap(self.path, dtype=np.dtype(spec["dtype"]), mode="r",
+                                          offset=spec["offset"], shape=shape)
+        self.node_index = {node: i for i, node in enumerate(self.meta["nodes"])}
+
+    def neighbors(self, node: str) -> List[Tuple[str, str]]:
+        """Utgående kanter (til, type) fra CSR."""
+
+        i = self.node_index.get(node)
+        if i is None:
+            return []
+        indptr = self.arrays["kg_indptr"]
+        start, end = int(indptr[i]), int(indptr[i + 1])
+        nodes, types = self.meta["nodes"], self.meta["edge_types"]
+        return [
+            (nodes[int(j)], types[int(t)])
+            for j, t in zip(self.arrays["kg_indices"][start:end], self.arrays["kg_edge_type"][start:end])
+        ]
+
+    def search(self, text: str, k: int = 5) -> List[Dict[str, Any]]:
+        """Nærmeste chunks (cosinus mot hashede ordvektorer)."""
+
+        matrix = self.arrays["chunk_vectors"]
+        if not len(matrix):
+            return []
+        scores = matrix @ hashed_vector(text, self.meta["vector_dim"])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self.meta["chunks"][int(i)], score=float(scores[i])) for i in top]
+
+
+def is_stale(path: Path, manifest_path) -> bool:
+    """Sann hvis bildet mangler eller manifestet/en modell er nyere enn det."""
+
+    path = Path(path)
+    if not path.exists():
+        return True
+    from manifest_loader import ManifestLoader
+
+    built = path.stat().st_mtime
+    sources = [Path(manifest_path)]
+    for entry in ManifestLoader(manifest_path).load().get("models", {}).values():
+        sources.append(PROJECT_ROOT / entry["path"])
+    return any(p.exists() and p.stat().st_mtime > built for p in sources)
+
+
+def build_from_manifest(manifest_path, path: Path = DEFAULT_IMAGE_PATH) -> Path:
+    """Bygger bildet fra modellene i manifestet (via ModelStore)."""
+
+    from model_store import ModelStore
+
+    snapshot = ModelStore(manifest_path).snapshot
+    return build_image(snapshot.models, snapshot.derived["retrieval_chunks"], path)
+
+
+def open_image(path: Optional[Path] = None) -> SharedImage:
+    return SharedImage(path or DEFAULT_IMAGE_PATH)
+
+
+def ensure_image(manifest_path, path: Path = DEFAULT_IMAGE_PATH) -> Path:
+    """Bygger bildet hvis det mangler eller er eldre enn modellene (som .cache-indeksene)."""
+
+    if is_stale(path, manifest_path):
+        build_from_manifest(manifest_path, path)
+    return path
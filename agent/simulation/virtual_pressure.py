@@ -0,0 +1,224 @@
+"""Simulator for den hydrauliske kjeden i den digitale tvillingen.
+
+    tank_6000l -> pump_p2 -> tank_pressure_150l -> distribution_network
+        ^
+    pump_p1 (fyller når nivået er lavt)
+
+Trykktanken modelleres med Boyles lov over en gasspute med forladetrykk,
+P2 følger en lineær pumpekurve og styres med cut-in/cut-out-hysterese
+(samme innstillinger som input_number.virtual_pressure_cutin/cutout).
+
+Alle scenarier simuleres samtidig: tilstanden er arrays med én verdi per
+scenario, og tidssteget er en vektorisert oppdatering. Typisk bruk er å
+sveipe cut-in/cut-out-par før et set_pressure_targets-kall.
+
+Trykk er manometertrykk i bar, volum i liter, tid i sekunder.
+"""
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+ATM_BAR = 1.01325
+
+
+def pressure_from_water(water_l, tank_l: float, precharge_bar):
+    """Manometertrykk i trykktanken gitt vannvolum (Boyles lov)."""
+
+    gas = np.maximum(tank_l - water_l, 1e-6)
+    return (np.asarray(precharge_bar) + ATM_BAR) * tank_l / gas - ATM_BAR
+
+
+def water_at_pressure(pressure_bar, tank_l: float, precharge_bar):
+    """Vannvolum i trykktanken ved gitt manometertrykk (invers av pressure_from_water)."""
+
+    return tank_l * (1.0 - (np.asarray(precharge_bar) + ATM_BAR) / (np.asarray(pressure_bar) + ATM_BAR))
+
+
+def drawdown_liters(cut_in, cut_out, tank_l: float = 150.0, precharge_bar=None):
+    """Liter som kan tappes mellom cut-out og cut-in (uttak per pumpesyklus uten tilsig)."""
+
+    cut_in = np.asarray(cut_in, dtype=np.float64)
+    if precharge_bar is None:
+        precharge_bar = cut_in - 0.2
+    return water_at_pressure(cut_out, tank_l, precharge_bar) - water_at_pressure(cut_in, tank_l, precharge_bar)
+
+
+class PressureSimulator:
+    """Vektorisert tidsstegsimulator for trykksonen."""
+
+    def __init__(
+        self,
+        pressure_tank_l: float = 150.0,
+        storage_tank_l: float = 6000.0,
+        pump_max_lps: float = 1.0,
+        pump_shutoff_bar: float = 5.5,
+        pump_power_w: float = 900.0,
+        p1_fill_lps: float = 0.4,
+        p1_start_fraction: float = 0.5,
+        min_service_bar: float = 1.5,
+        dt_s: float = 1.0,
+    ):
+        self.pressure_tank_l = pressure_tank_l
+        self.storage_tank_l = storage_tank_l
+        self.pump_max_lps = pump_max_lps
+        self.pump_shutoff_bar = pump_shutoff_bar
+        self.pump_power_w = pump_power_w
+        self.p1_fill_lps = p1_fill_lps
+        self.p1_start_fraction = p1_start_fraction
+        self.min_service_bar = min_service_bar
+        self.dt_s = dt_s
+
+    @classmethod
+    def from_digital_twin(cls, twin: Dict[str, Any], **overrides) -> "PressureSimulator":
+        """Henter tankvolumer fra oyna_digital_twin_v1 (physical_system.tanks)."""
+
+        params: Dict[str, Any] = {}
+        for tank in twin.get("physical_system", {}).get("tanks", []):
+            if tank.get("type") == "pressure_vessel":
+                params["pressure_tank_l"] = float(tank["volume_liters"])
+            elif tank.get("type") == "atmospheric_storage_tank":
+                params["storage_tank_l"] = float(tank["volume_liters"])
+        params.update(overrides)
+        return cls(**params)
+
+    def run(
+        self,
+        cut_in,
+        cut_out,
+        demand_lps,
+        duration_s: Optional[float] = None,
+        precharge_bar=None,
+        storage_start_l=None,
+        record_every: int = 0,
+    ) -> Dict[str, np.ndarray]:
+        """Simulerer alle scenarier parallelt.
+
+        cut_in, cut_out : skalar eller array (S,) – ett scenario per element.
+        demand_lps      : skalar, (T,) felles forbruksprofil eller (T, S).
+        record_every    : >0 lagrer trykk-trace hvert n-te steg (shape (T/n, S)).
+
+        Returnerer per scenario: starts, runtime_s, energy_wh, pumped_liters,
+        p_min, p_max, p_mean, below_min_service_s, storage_min_l, unmet_liters.
+        """
+
+        cut_in, cut_out = np.broadcast_arrays(
+            np.asarray(cut_in, dtype=np.float64), np.asarray(cut_out, dtype=np.float64)
+        )
+        cut_in = np.atleast_1d(cut_in).copy()
+        cut_out = np.atleast_1d(cut_out).copy()
+        scenarios = cut_in.shape[0]
+
+        demand = np.asarray(demand_lps, dtype=np.float64)
+        if demand.ndim == 0:
+            if duration_s is None:
+                raise ValueError("duration_s is required when demand_lps is a scalar")
+            steps = int(duration_s / self.dt_s)
+            demand = np.full(steps, float(demand))
+        steps = demand.shape[0] if duration_s is None else min(demand.shape[0], int(duration_s / self.dt_s))
+
+        dt = self.dt_s
+        tank = self.pressure_tank_l
+        if precharge_bar is None:
+            precharge_bar = cut_in - 0.2
+        pre_abs = np.broadcast_to(np.asarray(precharge_bar, dtype=np.float64) + ATM_BAR, (scenarios,)).copy()
+
+        # Start på cut-out med full lagertank.
+        water = tank * (1.0 - pre_abs / (cut_out + ATM_BAR))
+        storage = np.full(scenarios, self.storage_tank_l if storage_start_l is None else float(storage_start_l))
+        pump_on = np.zeros(scenarios, dtype=bool)
+        p1_on = np.zeros(scenarios, dtype=bool)
+        p1_start = self.p1_start_fraction * self.storage_tank_l
+
+        starts = np.zeros(scenarios)
+        runtime = np.zeros(scenarios)
+        pumped = np.zeros(scenarios)
+        unmet = np.zeros(scenarios)
+        below = np.zeros(scenarios)
+        p_sum = np.zeros(scenarios)
+        p_min = np.full(scenarios, np.inf)
+        p_max = np.full(scenarios, -np.inf)
+        storage_min = storage.copy()
+
+        trace = None
+        if record_every > 0:
+            trace = np.empty((steps // record_every + 1, scenarios), dtype=np.float32)
+
+        gas_constant = pre_abs * tank
+        gas = np.empty(scenarios)
+        pressure = np.empty(scenarios)
+        q = np.empty(scenarios)
+
+        for i in range(steps):
+            # Trykk fra vannvolum (Boyle)
+            np.subtract(tank, water, out=gas)
+            np.maximum(gas, 1e-6, out=gas)
+            np.divide(gas_constant, gas, out=pressure)
+            pressure -= ATM_BAR
+
+            # Hysterese-styring av P2, sperret når lagertanken er tom
+            turn_on = (pressure <= cut_in) & ~pump_on
+            pump_on = (pump_on | turn_on) & (pressure < cut_out) & (storage > 0.0)
+            starts += turn_on & pump_on
+
+            # Pumpekurve: lineært fall mot stengetrykk, begrenset av lagertank
+            np.multiply(pressure, -self.pump_max_lps / self.pump_shutoff_bar, out=q)
+            q += self.pump_max_lps
+            np.clip(q, 0.0, None, out=q)
+            q *= pump_on
+            q *= dt
+            np.minimum(q, storage, out=q)
+
+            d = demand[i] * dt
+            available = water + q
+            draw = np.minimum(d, available)
+            unmet += d - draw
+            water = available - draw
+            storage -= q
+
+            # P1 fyller lagertanken med nivåhysterese
+            p1_on = (p1_on | (storage < p1_start)) & (storage < self.storage_tank_l)
+            storage += p1_on * (self.p1_fill_lps * dt)
+            np.minimum(storage, self.storage_tank_l, out=storage)
+
+            runtime += pump_on
+            pumped += q
+            p_sum += pressure
+            np.minimum(p_min, pressure, out=p_min)
+            np.maximum(p_max, pressure, out=p_max)
+            below += pressure < self.min_service_bar
+            np.minimum(storage_min, storage, out=storage_min)
+
+            if trace is not None and i % record_every == 0:
+                trace[i // record_every] = pressure
+
+        runtime *= dt
+        below *= dt
+        result = {
+            "cut_in": cut_in,
+            "cut_out": cut_out,
+            "starts": starts,
+            "runtime_s": runtime,
+            "energy_wh": runtime * self.pump_power_w / 3600.0,
+            "pumped_liters": pumped,
+            "p_min": p_min,
+            "p_max": p_max,
+            "p_mean": p_sum / max(steps, 1),
+            "below_min_service_s": below,
+            "storage_min_l": storage_min,
+            "unmet_liters": unmet,
+        }
+        if trace is not None:
+            result["pressure_trace"] = trace[: (steps - 1) // record_every + 1] if steps else trace[:0]
+        return result
+
+    def sweep(self, cut_in_values, cut_out_values, demand_lps, min_gap_bar: float = 0.5, **kwargs) -> Dict[str, np.ndarray]:
+        """Kjører alle gyldige (cut_in, cut_out)-kombinasjoner med cut_out - cut_in >= min_gap_bar."""
+
+        ci, co = np.meshgrid(
+            np.asarray(cut_in_values, dtype=np.float64),
+            np.asarray(cut_out_values, dtype=np.float64),
+            indexing="ij",
+        )
+        valid = (co - ci) >= min_gap_bar
+        return self.run(ci[valid], co[valid], demand_lps, **kwargs)
@@ -0,0 +1,84 @@
+"""Strømmende svar fra agenten (OynaAIAgent.ask_stream).
+
+Hendelser er dict-er {"event": navn, "data": ...} i denne rekkefølgen:
+
+    plan            – valgt plan (liste med steg)
+    tool_result     – ett per steg, så snart steget er ferdig
+    summary         – {"delta": tekst}; kan komme flere ganger
+    insights        – som summary
+    recommendations – som summary
+    response        – ferdig svar, validert mot response-schemaet i kontrakten
+    done            – siste hendelse
+
+format_sse() gjør en hendelse om til server-sent events, så et
+serverlag kan videresende dem direkte.
+
+Tekstfeltene lages av en "responder": en callable som får spørsmål,
+målgruppe, plan og verktøyresultater og gir (felt, tekstbit) etter hvert
+som teksten genereres, f.eks. fra en LLM-strøm. Standard er
+summarize_results, som lager et kort sammendrag direkte fra verktøyresultatene
+og anbefalinger ut fra hvilke steg som ikke ble utført.
+"""
+
+import json
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from dispatcher import FAILURE_PREFIXES
+
+TEXT_FIELDS = ("summary", "insights", "recommendations")
+
+# Anbefaling per feiltype (FAILURE_PREFIXES) for standard-responderen.
+RECOMMENDATIONS = {
+    "Blocked:": "Kontroller driftsmodus og systemhelse (mode.get_mode, events.get_system_health) før styring forsøkes på nytt.",
+    "Unknown tool:": "Sjekk at verktøyet er konfigurert i agent_runtime.tools i manifestet.",
+    "Invalid tool input:": "Planen ga ugyldige argumenter til verktøyet; kontroller planen mot verktøyschemaet.",
+    "Invalid tool output:": "Verktøyet svarte utenfor schemaet; kontroller integrasjonen (HA/Node-RED/InfluxDB).",
+}
+NO_ACTION = "Ingen tiltak nødvendig ut fra verktøyresultatene."
+
+Responder = Callable[..., Iterator[Tuple[str, str]]]
+
+
+def event(name: str, data: Any = None) -> Dict[str, Any]:
+    return {"event": name, "data": data}
+
+
+def format_sse(evt: Dict[str, Any]) -> str:
+    """Server-sent events: `event:`- og `data:`-linjer, avsluttet med blank linje."""
+
+    data = json.dumps(evt.get("data"), ensure_ascii=False, default=str)
+    return f"event: {evt['event']}\ndata: {data}\n\n"
+
+
+def summarize_results(
+    query: str,
+    audience: str,
+    plan: Sequence[Dict[str, Any]],
+    results: Sequence[Any],
+    prompt: Any = None,
+) -> Iterator[Tuple[str, str]]:
+    """Enkel responder uten LLM: ett sammendrag per verktøyresultat, pluss anbefalinger."""
+
+    blocked = [r for r in results if isinstance(r, str) and r.startswith(FAILURE_PREFIXES)]
+    if not results:
+        yield "summary", "Ingen verktøy ble kjørt for dette spørsmålet."
+        yield "recommendations", "Omformuler spørsmålet eller angi intent og context_modules."
+        return
+    for i, (step, result) in enumerate(zip(plan, results)):
+        text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+        prefix = "" if i == 0 else " "
+        yield "summary", f"{prefix}{step['tool']}.{step['action']}: {text}"
+    if blocked:
+        yield "insights", f"{len(blocked)} av {len(results)} steg ble ikke utført."
+    kinds = [p for p in FAILURE_PREFIXES if any(r.startswith(p) for r in blocked)]
+    for i, kind in enumerate(kinds or [None]):
+        yield "recommendations", ("" if i == 0 else " ") + (RECOMMENDATIONS[kind] if kind else NO_ACTION)
+
+
+def response_status(results: List[Any]) -> str:
+    """ok | warning | error ut fra verktøyresultatene."""
+
+    failed = sum(1 for r in results if isinstance(r, str) and r.startswith(FAILURE_PREFIXES))
+    if not failed:
+        return "ok"
+    return "error" if failed == len(results) else "warning"
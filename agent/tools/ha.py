@@ -1,8 +1,10 @@
 class HomeAssistantTool:
     def execute(self, action, args):
         if action == "get_entity_state":
-            entity = args["entity_id"]
-            return f"[MOCK] HA state for {entity}"
+            entities = args["entities"]
+            if isinstance(entities, str):
+                entities = [entities]
+            return {"states": {entity: {"state": "[MOCK]", "attributes": {}} for entity in entities}}
 
         if action == "call_service":
             return f"[MOCK] Called service {args}"
@@ -2,5 +2,5 @@ class InfluxTool:
     def execute(self, action, args):
         if action == "query_latest":
             bucket = args["bucket"]
-            return f"[MOCK] Latest data from bucket {bucket}"
+            return {"result": [{"bucket": bucket, "query": args["query"], "value": "[MOCK]"}]}
         return f"Unknown InfluxDB action: {action}"
\ No newline at end of file
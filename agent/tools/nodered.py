@@ -1,5 +1,5 @@
 class NodeRedTool:
     def execute(self, action, args):
         if action == "invoke_flow":
-            return f"[MOCK] Node-RED flow invoked: {args}"
+            return {"status": "ok", "info": f"[MOCK] Node-RED flow {args['flow']} invoked"}
         return f"Unknown Node-RED action: {action}"
\ No newline at end of file
@@ -1,2 +1,86 @@
-def log(msg):
-    print(f"[AI] {msg}")
\ No newline at end of file
+"""Strukturert logging som ikke blokkerer hot-path.
+
+log() legger bare en post på en kø; en bakgrunnstråd formaterer og skriver.
+Formatet er "[AI] melding key=value ..." (eller JSON-linjer med OYNA_LOG_JSON=1).
+"""
+
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, TextIO
+
+_STOP = object()
+
+
+class StructuredLogWriter:
+    """Skriver loggposter fra en SimpleQueue i en egen daemon-tråd."""
+
+    def __init__(self, stream: Optional[TextIO] = None, as_json: bool = False):
+        self.stream = stream
+        self.as_json = as_json
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self._thread is None:
+            self._start()
+        self._queue.put(record)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="oyna-log", daemon=True)
+                self._thread.start()
+
+    def _format(self, record: Dict[str, Any]) -> str:
+        if self.as_json:
+            return json.dumps(record, ensure_ascii=False, default=str)
+        fields = " ".join(f"{k}={v}" for k, v in record.items() if k not in ("ts", "msg"))
+        return f"[AI] {record['msg']} {fields}".rstrip()
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is _STOP:
+                break
+            stream = self.stream or sys.stdout
+            try:
+                stream.write(self._format(record) + "\n")
+                # Tøm det som allerede ligger i køen før flush.
+                while True:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is _STOP:
+                        stream.flush()
+                        return
+                    stream.write(self._format(record) + "\n")
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    def close(self, timeout: float = 1.0) -> None:
+        """Skriver ut gjenværende poster og stopper tråden."""
+
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+_writer = StructuredLogWriter(as_json=os.getenv("OYNA_LOG_JSON", "") not in ("", "0", "false"))
+atexit.register(_writer.close)
+
+
+def log(msg, **fields):
+    _writer.write({"ts": time.time(), "msg": msg, **fields})
+
+
+def flush(timeout: float = 1.0) -> None:
+    _writer.close(timeout)
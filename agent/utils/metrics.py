@@ -0,0 +1,348 @@
+"""Lettvekts instrumentering av hot-path: spans, tellere og histogrammer.
+
+    from utils.metrics import span, traced, counter
+
+    with span("dispatcher.execute_plan"):
+        ...
+
+    @traced("reasoner.plan")
+    def plan(self, query): ...
+
+Er av som standard. Når den er av, returnerer span() en delt no-op og
+traced() kaller funksjonen direkte. Slå på med OYNA_METRICS=1 eller enable().
+
+Histogrammene er HDR-aktige (log-lineære bøtter, ~3 % oppløsning) over
+nanosekunder og eksporteres i Prometheus-tekstformat via render_prometheus()
+eller start_http_server().
+"""
+
+import os
+import re
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+
+_SUB_BITS = 5
+_SUB_COUNT = 1 << _SUB_BITS
+_HALF = _SUB_COUNT >> 1
+_PENDING_LIMIT = 4096
+
+# Faste grenser (sekunder) for Prometheus-bøtter: 1 µs .. 10 s.
+PROMETHEUS_BUCKETS: Tuple[float, ...] = tuple(
+    m * 10.0 ** e for e in range(-6, 1) for m in (1.0, 2.5, 5.0)
+) + (10.0,)
+
+_NAME_SANITIZE = re.compile(r"[^a-zA-Z0-9_]")
+
+_perf_ns = time.perf_counter_ns
+
+
+class _State:
+    __slots__ = ("enabled",)
+
+    def __init__(self):
+        self.enabled = os.getenv("OYNA_METRICS", "") not in ("", "0", "false")
+
+
+_state = _State()
+
+
+def enable() -> None:
+    _state.enabled = True
+
+
+def disable() -> None:
+    _state.enabled = False
+
+
+def is_enabled() -> bool:
+    return _state.enabled
+
+
+# -----------------------
+# Histogram og tellere
+# -----------------------
+
+def _bucket_index(value: int) -> int:
+    if value < _SUB_COUNT:
+        return value if value > 0 else 0
+    shift = value.bit_length() - _SUB_BITS
+    return shift * _HALF + (value >> shift)
+
+
+def _bucket_lower(index: int) -> int:
+    if index < _SUB_COUNT:
+        return index
+    shift = index // _HALF - 1
+    return (index - shift * _HALF) << shift
+
+
+def _cumulative(items: List[Tuple[int, int]], bounds_s: Tuple[float, ...]) -> List[int]:
+    # En bøtte telles under `le` bare når hele bøtta (øvre grense) er <= grensen.
+    result = []
+    position = 0
+    running = 0
+    for bound in bounds_s:
+        limit = bound * 1e9
+        while position < len(items) and _bucket_lower(items[position][0] + 1) - 1 <= limit:
+            running += items[position][1]
+            position += 1
+        result.append(running)
+    return result
+
+
+class Histogram:
+    """HDR-aktig latenshistogram i nanosekunder.
+
+    record() legger bare verdien i en buffer under en kort lås (samme lås
+    som bytter bufferen, så ingen verdi havner i en liste som allerede er
+    tømt); bøttene oppdateres samlet når bufferen er full eller ved lesing.
+    """
+
+    __slots__ = ("name", "_pending", "_pending_lock", "_counts", "count", "total_ns", "max_ns", "_lock")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._pending: List[int] = []
+        self._pending_lock = threading.Lock()
+        self._counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self._lock = threading.Lock()
+
+    def record(self, value_ns: int) -> None:
+        with self._pending_lock:
+            pending = self._pending
+            pending.append(value_ns)
+            full = len(pending) >= _PENDING_LIMIT
+        if full:
+            self._drain()
+
+    def _drain(self) -> None:
+        with self._lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            counts = self._counts
+            for value in pending:
+                index = _bucket_index(value)
+                counts[index] = counts.get(index, 0) + 1
+            self.count += len(pending)
+            self.total_ns += sum(pending)
+            top = max(pending)
+            if top > self.max_ns:
+                self.max_ns = top
+
+    def snapshot(self) -> Tuple[List[Tuple[int, int]], int, int, int]:
+        """(sorterte bøtter, count, total_ns, max_ns) etter at bufferen er tømt."""
+
+        self._drain()
+        with self._lock:
+            return sorted(self._counts.items()), self.count, self.total_ns, self.max_ns
+
+    def percentile(self, pct: float) -> int:
+        """Nedre grense for bøtta som inneholder pct-persentilen (ns)."""
+
+        items, total, _, max_ns = self.snapshot()
+        if not total:
+            return 0
+        target = pct / 100.0 * total
+        seen = 0
+        for index, count in items:
+            seen += count
+            if seen >= target:
+                return _bucket_lower(index)
+        return max_ns
+
+    def cumulative(self, bounds_s: Tuple[float, ...]) -> List[int]:
+        """Kumulative tellinger for hver grense (Prometheus `le`)."""
+
+        return _cumulative(self.snapshot()[0], bounds_s)
+
+    def reset(self) -> None:
+        with self._lock:
+            with self._pending_lock:
+                self._pending = []
+            self._counts.clear()
+            self.count = 0
+            self.total_ns = 0
+            self.max_ns = 0
+
+
+class Counter:
+    __slots__ = ("name", "value", "_lock")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        if _state.enabled:
+            with self._lock:
+                self.value += amount
+
+
+class Registry:
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        hist = self.histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(name, Histogram(name))
+        return hist
+
+    def counter(self, name: str) -> Counter:
+        c = self.counters.get(name)
+        if c is None:
+            with self._lock:
+                c = self.counters.setdefault(name, Counter(name))
+        return c
+
+    def reset(self) -> None:
+        for hist in list(self.histograms.values()):
+            hist.reset()
+        for c in list(self.counters.values()):
+            c.value = 0
+
+
+registry = Registry()
+_histograms = registry.histograms
+
+
+def counter(name: str) -> Counter:
+    return registry.counter(name)
+
+
+def histogram(name: str) -> Histogram:
+    return registry.histogram(name)
+
+
+# -----------------------
+# Spans
+# -----------------------
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("_hist", "_start")
+
+    def __init__(self, hist: Histogram):
+        self._hist = hist
+        self._start = _perf_ns()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._hist.record(_perf_ns() - self._start)
+        return False
+
+
+def span(name: str):
+    """Tidsmåler en blokk inn i histogrammet `name`."""
+
+    if not _state.enabled:
+        return _NOOP
+    hist = _histograms.get(name)
+    if hist is None:
+        hist = registry.histogram(name)
+    return _Span(hist)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Dekoratør-variant av span(); navn er default modul.funksjon."""
+
+    def decorate(func: Callable) -> Callable:
+        hist_name = name or f"{func.__module__}.{func.__qualname__}"
+        hist = registry.histogram(hist_name)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            start = _perf_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hist.record(_perf_ns() - start)
+
+        return wrapper
+
+    return decorate
+
+
+# -----------------------
+# Prometheus-eksport
+# -----------------------
+
+def _metric_name(name: str) -> str:
+    return "oyna_" + _NAME_SANITIZE.sub("_", name)
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+
+    for name, c in sorted(registry.counters.items()):
+        metric = _metric_name(name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {c.value}")
+
+    for name, hist in sorted(registry.histograms.items()):
+        items, count, total_ns, _ = hist.snapshot()
+        if not count:
+            continue
+        metric = _metric_name(name) + "_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for bound, cumulative in zip(PROMETHEUS_BUCKETS, _cumulative(items, PROMETHEUS_BUCKETS)):
+            lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{metric}_sum {total_ns / 1e9:.9f}")
+        lines.append(f"{metric}_count {count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def start_http_server(port: int = 9464, host: str = "127.0.0.1"):
+    """Starter /metrics-endepunkt i en daemon-tråd."""
+
+    # http.server importeres her så det ikke koster oppstartstid når endepunktet ikke brukes.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="oyna-metrics", daemon=True)
+    thread.start()
+    return server
@@ -1 +1,284 @@
-# Placeholder for schema utilities
+"""Kompilerte validatorer for runtime-payloads.
+
+Kontrakten i contracts/api_contract.json og verktøybeskrivelsene i
+tools/tools_*.json bruker en uformell typenotasjon:
+
+    "string  // kommentar"        -> str
+    "ok | warning | error"        -> en av literalene
+    "array<string>"               -> liste med str
+    "string | array<string>"      -> str eller liste med str
+    "object | null"               -> dict eller None
+    { "language": "...", ... }    -> nestet objekt
+
+Hver spesifikasjon kompileres én gang til en spesialisert sjekk-funksjon
+(closure) og caches i et SchemaRegistry. Interne, betrodde kall kan bruke
+assume_valid=True og hopper da over all sjekking.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_CONTRACT_PATH = PROJECT_ROOT / "contracts" / "api_contract.json"
+DEFAULT_TOOLS_DIR = PROJECT_ROOT / "tools"
+
+# check(value, path, errors) -> None; legger til feilmeldinger i errors.
+Check = Callable[[Any, str, List[str]], None]
+
+_PRIMITIVES: Dict[str, tuple] = {
+    "string": (str,),
+    "number": (int, float),
+    "integer": (int,),
+    "boolean": (bool,),
+    "object": (dict,),
+    "array": (list, tuple),
+}
+
+
+class SchemaValidationError(ValueError):
+    """Payload matcher ikke kompilert schema."""
+
+    def __init__(self, name: str, errors: List[str]):
+        self.name = name
+        self.errors = errors
+        super().__init__(f"{name}: " + "; ".join(errors))
+
+
+# -----------------------
+# Kompilering av typenotasjon
+# -----------------------
+
+def _strip_comment(spec: str) -> str:
+    return spec.split("//", 1)[0].strip()
+
+
+def _type_predicate(token: str) -> Optional[Callable[[Any], bool]]:
+    """Returnerer et predikat for én alternativ-token, eller None for literal."""
+
+    if token == "null":
+        return lambda v: v is None
+
+    if token in _PRIMITIVES:
+        types = _PRIMITIVES[token]
+        if token in ("number", "integer"):
+            # bool er en int-subklasse i Python, men ikke et tall i kontrakten.
+            return lambda v: isinstance(v, types) and not isinstance(v, bool)
+        return lambda v: isinstance(v, types)
+
+    if token.startswith("array<") and token.endswith(">"):
+        item = _compile_union(token[len("array<"):-1])
+        return lambda v: isinstance(v, (list, tuple)) and all(item(x) for x in v)
+
+    if token == "array_of_objects":
+        return lambda v: isinstance(v, (list, tuple)) and all(isinstance(x, dict) for x in v)
+
+    if token.startswith("array_of_"):
+        # f.eks. array_of_[timestamp,value] – sjekk kun at det er en liste.
+        return lambda v: isinstance(v, (list, tuple))
+
+    return None
+
+
+def _compile_union(spec: str) -> Callable[[Any], bool]:
+    predicates = []
+    literals = set()
+
+    for token in (t.strip() for t in spec.split("|")):
+        if not token:
+            continue
+        predicate = _type_predicate(token)
+        if predicate is None:
+            literals.add(token)
+        else:
+            predicates.append(predicate)
+
+    if literals and not predicates:
+        frozen = frozenset(literals)
+        return lambda v: isinstance(v, str) and v in frozen
+
+    if len(predicates) == 1 and not literals:
+        return predicates[0]
+
+    frozen = frozenset(literals)
+    preds = tuple(predicates)
+    return lambda v: (isinstance(v, str) and v in frozen) or any(p(v) for p in preds)
+
+
+def compile_spec(spec: Any) -> Check:
+    """Kompilerer en typespesifikasjon (streng, dict eller liste) til en Check."""
+
+    if isinstance(spec, dict):
+        return compile_object(spec)
+
+    if isinstance(spec, list):
+        # Liste av tillatte verdier, f.eks. "metric": ["pressure", "flow", ...]
+        allowed = frozenset(spec)
+
+        def check_enum(value: Any, path: str, errors: List[str]) -> None:
+            if value not in allowed:
+                errors.append(f"{path}: expected one of {sorted(allowed)}, got {value!r}")
+
+        return check_enum
+
+    text = _strip_comment(str(spec))
+    predicate = _compile_union(text)
+
+    def check_value(value: Any, path: str, errors: List[str]) -> None:
+        if not predicate(value):
+            got = repr(value) if isinstance(value, str) else type(value).__name__
+            errors.append(f"{path}: expected {text}, got {got}")
+
+    return check_value
+
+
+def compile_object(
+    properties: Dict[str, Any],
+    required: Iterable[str] = (),
+    allow_null: bool = False,
+) -> Check:
+    """Kompilerer et objekt-shape. Felt som ikke er required er valgfrie."""
+
+    fields = tuple((key, compile_spec(spec)) for key, spec in properties.items())
+    required = tuple(required)
+
+    def check_object(value: Any, path: str, errors: List[str]) -> None:
+        if value is None and allow_null:
+            return
+        if not isinstance(value, dict):
+            errors.append(f"{path}: expected object, got {type(value).__name__}")
+            return
+        for key in required:
+            if key not in value:
+                errors.append(f"{path}/{key}: required field missing")
+        for key, check in fields:
+            if key in value:
+                check(value[key], f"{path}/{key}", errors)
+
+    return check_object
+
+
+class CompiledSchema:
+    """Ferdig kompilert validator for én payload-type."""
+
+    __slots__ = ("name", "_check")
+
+    def __init__(self, name: str, check: Check):
+        self.name = name
+        self._check = check
+
+    def errors(self, payload: Any) -> List[str]:
+        errors: List[str] = []
+        self._check(payload, "<root>", errors)
+        return errors
+
+    def is_valid(self, payload: Any) -> bool:
+        return not self.errors(payload)
+
+    def validate(self, payload: Any, assume_valid: bool = False) -> Any:
+        """Returnerer payload uendret, eller kaster SchemaValidationError."""
+
+        if assume_valid:
+            return payload
+        errors: List[str] = []
+        self._check(payload, "<root>", errors)
+        if errors:
+            raise SchemaValidationError(self.name, errors)
+        return payload
+
+
+# -----------------------
+# Registry
+# -----------------------
+
+def _load_json(path: Path) -> Dict[str, Any]:
+    with path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compile_contract(contract: Dict[str, Any]) -> Dict[str, CompiledSchema]:
+    """Kompilerer request/response fra contracts/api_contract.json."""
+
+    compiled: Dict[str, CompiledSchema] = {}
+    for part in ("request", "response"):
+        section = contract.get(part, {})
+        check = compile_object(
+            section.get("schema", {}),
+            required=section.get("required_fields", []),
+        )
+        compiled[part] = CompiledSchema(f"contract.{part}", check)
+    return compiled
+
+
+def compile_tool(tool: Dict[str, Any]) -> Dict[str, CompiledSchema]:
+    """Kompilerer input/output for en verktøybeskrivelse (tools/tools_*.json).
+
+    Alle felt i input/output behandles som påkrevde.
+    """
+
+    name = tool.get("name", "unknown_tool")
+    compiled: Dict[str, CompiledSchema] = {}
+    for part in ("input", "output"):
+        shape = tool.get(part, {})
+        compiled[part] = CompiledSchema(f"{name}.{part}", compile_object(shape, required=shape))
+    return compiled
+
+
+class SchemaRegistry:
+    """Laster og kompilerer kontrakt- og verktøyschemas én gang."""
+
+    def __init__(self, contract_path: Path = DEFAULT_CONTRACT_PATH, tools_dir: Path = DEFAULT_TOOLS_DIR):
+        self.contract_path = Path(contract_path)
+        self.tools_dir = Path(tools_dir)
+        self._contract: Optional[Dict[str, CompiledSchema]] = None
+        self._tools: Optional[Dict[str, Dict[str, CompiledSchema]]] = None
+
+    @property
+    def contract(self) -> Dict[str, CompiledSchema]:
+        if self._contract is None:
+            self._contract = compile_contract(_load_json(self.contract_path))
+        return self._contract
+
+    @property
+    def tools(self) -> Dict[str, Dict[str, CompiledSchema]]:
+        if self._tools is None:
+            tools: Dict[str, Dict[str, CompiledSchema]] = {}
+            for path in sorted(self.tools_dir.glob("tools_*.json")):
+                data = _load_json(path)
+                tools[data.get("name", path.stem)] = compile_tool(data)
+            self._tools = tools
+        return self._tools
+
+    def validate_request(self, payload: Any, assume_valid: bool = False) -> Any:
+        return self.contract["request"].validate(payload, assume_valid)
+
+    def validate_response(self, payload: Any, assume_valid: bool = False) -> Any:
+        return self.contract["response"].validate(payload, assume_valid)
+
+    def validate_tool_input(self, tool_name: str, payload: Any, assume_valid: bool = False) -> Any:
+        if assume_valid:
+            return payload
+        return self._tool(tool_name)["input"].validate(payload)
+
+    def validate_tool_output(self, tool_name: str, payload: Any, assume_valid: bool = False) -> Any:
+        if assume_valid:
+            return payload
+        return self._tool(tool_name)["output"].validate(payload)
+
+    def _tool(self, tool_name: str) -> Dict[str, CompiledSchema]:
+        try:
+            return self.tools[tool_name]
+        except KeyError:
+            raise KeyError(f"Unknown tool schema: {tool_name}") from None
+
+
+_default_registry: Optional[SchemaRegistry] = None
+
+
+def get_registry() -> SchemaRegistry:
+    """Delt registry for prosessen (kompileres ved første bruk)."""
+
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = SchemaRegistry()
+    return _default_registry
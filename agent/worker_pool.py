@@ -0,0 +1,313 @@
+"""Prefork-workerpool for agenten med delt, skrivebeskyttet modellminne.
+
+Frontprosessen bygger modellbildet (shared_image.py) én gang og starter
+N workere. Hver worker lager sin egen OynaAIAgent og mapper bildet inn med
+np.memmap; KG-adjacency og chunk-vektorene ligger dermed én gang i page
+cache uansett antall workere, og bare små Python-strukturer (manifest,
+planer) dupliseres per prosess.
+
+Frontprosessen fordeler forespørsler til workeren med færrest utestående
+(ett rørpar per worker) og holder oversikt over hva hver worker har.
+Kollektortråden venter på svarrørene og prosess-sentinelene samtidig, så
+en worker som dør gir feil på sine forespørsler med en gang, i stedet for
+at kallere henger; den erstattes ved neste submit() fra eiertråden.
+update_health() sendes til alle workere, og en ny worker starter med siste
+kjente helsedata (ellers står den i legacy-modus).
+
+    pool = WorkerPool(4).start()
+    pool.ask("Hva er dagens forventede vannforbruk?")
+    futures = [pool.submit("retrieve", q) for q in questions]
+    pool.close()
+"""
+
+import multiprocessing as mp
+import os
+import threading
+import traceback
+from concurrent.futures import Future
+from itertools import count
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from utils.logging_utils import log
+from utils.metrics import counter
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_MANIFEST = PROJECT_ROOT / "models" / "v2" / "ai_master_manifest_v2.json"
+
+# Metoder en worker kan kjøre: navn -> funksjon(agent, *args). Resultatet må kunne pickles.
+WORKER_METHODS = {
+    "ask": lambda agent, query: agent.ask(query),
+    "ask_stream": lambda agent, query, audience=None: list(agent.ask_stream(query, audience)),
+    "retrieve": lambda agent, text, k=5: agent.retrieve(text, k),
+    "update_health": lambda agent, health: agent.update_health(health),
+}
+
+
+class WorkerError(RuntimeError):
+    """Feil fra en worker (unntaket er formatert i workeren)."""
+
+
+def _worker_main(worker_id: int, manifest_path: str, image_path: str, health, tasks, results) -> None:
+    from agent import OynaAIAgent
+
+    agent = OynaAIAgent(manifest_path)
+    agent.attach_shared_image(image_path)
+    if health is not None:
+        agent.update_health(health)
+    results.send(("ready", worker_id, os.getpid()))
+    while True:
+        try:
+            task = tasks.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        request_id, method, args = task
+        try:
+            results.send(("ok", worker_id, request_id, WORKER_METHODS[method](agent, *args)))
+        except Exception:
+            results.send(("error", worker_id, request_id, traceback.format_exc()))
+
+
+class WorkerPool:
+    """N agent-prosesser bak én front (fork der det finnes, ellers spawn).
+
+    Hver worker har egne rør for oppgaver og svar, så en worker som blir
+    drept midt i en skriving ikke kan etterlate en delt lås. Døde workere
+    erstattes bare fra eiertråden (den som kalte start()), aldri fra
+    kollektortråden: fork fra en tråd mens andre tråder holder låser kan
+    låse barneprosessen.
+    """
+
+    def __init__(
+        self,
+        n_workers: Optional[int] = None,
+        manifest_path=DEFAULT_MANIFEST,
+        image_path=None,
+        start_method: Optional[str] = None,
+    ):
+        from shared_image import DEFAULT_IMAGE_PATH
+
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.manifest_path = str(manifest_path)
+        self.image_path = Path(image_path or DEFAULT_IMAGE_PATH)
+        if start_method is None:
+            start_method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        self._ctx = mp.get_context(start_method)
+        self._workers: List[Optional[Any]] = [None] * self.n_workers
+        self._tasks: List[Any] = [None] * self.n_workers
+        self._results: List[Any] = [None] * self.n_workers
+        self._send_locks = [threading.Lock() for _ in range(self.n_workers)]
+        self._inflight: List[Dict[int, Future]] = [{} for _ in range(self.n_workers)]
+        self._dead: Set[int] = set()
+        self._ids = count()
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = self._ctx.Pipe(duplex=False)
+        self._owner: Optional[int] = None
+        self._collector: Optional[threading.Thread] = None
+        self._closing = False
+        self._health: Optional[Dict[str, Any]] = None
+
+    # -- livssyklus ---------------------------------------------------------
+
+    def start(self, rebuild_image: bool = False) -> "WorkerPool":
+        from shared_image import build_from_manifest, is_stale
+
+        if rebuild_image or is_stale(self.image_path, self.manifest_path):
+            build_from_manifest(self.manifest_path, self.image_path)
+            log("Shared model image built", path=str(self.image_path), bytes=self.image_path.stat().st_size)
+        self._owner = threading.get_ident()
+        # Workerne forkes før kollektortråden startes.
+        for worker_id in range(self.n_workers):
+            self._spawn(worker_id)
+        for results in self._results:
+            results.recv()  # "ready"
+        self._collector = threading.Thread(target=self._collect, name="oyna-worker-pool", daemon=True)
+        self._collector.start()
+        return self
+
+    def _spawn(self, worker_id: int) -> None:
+        task_r, task_w = self._ctx.Pipe(duplex=False)
+        result_r, result_w = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.manifest_path, str(self.image_path), self._health, task_r, result_w),
+            name=f"oyna-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        # Barnets ender lukkes i fronten.
+        task_r.close()
+        result_w.close()
+        self._workers[worker_id] = process
+        self._tasks[worker_id] = task_w
+        self._results[worker_id] = result_r
+
+    def respawn_dead(self) -> int:
+        """Erstatter døde workere. Må kalles fra eiertråden; submit() gjør det automatisk der."""
+
+        if threading.get_ident() != self._owner:
+            raise RuntimeError("Workers can only be respawned from the thread that started the pool")
+        with self._lock:
+            dead = sorted(self._dead)
+        for worker_id in dead:
+            with self._send_locks[worker_id]:
+                self._tasks[worker_id].close()
+                self._results[worker_id].close()
+                self._workers[worker_id].join(0)
+                self._spawn(worker_id)
+            with self._lock:
+                self._dead.discard(worker_id)
+            counter("worker_pool.restarts").inc()
+            log("Worker restarted", worker=worker_id, pid=self._workers[worker_id].pid)
+        if dead:
+            self._wake_w.send(None)  # kollektoren skal vente på de nye rørene
+        return len(dead)
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._closing = True
+        for worker_id, tasks in enumerate(self._tasks):
+            if tasks is None or worker_id in self._dead:
+                continue
+            with self._send_locks[worker_id]:
+                try:
+                    tasks.send(None)
+                except OSError:
+                    pass
+        for process in self._workers:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+        if self._collector is not None:
+            self._wake_w.send(None)
+            self._collector.join(timeout)
+        with self._lock:
+            for inflight in self._inflight:
+                for future in inflight.values():
+                    future.set_exception(WorkerError("Worker pool closed"))
+                inflight.clear()
+
+    def __enter__(self) -> "WorkerPool":
+        return self.start() if self._collector is None else self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -- forespørsler -------------------------------------------------------
+
+    def submit(self, method: str, *args) -> Future:
+        """Sender method(*args) til den levende workeren med færrest utestående forespørsler."""
+
+        if method not in WORKER_METHODS:
+            raise ValueError(f"Unknown worker method: {method}")
+        if self._collector is None or self._closing:
+            raise RuntimeError("Worker pool is not running")
+        if self._dead and threading.get_ident() == self._owner:
+            self.respawn_dead()
+        with self._lock:
+            alive = [i for i in range(self.n_workers) if i not in self._dead]
+            if not alive:
+                raise WorkerError("No live workers (respawn_dead() must be called from the owner thread)")
+            worker_id = min(alive, key=lambda i: len(self._inflight[i]))
+        return self._submit_to(worker_id, method, args)
+
+    def update_health(self, health: Dict[str, Any]) -> List[Future]:
+        """Sender helsedata til alle levende workere; nye workere starter med siste kjente."""
+
+        if self._collector is None or self._closing:
+            raise RuntimeError("Worker pool is not running")
+        self._health = dict(health)
+        with self._lock:
+            alive = [i for i in range(self.n_workers) if i not in self._dead]
+        return [self._submit_to(worker_id, "update_health", (self._health,)) for worker_id in alive]
+
+    def _submit_to(self, worker_id: int, method: str, args: tuple) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if worker_id in self._dead:
+                # Døde mellom valg og registrering; kollektoren har allerede ryddet.
+                future.set_exception(WorkerError(f"Worker {worker_id} died"))
+                return future
+            request_id = next(self._ids)
+            self._inflight[worker_id][request_id] = future
+        # Sendingen kan blokkere når røret er fullt; den holder derfor bare workerens egen lås.
+        with self._send_locks[worker_id]:
+            try:
+                self._tasks[worker_id].send((request_id, method, args))
+            except OSError:
+                pass  # workeren er død; kollektoren feiler forespørselen
+        counter("worker_pool.requests").inc()
+        return future
+
+    def ask(self, query: str, timeout: Optional[float] = None) -> Any:
+        return self.submit("ask", query).result(timeout)
+
+    def map(self, method: str, items: Iterable[Any], timeout: Optional[float] = None) -> List[Any]:
+        futures = [self.submit(method, item) for item in items]
+        return [f.result(timeout) for f in futures]
+
+    def pids(self) -> List[int]:
+        return [p.pid for p in self._workers if p is not None]
+
+    # -- front --------------------------------------------------------------
+
+    def _collect(self) -> None:
+        while True:
+            with self._lock:
+                if self._closing and not any(self._inflight):
+                    return
+                live = [i for i in range(self.n_workers) if i not in self._dead]
+            readers = {self._results[i]: i for i in live}
+            sentinels = {self._workers[i].sentinel: i for i in live}
+            ready = wait([self._wake_r, *readers, *sentinels], timeout=1.0)
+            if self._wake_r in ready:
+                self._wake_r.recv()
+            for conn in ready:
+                if conn in readers:
+                    self._receive(readers[conn])
+            # Svar sendt rett før workeren døde er alt lest over; resten feiles.
+            for conn in ready:
+                if conn in sentinels:
+                    self._worker_died(sentinels[conn])
+
+    def _receive(self, worker_id: int) -> None:
+        conn = self._results[worker_id]
+        try:
+            while conn.poll():
+                self._deliver(conn.recv())
+        except (EOFError, OSError):
+            pass
+
+    def _deliver(self, message) -> None:
+        kind, worker_id = message[0], message[1]
+        if kind == "ready":
+            return
+        request_id, payload = message[2], message[3]
+        with self._lock:
+            future = self._inflight[worker_id].pop(request_id, None)
+        if future is None:
+            return
+        if kind == "ok":
+            future.set_result(payload)
+        else:
+            counter("worker_pool.errors").inc()
+            future.set_exception(WorkerError(payload))
+
+    def _worker_died(self, worker_id: int) -> None:
+        """Feiler forespørslene til en død worker med en gang; den erstattes fra eiertråden."""
+
+        self._receive(worker_id)
+        process = self._workers[worker_id]
+        process.join(1.0)  # sentinelen kan bli klar litt før prosessen kan høstes
+        with self._lock:
+            lost = self._inflight[worker_id]
+            self._inflight[worker_id] = {}
+            self._dead.add(worker_id)
+        for future in lost.values():
+            future.set_exception(WorkerError(f"Worker {worker_id} died (exit code {process.exitcode})"))
+        if not self._closing:
+            counter("worker_pool.deaths").inc()
+            log("Worker died", worker=worker_id, exitcode=process.exitcode, lost_requests=len(lost))
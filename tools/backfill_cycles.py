@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+ØYNA AI SYSTEM – BACKFILL CYCLES
+
+Fyller syklushistorikken (.cache/cycles, se agent/analytics/cycle_store.py)
+fra InfluxDB: pumpeeffekt/-status og vannmålerens telleverk hentes, sykluser
+finnes med detect_cycles() og skrives til CycleStore. Sykluser med samme
+start_ts erstattes, så kommandoen kan kjøres flere ganger over samme tidsrom.
+
+Kilden er enten InfluxDB sitt HTTP-API (Flux, /api/v2/query) eller en
+CSV-eksport av samme data (`influx query --raw` eller eksport fra UI-et).
+Målingene er de edge-bufferen skriver (agent/edge/buffer.py):
+
+    pump_power  active_power_w, running
+    waterflow   total_liters
+
+Mot API-et hentes ett vindu (--chunk-days) av gangen, med --overlap-hours
+ekstra før hvert vindu så sykluser som krysser en vindusgrense kommer med.
+
+Bruk:
+    cd tools
+    python backfill_cycles.py --csv export.csv
+    python backfill_cycles.py --url http://influx:8086 --org oyna --token $INFLUX_TOKEN \\
+        --bucket haos-oyna-waterflow --start 2025-01-01 --stop 2026-01-01
+
+Exit-kode:
+    0  = backfill kjørt
+    1  = ingen pumpedata funnet
+"""
+
+import argparse
+import csv
+import datetime as _dt
+import io
+import os
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+AGENT_DIR = PROJECT_ROOT / "agent"
+
+# Agent-modulene bruker flate importer (kjøres fra agent/).
+if str(AGENT_DIR) not in sys.path:
+    sys.path.insert(0, str(AGENT_DIR))
+
+POWER_MEASUREMENT = "pump_power"
+FLOW_MEASUREMENT = "waterflow"
+FIELDS = {
+    (POWER_MEASUREMENT, "active_power_w"): "active_power",
+    (POWER_MEASUREMENT, "running"): "running",
+    (FLOW_MEASUREMENT, "total_liters"): "total_liters",
+}
+
+FLUX_QUERY = """from(bucket: "{bucket}")
+  |> range(start: {start}, stop: {stop})
+  |> filter(fn: (r) => {filters})
+  |> keep(columns: ["_time", "_measurement", "_field", "_value"])"""
+
+
+# -----------------------
+# Innlesing
+# -----------------------
+
+Series = Dict[str, Tuple[List[str], List[float]]]
+
+
+def read_annotated_csv(lines: Iterable[str]) -> Series:
+    """Influx CSV (annotert eller ikke) -> {signal: (tider, verdier)}.
+
+    Tabellene i svaret kan ha hver sin header; linjer som starter med # er
+    annotasjoner.
+    """
+
+    series: Series = {name: ([], []) for name in FIELDS.values()}
+    header: Optional[Dict[str, int]] = None
+    for row in csv.reader(lines):
+        if not any(row):
+            header = None  # tom linje skiller tabeller
+            continue
+        if row[0].startswith("#"):
+            continue
+        if "_time" in row and "_value" in row:
+            header = {name: i for i, name in enumerate(row)}
+            continue
+        if header is None:
+            continue
+        signal = FIELDS.get((row[header["_measurement"]], row[header["_field"]]))
+        if signal is None:
+            continue
+        times, values = series[signal]
+        times.append(row[header["_time"]])
+        value = row[header["_value"]]
+        values.append(1.0 if value == "true" else 0.0 if value == "false" else float(value))
+    return series
+
+
+def _to_epoch(times: List[str]):
+    import numpy as np
+
+    # Influx skriver RFC3339 i UTC ("...Z"), med opptil ns-oppløsning.
+    stamps = np.array([t.rstrip("Z") for t in times], dtype="datetime64[ns]")
+    return stamps.astype(np.int64) / 1e9
+
+
+def query_influx(url: str, org: str, token: str, bucket: str, start: str, stop: str) -> Series:
+    filters = " or ".join(
+        f'(r._measurement == "{measurement}" and r._field == "{field}")' for measurement, field in FIELDS
+    )
+    body = FLUX_QUERY.format(bucket=bucket, start=start, stop=stop, filters=filters).encode("utf-8")
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/api/v2/query?org={org}",
+        data=body,
+        headers={
+            "Authorization": f"Token {token}",
+            "Content-Type": "application/vnd.flux",
+            "Accept": "application/csv",
+        },
+    )
+    with urllib.request.urlopen(request) as response:
+        return read_annotated_csv(io.TextIOWrapper(response, encoding="utf-8"))
+
+
+# -----------------------
+# Sykluser
+# -----------------------
+
+def cycles_from_series(series: Series, power_threshold_w: float) -> Optional[Dict[str, object]]:
+    """Sykluser fra rå serier. Telleverket interpoleres til pumpesamplenes tider."""
+
+    import numpy as np
+    from analytics.cycles import detect_cycles
+
+    base = "running" if series["running"][0] else "active_power"
+    if not series[base][0]:
+        return None
+    ts = _to_epoch(series[base][0])
+    order = np.argsort(ts, kind="stable")
+    ts = ts[order]
+    values = np.asarray(series[base][1], dtype=np.float64)[order]
+
+    running = values > 0.5 if base == "running" else None
+    active_power = None
+    if series["active_power"][0]:
+        power_ts = _to_epoch(series["active_power"][0])
+        p_order = np.argsort(power_ts, kind="stable")
+        power = np.asarray(series["active_power"][1], dtype=np.float64)[p_order]
+        active_power = power if base == "active_power" else np.interp(ts, power_ts[p_order], power)
+    total_liters = None
+    if series["total_liters"][0]:
+        flow_ts = _to_epoch(series["total_liters"][0])
+        f_order = np.argsort(flow_ts, kind="stable")
+        total_liters = np.interp(ts, flow_ts[f_order], np.asarray(series["total_liters"][1], dtype=np.float64)[f_order])
+
+    cycles = detect_cycles(ts, running=running, active_power=active_power, total_liters=total_liters,
+                           power_threshold_w=power_threshold_w)
+    # Går pumpen ved første sample, er starten ukjent; den syklusen hører til forrige vindu.
+    on = running if running is not None else active_power >= power_threshold_w
+    if on.size and on[0] and cycles["start_ts"].size:
+        cycles = {name: column[1:] for name, column in cycles.items()}
+    return cycles
+
+
+def _windows(start: _dt.datetime, stop: _dt.datetime, days: int, overlap: _dt.timedelta):
+    current = start
+    while current < stop:
+        end = min(current + _dt.timedelta(days=days), stop)
+        yield max(start, current - overlap), end
+        current = end
+
+
+def _rfc3339(value: _dt.datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _parse_date(value: str) -> _dt.datetime:
+    return _dt.datetime.fromisoformat(value.rstrip("Z")).replace(tzinfo=None)
+
+
+# -----------------------
+# CLI entrypoint
+# -----------------------
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Backfill pump-cycle history from InfluxDB.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", type=Path, help="Influx CSV export with pump_power/waterflow fields.")
+    source.add_argument("--url", help="InfluxDB base URL (HTTP API v2).")
+    parser.add_argument("--org", default=os.getenv("INFLUX_ORG", ""))
+    parser.add_argument("--token", default=os.getenv("INFLUX_TOKEN", ""))
+    parser.add_argument("--bucket", default="haos-oyna-waterflow")
+    parser.add_argument("--start", help="UTC start (YYYY-MM-DD or ISO timestamp); required with --url.")
+    parser.add_argument("--stop", default=None, help="UTC stop (default: now).")
+    parser.add_argument("--chunk-days", type=int, default=7, help="Days fetched per query.")
+    parser.add_argument("--overlap-hours", type=float, default=6.0, help="Extra history before each window.")
+    parser.add_argument("--pump-id", default=None, help="Pump id in the cycle store (default: pump_p2).")
+    parser.add_argument("--root", type=Path, default=None, help="Cycle store root (default: .cache/cycles).")
+    parser.add_argument("--power-threshold-w", type=float, default=None)
+    args = parser.parse_args(argv)
+    if args.url and not args.start:
+        parser.error("--start is required with --url")
+    return args
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+
+    from analytics.cycle_store import DEFAULT_ROOT, CycleStore
+    from analytics.cycles import DEFAULT_POWER_THRESHOLD_W, DEFAULT_PUMP_ID
+
+    store = CycleStore(args.root or DEFAULT_ROOT, args.pump_id or DEFAULT_PUMP_ID)
+    threshold = args.power_threshold_w if args.power_threshold_w is not None else DEFAULT_POWER_THRESHOLD_W
+    started = time.perf_counter()
+    found = added = 0
+
+    if args.csv:
+        with args.csv.open("r", encoding="utf-8", newline="") as f:
+            batches = [read_annotated_csv(f)]
+    else:
+        stop = _parse_date(args.stop) if args.stop else _dt.datetime.now(_dt.timezone.utc).replace(tzinfo=None)
+        windows = _windows(_parse_date(args.start), stop, args.chunk_days, _dt.timedelta(hours=args.overlap_hours))
+        batches = (
+            query_influx(args.url, args.org, args.token, args.bucket, _rfc3339(a), _rfc3339(b))
+            for a, b in windows
+        )
+
+    for series in batches:
+        cycles = cycles_from_series(series, threshold)
+        if cycles is None:
+            continue
+        found += len(cycles["start_ts"])
+        added += store.append(cycles)
+
+    if not found:
+        print("[WARN] No pump cycles found in the source data")
+        return 1
+    print(f"[BUILT] cycles: {found} cycles ({added} new) for {store.pump_id} "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms -> {store.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+"""
+ØYNA AI SYSTEM – AGENT BENCHMARK
+
+Spiller av examples/queries_*.jsonl (som kontraktsforespørsler med intent og
+settings.audience) gjennom OynaAIAgent.ask_stream mot deterministiske lokale
+stand-ins for Home Assistant, InfluxDB, Node-RED og LLM-en (med konfigurerbar
+latens), og måler:
+
+  * latens per steg (routing, planning, retrieval, tool_io, rendering = promptbygging) – p50/p95/p99
+  * ende-til-ende-latens og throughput ved N samtidige sesjoner
+  * allokeringer per spørring (tracemalloc peak + netto blokker)
+  * match-score mot ideal_summary / ideal_insights / ideal_recommendations
+
+Steg som agenten ikke har ennå rapporteres med count = 0.
+
+Bruk:
+    cd tools
+    python benchmark_agent.py
+    python benchmark_agent.py --concurrency 1 4 16 --tool-latency-ms 5
+    python benchmark_agent.py --output ../.cache/bench/run.json --compare ../.cache/bench/prev.json
+
+Exit-kode:
+    0  = benchmark kjørt
+    1  = ingen spørringer funnet
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+AGENT_DIR = PROJECT_ROOT / "agent"
+DEFAULT_MANIFEST = PROJECT_ROOT / "models" / "v2" / "ai_master_manifest_v2.json"
+
+# Steg -> (attributt på agenten, metode); None betyr agenten selv. Instrumenteres bare hvis de finnes.
+STAGE_HOOKS: Dict[str, tuple] = {
+    "routing": ("reasoner", "route"),
+    "planning": ("reasoner", "plan"),
+    "retrieval": (None, "retrieve"),
+    "rendering": ("prompts", "build"),
+}
+STAGES = ("routing", "planning", "retrieval", "tool_io", "rendering", "total")
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+# -----------------------
+# Stand-ins for eksterne systemer
+# -----------------------
+
+# Svar som oppfyller verktøyschemaene i tools/tools_*.json (dispatcheren validerer output).
+STUB_OUTPUTS: Dict[tuple, Callable[[Dict[str, Any]], Any]] = {
+    ("home_assistant", "get_entity_state"): lambda args: {
+        "states": {e: {"state": "on", "attributes": {}} for e in ([args["entities"]] if isinstance(args["entities"], str) else args["entities"])}
+    },
+    ("influxdb", "query_latest"): lambda args: {"result": [{"bucket": args["bucket"], "value": 0.0}]},
+    ("nodered", "invoke_flow"): lambda args: {"status": "ok", "info": f"stub flow {args['flow']}"},
+}
+
+
+class StubTool:
+    """Deterministisk erstatning for et verktøy, med fast latens per kall."""
+
+    def __init__(self, name: str, latency_s: float = 0.0):
+        self.name = name
+        self.latency_s = latency_s
+
+    def execute(self, action, args):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        output = STUB_OUTPUTS.get((self.name, action))
+        if output is not None:
+            return output(args)
+        return {"tool": self.name, "action": action, "args": args, "status": "ok"}
+
+
+def make_stub_responder(agent):
+    """LLM-stand-in: henter kontekst via agent.retrieve og svarer som standard-responderen.
+
+    ask_stream bygger prompten for målgruppen bare når en responder er gitt,
+    så per-audience-prefiksene måles på samme måte som med en ekte LLM.
+    """
+
+    from streaming import summarize_results
+
+    def respond(query, audience, plan, results, prompt):
+        agent.retrieve(query)
+        return summarize_results(query, audience, plan, results, prompt)
+
+    return respond
+
+
+def build_stub_tools(latency_s: float) -> Dict[str, StubTool]:
+    return {
+        "home_assistant": StubTool("home_assistant", latency_s),
+        "nodered": StubTool("nodered", latency_s),
+        "influxdb": StubTool("influxdb", latency_s),
+    }
+
+
+# -----------------------
+# Hjelpefunksjoner
+# -----------------------
+
+def load_queries(examples_dir: Path) -> List[Dict[str, Any]]:
+    queries: List[Dict[str, Any]] = []
+    for path in sorted(examples_dir.glob("queries_*.jsonl")):
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    queries.append(json.loads(line))
+    return queries
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank persentil."""
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) * 1000.0,
+        "p95_ms": percentile(values, 95) * 1000.0,
+        "p99_ms": percentile(values, 99) * 1000.0,
+        "mean_ms": (sum(values) / len(values) * 1000.0) if values else 0.0,
+    }
+
+
+def token_f1(answer: str, reference: str) -> float:
+    """Token-F1 mellom svar og fasit (store/små bokstaver ignoreres)."""
+
+    a = _WORD.findall(answer.lower())
+    b = _WORD.findall(reference.lower())
+    if not a or not b:
+        return 0.0
+    common: Dict[str, int] = {}
+    counts_b: Dict[str, int] = {}
+    for token in b:
+        counts_b[token] = counts_b.get(token, 0) + 1
+    for token in a:
+        if counts_b.get(token, 0) > 0:
+            counts_b[token] -= 1
+            common[token] = common.get(token, 0) + 1
+    overlap = sum(common.values())
+    if overlap == 0:
+        return 0.0
+    precision = overlap / len(a)
+    recall = overlap / len(b)
+    return 2 * precision * recall / (precision + recall)
+
+
+def to_request(query: Dict[str, Any]) -> Dict[str, Any]:
+    """Eksempelspørring -> forespørsel etter contracts/api_contract.json."""
+
+    request = {"intent": query.get("intent", "user_query"), "user_query": query["user_query"], "context_modules": []}
+    if query.get("audience"):
+        request["settings"] = {"audience": query["audience"]}
+    return request
+
+
+def ask(agent, request: Dict[str, Any], responder) -> Any:
+    """Kjører forespørselen som en strøm og returnerer det ferdige svaret."""
+
+    answer = None
+    for evt in agent.ask_stream(request, responder=responder):
+        if evt["event"] == "response":
+            answer = evt["data"]
+    return answer
+
+
+def answer_text(answer: Any) -> str:
+    if isinstance(answer, str):
+        return answer
+    if isinstance(answer, dict) and "summary" in answer:
+        return " ".join(answer.get(key, "") for key in ("summary", "insights", "recommendations"))
+    return json.dumps(answer, ensure_ascii=False, default=str)
+
+
+# -----------------------
+# Instrumentering
+# -----------------------
+
+class StageRecorder:
+    """Samler varighet per steg. list.append er trådsikker under GIL."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+
+    def wrap(self, stage: str, func: Callable) -> Callable:
+        samples = self.samples[stage]
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - started)
+
+        return timed
+
+
+def instrument(agent, recorder: StageRecorder, latency_s: float) -> None:
+    for stage, (owner_name, method_name) in STAGE_HOOKS.items():
+        owner = agent if owner_name is None else getattr(agent, owner_name, None)
+        method = getattr(owner, method_name, None) if owner is not None else None
+        if callable(method):
+            setattr(owner, method_name, recorder.wrap(stage, method))
+
+    tools = build_stub_tools(latency_s)
+    for tool in tools.values():
+        tool.execute = recorder.wrap("tool_io", tool.execute)
+    agent.dispatcher.tools = tools
+
+
+def create_agent(manifest_path: Path):
+    if str(AGENT_DIR) not in sys.path:
+        sys.path.insert(0, str(AGENT_DIR))
+    from agent import OynaAIAgent
+
+    return OynaAIAgent(str(manifest_path))
+
+
+# -----------------------
+# Kjøring
+# -----------------------
+
+def run_queries(agent, queries: List[Dict[str, Any]], recorder: StageRecorder, responder) -> tuple:
+    """Én sekvensiell runde: latens og match-score, deretter allokeringer per spørring.
+
+    Allokeringer måles i en egen runde så tracemalloc ikke påvirker latenstallene.
+    Returnerer (resultater per spørring, stegtider fra den første runden).
+    """
+
+    requests = [to_request(query) for query in queries]
+    results = []
+    for query, request in zip(queries, requests):
+        started = time.perf_counter()
+        answer = ask(agent, request, responder)
+        elapsed = time.perf_counter() - started
+        recorder.samples["total"].append(elapsed)
+
+        reference = " ".join(
+            query.get(key, "") for key in ("ideal_summary", "ideal_insights", "ideal_recommendations")
+        )
+        results.append({
+            "intent": query.get("intent"),
+            "audience": query.get("audience"),
+            "latency_ms": elapsed * 1000.0,
+            "match_f1": token_f1(answer_text(answer), reference),
+        })
+
+    stage_samples = {stage: list(values) for stage, values in recorder.samples.items()}
+
+    tracemalloc.start()
+    try:
+        for request, row in zip(requests, results):
+            tracemalloc.reset_peak()
+            blocks_before = sys.getallocatedblocks()
+            ask(agent, request, responder)
+            blocks_after = sys.getallocatedblocks()
+            _, peak = tracemalloc.get_traced_memory()
+            row["alloc_peak_bytes"] = peak
+            row["alloc_net_blocks"] = blocks_after - blocks_before
+    finally:
+        tracemalloc.stop()
+    return results, stage_samples
+
+
+def run_concurrent(agent, queries: List[Dict[str, Any]], sessions: int, rounds: int, responder) -> Dict[str, Any]:
+    """Kjører `sessions` tråder som hver spiller av alle spørringene `rounds` ganger."""
+
+    requests = [to_request(query) for query in queries]
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def session() -> None:
+        local = []
+        for _ in range(rounds):
+            for request in requests:
+                started = time.perf_counter()
+                ask(agent, request, responder)
+                local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        for future in [pool.submit(session) for _ in range(sessions)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    return {
+        "sessions": sessions,
+        "requests": len(latencies),
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall if wall > 0 else 0.0,
+        "latency": summarize(latencies),
+    }
+
+
+def run_benchmark(
+    project_root: Path,
+    manifest_path: Path,
+    tool_latency_s: float,
+    concurrency: List[int],
+    rounds: int,
+    warmup: int,
+) -> Optional[Dict[str, Any]]:
+    queries = load_queries(project_root / "examples")
+    if not queries:
+        print("[WARN] No queries found in examples/queries_*.jsonl")
+        return None
+
+    agent = create_agent(manifest_path)
+    recorder = StageRecorder()
+    instrument(agent, recorder, tool_latency_s)
+    responder = make_stub_responder(agent)
+
+    for _ in range(warmup):
+        for query in queries:
+            ask(agent, to_request(query), responder)
+    for values in recorder.samples.values():
+        values.clear()
+
+    per_query, stage_samples = run_queries(agent, queries, recorder, responder)
+    stages = {stage: summarize(values) for stage, values in stage_samples.items()}
+    throughput = [run_concurrent(agent, queries, n, rounds, responder) for n in concurrency]
+
+    by_audience: Dict[str, List[float]] = {}
+    for row in per_query:
+        by_audience.setdefault(row["audience"] or "unknown", []).append(row["match_f1"])
+
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "manifest": str(manifest_path),
+            "tool_latency_ms": tool_latency_s * 1000.0,
+            "concurrency": concurrency,
+            "rounds": rounds,
+            "warmup": warmup,
+            "query_count": len(queries),
+        },
+        "stages": stages,
+        "throughput": throughput,
+        "allocations": {
+            "peak_bytes_max": max(row["alloc_peak_bytes"] for row in per_query),
+            "net_blocks_total": sum(row["alloc_net_blocks"] for row in per_query),
+        },
+        "answer_match": {
+            "mean_f1": sum(row["match_f1"] for row in per_query) / len(per_query),
+            "by_audience": {k: sum(v) / len(v) for k, v in by_audience.items()},
+        },
+        "queries": per_query,
+    }
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    print("========== COMPARE ==========")
+    for stage, stats in current["stages"].items():
+        before = previous.get("stages", {}).get(stage)
+        if not before or not stats["count"]:
+            continue
+        delta = stats["p95_ms"] - before["p95_ms"]
+        print(f"  {stage:<10} p95 {before['p95_ms']:8.3f} -> {stats['p95_ms']:8.3f} ms  ({delta:+.3f})")
+    prev_tp = {row["sessions"]: row for row in previous.get("throughput", [])}
+    for row in current["throughput"]:
+        before = prev_tp.get(row["sessions"])
+        if before:
+            print(
+                f"  {row['sessions']:>3} sessions  {before['throughput_rps']:10.1f} -> "
+                f"{row['throughput_rps']:10.1f} req/s"
+            )
+    print("=============================")
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print("========== STAGES ==========")
+    for stage, stats in report["stages"].items():
+        if not stats["count"]:
+            print(f"  {stage:<10} (not instrumented)")
+            continue
+        print(
+            f"  {stage:<10} n={stats['count']:<5} p50={stats['p50_ms']:.3f} "
+            f"p95={stats['p95_ms']:.3f} p99={stats['p99_ms']:.3f} ms"
+        )
+    print("======== THROUGHPUT ========")
+    for row in report["throughput"]:
+        print(
+            f"  {row['sessions']:>3} sessions: {row['throughput_rps']:.1f} req/s  "
+            f"p95={row['latency']['p95_ms']:.3f} ms"
+        )
+    print("========== ANSWERS =========")
+    print(f"  mean token-F1: {report['answer_match']['mean_f1']:.3f}")
+    for audience, score in report["answer_match"]["by_audience"].items():
+        print(f"    {audience:<12} {score:.3f}")
+    print("============================")
+
+
+# -----------------------
+# CLI entrypoint
+# -----------------------
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay example queries through the agent and measure latency.")
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST, help="Manifest passed to OynaAIAgent.")
+    parser.add_argument("--tool-latency-ms", type=float, default=2.0, help="Simulated latency per tool call.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrent sessions to test.")
+    parser.add_argument("--rounds", type=int, default=5, help="Replays of the query set per session.")
+    parser.add_argument("--warmup", type=int, default=1, help="Warm-up replays before measuring.")
+    parser.add_argument("--output", type=Path, default=None, help="Write JSON results to this file.")
+    parser.add_argument("--compare", type=Path, default=None, help="Previous JSON results to compare against.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+
+    report = run_benchmark(
+        PROJECT_ROOT,
+        args.manifest,
+        tool_latency_s=args.tool_latency_ms / 1000.0,
+        concurrency=args.concurrency,
+        rounds=args.rounds,
+        warmup=args.warmup,
+    )
+    if report is None:
+        return 1
+
+    print_report(report)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with args.output.open("w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[INFO] Results written to: {args.output}")
+
+    if args.compare:
+        with args.compare.open("r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+ØYNA AI SYSTEM – STARTUP BENCHMARK
+
+Måler kaldstart for agenten og CLI-verktøyene med `python -X importtime`
+i en ny prosess, og fordeler importtiden på egen kode, standardbibliotek
+og tredjepartspakker.
+
+Bruk:
+    cd tools
+    python benchmark_startup.py
+    python benchmark_startup.py --budget-ms 60 --top 15
+    python benchmark_startup.py --json
+
+Exit-kode:
+    0  = alle mål innenfor budsjett
+    1  = minst ett mål over budsjett (eller import feilet)
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+
+# Navn -> (arbeidskatalog, kode som kjøres). Speiler hvordan de startes i dag.
+TARGETS: Dict[str, tuple] = {
+    "agent": (PROJECT_ROOT / "agent", "import agent"),
+    "agent_init": (
+        PROJECT_ROOT / "agent",
+        "from agent import OynaAIAgent; OynaAIAgent('../models/v2/ai_master_manifest_v2.json')",
+    ),
+    "generate_knowledge": (SCRIPT_DIR, "import generate_knowledge"),
+    "validate_models": (SCRIPT_DIR, "import validate_models"),
+}
+
+
+def _own_modules(root: Path) -> set:
+    names = set()
+    for path in root.rglob("*.py"):
+        rel = path.relative_to(root)
+        parts = list(rel.with_suffix("").parts)
+        if parts[-1] == "__init__":
+            parts = parts[:-1]
+        if parts:
+            names.add(parts[0])
+    return names
+
+
+def _stdlib_modules() -> set:
+    names = set(getattr(sys, "stdlib_module_names", ()))
+    names.update(sys.builtin_module_names)
+    return names
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Parser `-X importtime`-linjer til [{module, self_us, cumulative_us, depth}]."""
+
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header-linjen
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append({
+            "module": name.strip(),
+            "self_us": int(parts[0]),
+            "cumulative_us": int(parts[1]),
+            "depth": depth,
+        })
+    return rows
+
+
+def classify(module: str, own: set, stdlib: set) -> str:
+    top = module.split(".", 1)[0]
+    if top in own:
+        return "own"
+    if top in stdlib or top.startswith("_"):
+        return "stdlib"
+    return "third_party"
+
+
+def measure(name: str, cwd: Path, code: str, own: set, stdlib: set, top: int) -> Dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=str(cwd),
+        capture_output=True,
+        text=True,
+    )
+    rows = parse_importtime(proc.stderr)
+
+    totals = {"own": 0, "stdlib": 0, "third_party": 0}
+    for row in rows:
+        totals[classify(row["module"], own, stdlib)] += row["self_us"]
+
+    heaviest = sorted(rows, key=lambda r: r["self_us"], reverse=True)[:top]
+    return {
+        "target": name,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "total_ms": sum(totals.values()) / 1000.0,
+        "own_ms": totals["own"] / 1000.0,
+        "stdlib_ms": totals["stdlib"] / 1000.0,
+        "third_party_ms": totals["third_party"] / 1000.0,
+        "heaviest": [
+            {"module": r["module"], "self_ms": r["self_us"] / 1000.0,
+             "kind": classify(r["module"], own, stdlib)}
+            for r in heaviest
+        ],
+    }
+
+
+def run_startup_benchmark(targets: List[str], top: int) -> List[Dict[str, Any]]:
+    own = _own_modules(PROJECT_ROOT / "agent") | _own_modules(SCRIPT_DIR)
+    stdlib = _stdlib_modules()
+    results = []
+    for name in targets:
+        cwd, code = TARGETS[name]
+        results.append(measure(name, cwd, code, own, stdlib, top))
+    return results
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the agent and tools.")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=list(TARGETS))
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if any target exceeds this import time.")
+    parser.add_argument("--top", type=int, default=10, help="Number of heaviest modules to list.")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    results = run_startup_benchmark(args.targets, args.top)
+
+    failed = False
+    for result in results:
+        over: Optional[bool] = None
+        if args.budget_ms is not None:
+            over = result["total_ms"] > args.budget_ms
+        result["over_budget"] = over
+        failed = failed or over or not result["ok"]
+
+    if args.json:
+        json.dump({"budget_ms": args.budget_ms, "results": results}, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 1 if failed else 0
+
+    for result in results:
+        status = "OK" if result["ok"] else "ERROR"
+        if result["over_budget"]:
+            status = "OVER BUDGET"
+        print(f"[{status}] {result['target']}: {result['total_ms']:.1f} ms "
+              f"(own {result['own_ms']:.1f}, stdlib {result['stdlib_ms']:.1f}, "
+              f"third-party {result['third_party_ms']:.1f})")
+        if result["error"]:
+            print(f"       {result['error']}")
+        for row in result["heaviest"]:
+            print(f"       {row['self_ms']:7.2f} ms  {row['kind']:<11} {row['module']}")
+        print("")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
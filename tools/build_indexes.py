@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+ØYNA AI SYSTEM – BUILD INDEXES
+
+Bygger oppslagsindekser som agenten laster ved oppstart, så de ikke må
+regnes ut per spørring:
+
+  * entity  – entitetsindeks på tvers av twin, master model, knowledge graph
+              og knowledge/*.json (.cache/entity_index.json)
+  * knowledge – knowledge/*.json flatet ut til SQLite med FTS5
+              (.cache/knowledge.sqlite)
+
+Bruk:
+    cd tools
+    python build_indexes.py
+    python build_indexes.py --check        # bare sjekk om indeksene er utdaterte
+    python build_indexes.py --force
+
+Exit-kode:
+    0  = indeksene er oppdatert
+    1  = --check og minst én indeks er utdatert (eller bygging feilet)
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+AGENT_DIR = PROJECT_ROOT / "agent"
+
+# Agent-modulene bruker flate importer (kjøres fra agent/).
+if str(AGENT_DIR) not in sys.path:
+    sys.path.insert(0, str(AGENT_DIR))
+
+DEFAULT_MANIFEST = PROJECT_ROOT / "models" / "v2" / "ai_master_manifest_v2.json"
+
+
+# -----------------------
+# Indekser
+# -----------------------
+
+def build_entity(manifest: dict, force: bool, check: bool) -> bool:
+    """Returnerer True hvis indeksen er (eller ble) oppdatert."""
+
+    from knowledge.entity_index import (
+        DEFAULT_INDEX_PATH,
+        INDEX_FORMAT,
+        build_entity_index,
+        is_stale,
+        save_index,
+    )
+
+    stale = True
+    if DEFAULT_INDEX_PATH.exists() and not force:
+        with DEFAULT_INDEX_PATH.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        stale = data.get("format") != INDEX_FORMAT or is_stale(data, manifest, PROJECT_ROOT)
+
+    if check:
+        print(f"[{'STALE' if stale else 'OK'}] entity: {DEFAULT_INDEX_PATH.relative_to(PROJECT_ROOT)}")
+        return not stale
+    if not stale:
+        print("[OK] entity: up to date")
+        return True
+
+    start = time.perf_counter()
+    data = build_entity_index(manifest, PROJECT_ROOT)
+    save_index(data, DEFAULT_INDEX_PATH)
+    print(f"[BUILT] entity: {len(data['entities'])} entities, {len(data['aliases'])} aliases "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return True
+
+
+def build_knowledge(manifest: dict, force: bool, check: bool) -> bool:
+    from knowledge.store import DEFAULT_DB_PATH, build_knowledge_db, is_stale
+
+    stale = force or is_stale(DEFAULT_DB_PATH)
+    if check:
+        print(f"[{'STALE' if stale else 'OK'}] knowledge: {DEFAULT_DB_PATH.relative_to(PROJECT_ROOT)}")
+        return not stale
+    if not stale:
+        print("[OK] knowledge: up to date")
+        return True
+
+    start = time.perf_counter()
+    stats = build_knowledge_db(db_path=DEFAULT_DB_PATH)
+    fts = "FTS5" if stats["fts5"] else "no FTS5, LIKE fallback"
+    print(f"[BUILT] knowledge: {stats['facts']} facts from {stats['modules']} modules ({fts}) "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return True
+
+
+BUILDERS = {
+    "entity": build_entity,
+    "knowledge": build_knowledge,
+}
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build lookup indexes used by the agent.")
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST)
+    parser.add_argument("--only", nargs="+", choices=sorted(BUILDERS), default=list(BUILDERS))
+    parser.add_argument("--force", action="store_true", help="Rebuild even if sources are unchanged.")
+    parser.add_argument("--check", action="store_true", help="Only report whether indexes are stale.")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    with args.manifest.open("r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    ok = True
+    for name in args.only:
+        ok = BUILDERS[name](manifest, args.force, args.check) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
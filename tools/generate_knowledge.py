@@ -2,22 +2,28 @@ import os
 import json
 import base64
 from pathlib import Path
-from pypdf import PdfReader
-import docx
-from openai import OpenAI
+
+# openai, pypdf og docx importeres først når de trengs (se get_client og
+# extract_text_*), så import av modulen er rask og uten sideeffekter.
 
 # ============================================================
 # CONFIG
 # ============================================================
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 RAW_DIR = Path("ai-input/raw")
 PROCESSED_DIR = Path("ai-input/processed")
 OUT_DIR = Path("knowledge")
 
-PROCESSED_DIR.mkdir(exist_ok=True)
-OUT_DIR.mkdir(exist_ok=True)
+_client = None
+
+
+def get_client():
+    """OpenAI-klienten konstrueres ved første kall, ikke ved import."""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
 
 
 # ============================================================
@@ -25,6 +31,8 @@ OUT_DIR.mkdir(exist_ok=True)
 # ============================================================
 
 def extract_text_pdf(path: Path):
+    from pypdf import PdfReader  # ImportError skal stoppe kjøringen, ikke bli dokumentinnhold
+
     text = ""
     try:
         reader = PdfReader(str(path))
@@ -38,6 +46,8 @@ def extract_text_pdf(path: Path):
 
 
 def extract_text_docx(path: Path):
+    import docx
+
     try:
         doc = docx.Document(str(path))
         return "\n".join([p.text for p in doc.paragraphs])
@@ -45,6 +55,15 @@ def extract_text_docx(path: Path):
         return f"[DOCX extraction error: {e}]"
 
 
+def require_extractors(paths):
+    """Feiler før noe flyttes hvis pypdf/python-docx mangler for inputene som trenger dem."""
+    suffixes = {p.suffix.lower() for p in paths}
+    if ".pdf" in suffixes:
+        import pypdf  # noqa: F401
+    if ".docx" in suffixes:
+        import docx  # noqa: F401
+
+
 def extract_text_generic(path: Path):
     try:
         return path.read_text(errors="ignore")
@@ -139,7 +158,7 @@ Rules:
             }
         ]
 
-    response = client.chat.completions.create(
+    response = get_client().chat.completions.create(
         model="gpt-4o-mini",
         messages=messages,
         temperature=0
@@ -174,6 +193,9 @@ def move_with_overwrite(src: Path, dst: Path):
 # ============================================================
 
 def main():
+    PROCESSED_DIR.mkdir(exist_ok=True)
+    OUT_DIR.mkdir(exist_ok=True)
+
     print("Scanning ai-input/raw ...\n")
 
     paths = [p for p in RAW_DIR.rglob("*") if p.is_file()]
@@ -182,6 +204,8 @@ def main():
         print("No files found.")
         return
 
+    require_extractors(paths)
+
     for file in paths:
         print(f"Processing: {file}")
 
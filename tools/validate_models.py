@@ -2,12 +2,18 @@
 """
 ØYNA AI SYSTEM – MODEL VALIDATOR
 
-Validerer alle v1-modeller i models/v1 mot riktige JSON Schemas i models/schemas.
+Validerer alle modellversjoner (models/v1, models/v2, ...) mot riktige
+JSON Schemas i models/schemas.
+
+Filer valideres parallelt i en prosess-pool, og resultatet caches på
+(model-hash, schema-hash) slik at uendrede filer hoppes over ved neste kjøring.
 
 Bruk:
     cd tools
     python validate_models.py
     python validate_models.py --pretty
+    python validate_models.py --json > validation.json
+    python validate_models.py --jobs 1 --no-cache
 
 Exit-kode:
     0  = alle modeller er gyldige
@@ -15,29 +21,44 @@ Exit-kode:
 """
 
 import argparse
+import contextlib
+import hashlib
 import json
+import os
+import re
 import sys
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+# jsonschema importeres først når noe faktisk må valideres, så en kjøring
+# der alt treffer cachen slipper importkostnaden.
+if TYPE_CHECKING:
+    from jsonschema import Draft202012Validator
+
+
+CACHE_FORMAT = 1
+DEFAULT_CACHE_FILE = Path(".cache") / "validate_models.json"
+
+# Forventede schema-filer
+SCHEMA_FILES: Dict[str, str] = {
+    "api_contract": "api_contract_schema.json",
+    "digital_twin": "digital_twin_schema.json",
+    "knowledge_graph": "knowledge_graph_schema.json",
+    "master_system_model": "master_system_model_schema.json",
+    "manifest": "manifest_schema.json",
+}
 
-from jsonschema import Draft202012Validator, exceptions as js_exceptions
+_VERSION_DIR = re.compile(r"^v(\d+)$")
 
 
 # -----------------------
 # Utility-funksjoner
 # -----------------------
 
-def load_json(path: Path) -> Optional[Dict[str, Any]]:
-    try:
-        with path.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    except js_exceptions.SchemaError as e:
-        print(f"[ERROR] Invalid JSON Schema in {path}: {e}")
-    except json.JSONDecodeError as e:
-        print(f"[ERROR] JSON parse error in {path}: {e}")
-    except OSError as e:
-        print(f"[ERROR] Could not read {path}: {e}")
-    return None
+def sha256_file(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
 
 
 def discover_files(base: Path, subdir: str) -> List[Path]:
@@ -48,6 +69,22 @@ def discover_files(base: Path, subdir: str) -> List[Path]:
     return sorted(root.glob("*.json"))
 
 
+def discover_version_dirs(models_dir: Path) -> List[str]:
+    """Finner alle versjonskataloger (v1, v2, ..., v10) sortert numerisk."""
+
+    if not models_dir.exists():
+        print(f"[WARN] Directory not found: {models_dir}")
+        return []
+
+    versions = []
+    for child in models_dir.iterdir():
+        match = _VERSION_DIR.match(child.name)
+        if child.is_dir() and match:
+            versions.append((int(match.group(1)), child.name))
+
+    return [name for _, name in sorted(versions)]
+
+
 def detect_model_type(model_path: Path) -> Optional[str]:
     """Bestemmer modelltype ut fra filnavn.
 
@@ -75,36 +112,54 @@ def detect_model_type(model_path: Path) -> Optional[str]:
     return None
 
 
-def build_schema_index(schemas_dir: Path) -> Dict[str, Draft202012Validator]:
-    # Forventede schema-filer
-    expected: Dict[str, str] = {
-        "api_contract": "api_contract_schema.json",
-        "digital_twin": "digital_twin_schema.json",
-        "knowledge_graph": "knowledge_graph_schema.json",
-        "master_system_model": "master_system_model_schema.json",
-        "manifest": "manifest_schema.json",
-    }
+def hash_schemas(schemas_dir: Path) -> Dict[str, Tuple[Path, str]]:
+    """Returnerer {model_type: (schema_path, sha256)} for alle schema-filer som finnes."""
 
-    index: Dict[str, Draft202012Validator] = {}
+    index: Dict[str, Tuple[Path, str]] = {}
 
-    for key, filename in expected.items():
+    for key, filename in SCHEMA_FILES.items():
         schema_path = schemas_dir / filename
         if not schema_path.exists():
             print(f"[WARN] Schema file missing for '{key}': {schema_path}")
             continue
+        index[key] = (schema_path, sha256_file(schema_path))
 
-        data = load_json(schema_path)
-        if data is None:
-            continue
+    return index
 
-        try:
-            validator = Draft202012Validator(data)
-            index[key] = validator
-            print(f"[INFO] Loaded schema for '{key}' from {schema_path}")
-        except js_exceptions.SchemaError as e:
-            print(f"[ERROR] Invalid JSON Schema in {schema_path}: {e}")
 
-    return index
+# -----------------------
+# Cache
+# -----------------------
+
+def load_cache(cache_path: Optional[Path]) -> Dict[str, Any]:
+    if cache_path is None or not cache_path.exists():
+        return {}
+    try:
+        with cache_path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        print(f"[WARN] Ignoring unreadable cache: {cache_path}")
+        return {}
+    if data.get("format") != CACHE_FORMAT:
+        return {}
+    return data.get("entries", {})
+
+
+def save_cache(cache_path: Optional[Path], entries: Dict[str, Any]) -> None:
+    if cache_path is None:
+        return
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump({"format": CACHE_FORMAT, "entries": entries}, f, separators=(",", ":"))
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        print(f"[WARN] Could not write cache {cache_path}: {e}")
+
+
+def cache_key(model_hash: str, schema_hash: str) -> str:
+    return f"{model_hash}:{schema_hash}"
 
 
 # -----------------------
@@ -115,7 +170,7 @@ def validate_model(
     model_path: Path,
     model_data: Dict[str, Any],
     model_type: str,
-    validators: Dict[str, Draft202012Validator],
+    validators: Dict[str, "Draft202012Validator"],
 ) -> List[str]:
     errors: List[str] = []
 
@@ -130,52 +185,191 @@ def validate_model(
     return errors
 
 
+@lru_cache(maxsize=None)
+def _compiled_validator(schema_path: str, schema_hash: str) -> "Draft202012Validator":
+    # Én validator per (schema, hash) per prosess – bygges kun første gang.
+    from jsonschema import Draft202012Validator
+
+    with open(schema_path, "r", encoding="utf-8") as f:
+        schema = json.load(f)
+    Draft202012Validator.check_schema(schema)
+    return Draft202012Validator(schema)
+
+
+def _validate_job(job: Tuple[str, str, str, str]) -> Dict[str, Any]:
+    """Validerer én fil. Kjøres i worker-prosess; må derfor være top-level."""
+
+    from jsonschema import exceptions as js_exceptions
+
+    model_path, model_type, schema_path, schema_hash = job
+    started = time.perf_counter()
+
+    try:
+        validator = _compiled_validator(schema_path, schema_hash)
+    except (OSError, json.JSONDecodeError, js_exceptions.SchemaError) as e:
+        return {
+            "status": "error",
+            "errors": [f"Invalid JSON Schema in {schema_path}: {e}"],
+            "elapsed_ms": (time.perf_counter() - started) * 1000.0,
+        }
+
+    try:
+        with open(model_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        errors = [f"JSON parse error: {e}"]
+        status = "error"
+    except OSError as e:
+        errors = [f"Could not read file: {e}"]
+        status = "error"
+    else:
+        errors = validate_model(Path(model_path), data, model_type, {model_type: validator})
+        status = "fail" if errors else "ok"
+
+    return {
+        "status": status,
+        "errors": errors,
+        "elapsed_ms": (time.perf_counter() - started) * 1000.0,
+    }
+
+
+def collect_results(
+    project_root: Path,
+    jobs: Optional[int] = None,
+    cache_path: Optional[Path] = None,
+) -> List[Dict[str, Any]]:
+    """Validerer alle modellversjoner og returnerer ett resultat per fil.
+
+    Hvert resultat har feltene file, version, model_type, status
+    (ok | fail | error | skipped), errors, elapsed_ms og cached.
+    """
+
+    models_dir = project_root / "models"
+    schemas_dir = models_dir / "schemas"
+
+    print(f"[INFO] Using models dir:  {models_dir}")
+    print(f"[INFO] Using schemas dir: {schemas_dir}")
+
+    versions = discover_version_dirs(models_dir)
+    schemas = hash_schemas(schemas_dir)
+    cache = load_cache(cache_path)
+
+    results: List[Dict[str, Any]] = []
+    live = set()
+    pending: List[Tuple[Dict[str, Any], Tuple[str, str, str, str], str]] = []
+
+    for version in versions:
+        for model_path in discover_files(models_dir, version):
+            rel = model_path.relative_to(project_root).as_posix()
+            model_type = detect_model_type(model_path)
+            result: Dict[str, Any] = {
+                "file": rel,
+                "version": version,
+                "model_type": model_type,
+                "status": "skipped",
+                "errors": [],
+                "elapsed_ms": 0.0,
+                "cached": False,
+            }
+            results.append(result)
+
+            if model_type is None:
+                continue
+
+            if model_type not in schemas:
+                result["status"] = "error"
+                result["errors"] = [f"No schema loaded for model_type='{model_type}'"]
+                continue
+
+            started = time.perf_counter()
+            schema_path, schema_hash = schemas[model_type]
+            try:
+                model_hash = sha256_file(model_path)
+            except OSError as e:
+                result["status"] = "error"
+                result["errors"] = [f"Could not read file: {e}"]
+                continue
+
+            key = cache_key(model_hash, schema_hash)
+            live.add(key)
+            hit = cache.get(key)
+            if hit is not None:
+                result["status"] = hit["status"]
+                result["errors"] = hit["errors"]
+                result["cached"] = True
+                result["elapsed_ms"] = (time.perf_counter() - started) * 1000.0
+                continue
+
+            job = (str(model_path), model_type, str(schema_path), schema_hash)
+            pending.append((result, job, key))
+
+    if pending:
+        job_args = [job for _, job, _ in pending]
+        workers = min(jobs or os.cpu_count() or 1, len(pending))
+        if workers <= 1:
+            outcomes = [_validate_job(job) for job in job_args]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                outcomes = list(pool.map(_validate_job, job_args))
+
+        for (result, _, key), outcome in zip(pending, outcomes):
+            result.update(outcome)
+            # Lese-/schemafeil caches ikke – de kan skyldes midlertidige forhold.
+            if outcome["status"] in ("ok", "fail"):
+                cache[key] = {"status": outcome["status"], "errors": outcome["errors"]}
+
+    # Behold bare nøkler som fortsatt er i bruk, så cachen ikke vokser ubegrenset.
+    save_cache(cache_path, {k: v for k, v in cache.items() if k in live})
+
+    return results
+
+
 def run_validation(
     project_root: Path,
     pretty: bool = False,
+    jobs: Optional[int] = None,
+    cache_path: Optional[Path] = None,
+    results: Optional[List[Dict[str, Any]]] = None,
 ) -> Tuple[int, int]:
-    """Returnerer (antall_ok, antall_feil)."""
+    """Returnerer (antall_ok, antall_feil).
 
-    models_dir = project_root / "models" / "v1"
-    schemas_dir = project_root / "models" / "schemas"
+    Hvis `results` er gitt, fylles listen med resultatene fra collect_results().
+    """
 
-    print(f"[INFO] Using models dir:  {models_dir}")
-    print(f"[INFO] Using schemas dir: {schemas_dir}")
+    started = time.perf_counter()
+    collected = collect_results(project_root, jobs=jobs, cache_path=cache_path)
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
 
-    model_files = discover_files(project_root / "models", "v1")
-    if not model_files:
-        print("[WARN] No model files found in models/v1")
-        return 0, 0
+    if results is not None:
+        results.extend(collected)
 
-    validators = build_schema_index(schemas_dir)
+    if not collected:
+        print("[WARN] No model files found in models/v*")
+        return 0, 0
 
     ok = 0
     failed = 0
 
-    print(f"[INFO] Found {len(model_files)} model file(s).\n")
+    print(f"[INFO] Found {len(collected)} model file(s).\n")
 
-    for model_path in model_files:
-        rel = model_path.relative_to(project_root)
-        model_type = detect_model_type(model_path)
+    for result in collected:
+        rel = result["file"]
+        model_type = result["model_type"]
+        timing = "cached" if result["cached"] else f"{result['elapsed_ms']:.1f} ms"
 
-        if model_type is None:
+        if result["status"] == "skipped":
             print(f"[WARN] Skipping {rel} – could not infer model type from filename.")
             continue
 
-        data = load_json(model_path)
-        if data is None:
-            failed += 1
-            continue
-
-        errors = validate_model(model_path, data, model_type, validators)
-
-        if not errors:
-            print(f"[OK]    {rel}  (type: {model_type})")
+        if result["status"] == "ok":
+            print(f"[OK]    {rel}  (type: {model_type}, {timing})")
             ok += 1
         else:
-            print(f"[FAIL]  {rel}  (type: {model_type})")
+            print(f"[FAIL]  {rel}  (type: {model_type}, {timing})")
             failed += 1
-            for msg in errors:
+            for msg in result["errors"]:
                 if pretty:
                     print(f"       • {msg}")
                 else:
@@ -186,6 +380,7 @@ def run_validation(
     print("========== SUMMARY ==========")
     print(f"  Valid models  : {ok}")
     print(f"  Invalid models: {failed}")
+    print(f"  Total time    : {elapsed_ms:.1f} ms")
     print("=============================")
 
     return ok, failed
@@ -197,13 +392,35 @@ def run_validation(
 
 def parse_args(argv: List[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
-        description="Validate v1 model JSON files against their schemas."
+        description="Validate all versioned model JSON files against their schemas."
     )
     parser.add_argument(
         "--pretty",
         action="store_true",
         help="Pretty-print validation errors with bullets.",
     )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Write machine-readable results to stdout (human log goes to stderr).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: CPU count, 1 = serial).",
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=None,
+        help=f"Result cache file (default: <project>/{DEFAULT_CACHE_FILE.as_posix()}).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Validate every file and do not read or write the cache.",
+    )
     return parser.parse_args(argv)
 
 
@@ -213,7 +430,30 @@ def main(argv: List[str]) -> int:
     script_dir = Path(__file__).resolve().parent
     project_root = script_dir.parent
 
-    ok, failed = run_validation(project_root, pretty=args.pretty)
+    cache_path = None
+    if not args.no_cache:
+        cache_path = args.cache or project_root / DEFAULT_CACHE_FILE
+
+    results: List[Dict[str, Any]] = []
+    log_stream = sys.stderr if args.json else sys.stdout
+
+    with contextlib.redirect_stdout(log_stream):
+        ok, failed = run_validation(
+            project_root,
+            pretty=args.pretty,
+            jobs=args.jobs,
+            cache_path=cache_path,
+            results=results,
+        )
+
+    if args.json:
+        json.dump(
+            {"valid": ok, "invalid": failed, "results": results},
+            sys.stdout,
+            ensure_ascii=False,
+            indent=2,
+        )
+        sys.stdout.write("\n")
 
     # Exit-code: 0 hvis alle er OK, 1 hvis noe feilet
     if failed > 0: